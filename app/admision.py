@@ -0,0 +1,197 @@
+"""
+Control de admisión para /predict y endpoints similares: límite de
+concurrencia global y por finca, cola de espera acotada con plazo y rechazo
+rápido con Retry-After
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.metrics import metrics, predict_stage_seconds
+
+admission_shed = metrics.counter(
+    "terrawa_admission_shed_total",
+    "Solicitudes rechazadas por el control de admisión, por motivo")
+
+
+class AdmisionRechazada(Exception):
+    """No hay capacidad y la solicitud no puede esperar más"""
+
+    def __init__(self, mensaje: str, reintentar_en: int):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class ControlAdmision:
+    """
+    Semáforo global y por finca con una cola FIFO acotada.
+
+    Una solicitud entra si hay cupo global y cupo en su finca; si no,
+    espera en la cola como mucho `espera_max` segundos. Con la cola llena
+    (`max_cola`) o al vencer el plazo se rechaza con AdmisionRechazada, que
+    indica en cuántos segundos conviene reintentar según la duración media
+    reciente de las solicitudes admitidas. Al liberarse un cupo se entrega
+    al primer solicitante de la cola cuya finca tenga cupo, de modo que una
+    finca saturada no bloquea a las demás.
+
+    Todo ocurre en el event loop: no requiere locks.
+    """
+
+    def __init__(self, max_concurrentes: int = 8, max_por_finca: int = 4,
+                 max_cola: int = 32, espera_max: float = 5.0,
+                 habilitado: bool = True):
+        self.max_concurrentes = max_concurrentes
+        self.max_por_finca = max_por_finca
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.habilitado = habilitado
+        self.en_curso = 0
+        self.por_finca: Dict[str, int] = {}
+        self._cola: Deque[Tuple[str, asyncio.Future]] = deque()
+        self.admitidas = 0
+        self.en_fondo = 0
+        self.rechazadas: Dict[str, int] = {"cola_llena": 0, "plazo": 0}
+        self._duracion_media = 0.05
+
+    def _hay_cupo(self, finca: str) -> bool:
+        return (self.en_curso < self.max_concurrentes and
+                self.por_finca.get(finca, 0) < self.max_por_finca)
+
+    def _ocupar(self, finca: str):
+        self.en_curso += 1
+        self.por_finca[finca] = self.por_finca.get(finca, 0) + 1
+
+    def _liberar(self, finca: str, duracion: Optional[float]):
+        self.en_curso -= 1
+        self.por_finca[finca] -= 1
+        if not self.por_finca[finca]:
+            del self.por_finca[finca]
+        if duracion is not None:
+            # Media móvil exponencial para estimar Retry-After
+            self._duracion_media += 0.1 * (duracion -
+                                           self._duracion_media)
+        self._despertar()
+
+    def _despertar(self):
+        """Entregar los cupos libres a quienes esperan (en orden)"""
+        for espera in list(self._cola):
+            if self.en_curso >= self.max_concurrentes:
+                return
+            finca, futuro = espera
+            if futuro.done():
+                self._cola.remove(espera)
+            elif self._hay_cupo(finca):
+                self._cola.remove(espera)
+                self._ocupar(finca)
+                futuro.set_result(None)
+
+    def reintentar_en(self) -> int:
+        """Segundos estimados hasta que se vacíe la cola actual"""
+        espera = (self._duracion_media * (len(self._cola) + 1) /
+                  max(1, self.max_concurrentes))
+        return max(1, min(60, math.ceil(espera)))
+
+    def _rechazar(self, finca: str, motivo: str, mensaje: str):
+        self.rechazadas[motivo] += 1
+        admission_shed.inc(finca=finca, reason=motivo)
+        raise AdmisionRechazada(mensaje, self.reintentar_en())
+
+    def comprobar(self, finca: str):
+        """Rechazar ya si la solicitud no podría ni esperar en la cola"""
+        if (self.habilitado and not self._hay_cupo(finca) and
+                len(self._cola) >= self.max_cola):
+            self._rechazar(finca, "cola_llena",
+                           "Servidor saturado, inténtalo más tarde")
+
+    async def _entrar(self, finca: str):
+        if self._hay_cupo(finca):
+            self._ocupar(finca)
+            return
+        self.comprobar(finca)
+        futuro = asyncio.get_running_loop().create_future()
+        espera = (finca, futuro)
+        self._cola.append(espera)
+        try:
+            with predict_stage_seconds.time(finca=finca,
+                                            stage="admission_wait"):
+                await asyncio.wait_for(futuro, self.espera_max)
+        except asyncio.TimeoutError:
+            if futuro.done() and not futuro.cancelled():
+                # El cupo llegó justo al vencer el plazo: ya está ocupado
+                return
+            self._rechazar(
+                finca, "plazo",
+                f"Sin capacidad tras esperar {self.espera_max:g} s, "
+                f"inténtalo más tarde")
+        except asyncio.CancelledError:
+            if futuro.done() and not futuro.cancelled():
+                # El cupo llegó justo al cancelar: devolverlo
+                self._liberar(finca, 0.0)
+            raise
+        finally:
+            if espera in self._cola:
+                self._cola.remove(espera)
+
+    @asynccontextmanager
+    async def admitir(self, finca: str):
+        """
+        Ocupar un cupo de la finca durante el bloque `async with`.
+
+        Raises:
+            AdmisionRechazada: Con la cola llena o al vencer espera_max
+        """
+        if not self.habilitado:
+            yield
+            return
+        await self._entrar(finca)
+        self.admitidas += 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._liberar(finca, time.perf_counter() - inicio)
+
+    @asynccontextmanager
+    async def admitir_en_fondo(self, finca: str, espera: float = 0.5):
+        """
+        Ocupar un cupo para trabajo en segundo plano (/predict/jobs).
+
+        Cede ante las solicitudes interactivas: no entra en la cola ni se
+        rechaza, sino que espera a que haya cupo libre y nadie en la cola,
+        consultando cada `espera` segundos. Mientras dura el bloque cuenta
+        como una solicitud en curso más.
+        """
+        if not self.habilitado:
+            yield
+            return
+        while self._cola or not self._hay_cupo(finca):
+            await asyncio.sleep(espera)
+        self._ocupar(finca)
+        self.en_fondo += 1
+        try:
+            yield
+        finally:
+            self.en_fondo -= 1
+            # Los bloques de trabajos no cuentan para Retry-After
+            self._liberar(finca, None)
+
+    def profundidad(self) -> int:
+        return len(self._cola)
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "habilitado": self.habilitado,
+            "max_concurrentes": self.max_concurrentes,
+            "max_por_finca": self.max_por_finca,
+            "max_cola": self.max_cola,
+            "espera_max": self.espera_max,
+            "en_curso": self.en_curso,
+            "en_curso_por_finca": dict(self.por_finca),
+            "en_curso_fondo": self.en_fondo,
+            "en_cola": len(self._cola),
+            "admitidas": self.admitidas,
+            "rechazadas": dict(self.rechazadas)
+        }
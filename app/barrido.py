@@ -0,0 +1,106 @@
+"""
+Malla de escenarios para /predict/sweep: generación por bloques de las
+combinaciones de AnimalesM, Hectareas y Piscinas y serialización de los
+resultados en NDJSON o CSV
+"""
+import csv
+import io
+import json
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from app.solver import CAMPOS_RESULTADO, fila_resultado
+
+EJES = ("AnimalesM", "Hectareas", "Piscinas")
+FORMATOS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+COLUMNAS_CSV = ([f"entrada_{eje}" for eje in EJES] + list(CAMPOS_RESULTADO) +
+                ["Iteraciones", "Convergio", "error"])
+
+
+def puntos_eje(inicio: float, fin: float, paso: float) -> int:
+    """Número de valores de un eje; ValueError si el rango no es válido"""
+    if fin < inicio:
+        raise ValueError("fin debe ser mayor o igual que inicio")
+    if fin == inicio:
+        return 1
+    if paso <= 0:
+        raise ValueError("paso debe ser positivo")
+    # Tolerancia para que 0.1 * 3 alcance 0.3
+    return int(np.floor((fin - inicio) / paso + 1e-9)) + 1
+
+
+class Malla:
+    """
+    Producto cartesiano de los tres ejes, recorrido por índice plano sin
+    materializar la malla completa (memoria constante por bloque).
+    """
+
+    def __init__(self, ejes: Sequence[Tuple[float, float, float]]):
+        self.ejes = [(float(inicio), float(paso),
+                      puntos_eje(inicio, fin, paso))
+                     for inicio, fin, paso in ejes]
+        self.forma = tuple(n for _, _, n in self.ejes)
+        self.total = int(np.prod(self.forma, dtype=np.int64))
+
+    def bloque(self, desde: int, hasta: int) -> List[np.ndarray]:
+        """Valores de cada eje para los puntos [desde, hasta)"""
+        indices = np.unravel_index(np.arange(desde, hasta), self.forma)
+        return [np.round(inicio + i * paso, 10)
+                for (inicio, paso, _), i in zip(self.ejes, indices)]
+
+    def bloques(self, tamano: int) -> Iterator[List[np.ndarray]]:
+        for desde in range(0, self.total, tamano):
+            yield self.bloque(desde, min(desde + tamano, self.total))
+
+
+def _filas(entradas: Sequence[np.ndarray], solucion: Dict[str, np.ndarray]
+           ) -> Iterator[Tuple[Dict, Dict, str]]:
+    for i in range(len(entradas[0])):
+        entrada = {"AnimalesM": float(entradas[0][i]),
+                   "Hectareas": float(entradas[1][i]),
+                   "Piscinas": int(entradas[2][i])}
+        try:
+            yield entrada, fila_resultado(solucion, i), None
+        except Exception as e:
+            yield entrada, None, str(e)
+
+
+def ndjson(entradas: Sequence[np.ndarray],
+           solucion: Dict[str, np.ndarray]) -> str:
+    """Una línea JSON por punto, con la forma de los elementos de
+    /predict/batch"""
+    return "".join(
+        json.dumps({**entrada, "resultado": resultado, "error": error}) +
+        "\n" for entrada, resultado, error in _filas(entradas, solucion))
+
+
+def csv_filas(entradas: Sequence[np.ndarray],
+              solucion: Dict[str, np.ndarray]) -> str:
+    """Filas CSV (sin encabezado) en el orden de COLUMNAS_CSV"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator="\n")
+    for entrada, resultado, error in _filas(entradas, solucion):
+        fila = [entrada[eje] for eje in EJES]
+        if resultado is None:
+            fila += [""] * (len(COLUMNAS_CSV) - len(EJES) - 1) + [error]
+        else:
+            fila += [resultado[c] for c in CAMPOS_RESULTADO]
+            fila += [resultado["Iteraciones"], resultado["Convergio"], ""]
+        escritor.writerow(fila)
+    return salida.getvalue()
+
+
+def encabezado_csv() -> str:
+    return ",".join(COLUMNAS_CSV) + "\n"
+
+
+def linea_error(formato: str, mensaje: str) -> str:
+    """Línea final cuando el barrido se interrumpe por un error"""
+    if formato == "csv":
+        salida = io.StringIO()
+        csv.writer(salida, lineterminator="\n").writerow(
+            [""] * (len(COLUMNAS_CSV) - 1) + [mensaje])
+        return salida.getvalue()
+    return json.dumps({"resultado": None, "error": mensaje}) + "\n"
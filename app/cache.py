@@ -0,0 +1,123 @@
+"""
+Caché LRU + TTL de resultados de /predict
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Memoria aproximada de una entrada además de su contenido serializado
+_BYTES_BASE_ENTRADA = 256
+
+
+def cuantizar(valor: float, cuanto: float) -> float:
+    """Redondear valor al múltiplo de cuanto más cercano (0 = exacto)"""
+    if not cuanto:
+        return float(valor)
+    return round(round(valor / cuanto) * cuanto, 10)
+
+
+class _Entrada:
+    __slots__ = ("valor", "version", "expira", "bytes")
+
+    def __init__(self, valor: Dict, version: Hashable, expira: float,
+                 bytes_: int):
+        self.valor = valor
+        self.version = version
+        self.expira = expira
+        self.bytes = bytes_
+
+
+class CachePredicciones:
+    """
+    Caché de resultados completos de /predict.
+
+    La clave se forma con la finca y las entradas cuantizadas; cada entrada
+    guarda además la versión (generaciones de modelo y scaler) con que se
+    calculó, de modo que un modelo nuevo invalida automáticamente lo
+    anterior. El tamaño está acotado por número de entradas y por bytes
+    aproximados; al superarse se descartan las menos usadas.
+    """
+
+    def __init__(self, max_entradas: int = 10000,
+                 max_bytes: int = 16 * 1024 * 1024, ttl: float = 600.0,
+                 cuanto_animales: float = 0.001,
+                 cuanto_hectareas: float = 0.001):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cuanto_animales = cuanto_animales
+        self.cuanto_hectareas = cuanto_hectareas
+        self._entradas: "OrderedDict[Tuple, _Entrada]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expiradas = 0
+
+    def clave(self, finca: str, animales_m: float, hectareas: float,
+              piscinas: int) -> Tuple:
+        return (finca,
+                cuantizar(animales_m, self.cuanto_animales),
+                cuantizar(hectareas, self.cuanto_hectareas),
+                int(piscinas))
+
+    def _quitar(self, clave: Tuple) -> _Entrada:
+        entrada = self._entradas.pop(clave)
+        self.bytes -= entrada.bytes
+        return entrada
+
+    def obtener(self, clave: Tuple, version: Hashable) -> Optional[Dict]:
+        """Resultado en caché para la clave, si sigue vigente"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            if entrada.version != version or entrada.expira < time.monotonic():
+                self._quitar(clave)
+                self.expiradas += 1
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            return dict(entrada.valor)
+
+    def guardar(self, clave: Tuple, version: Hashable, valor: Dict[str, Any]):
+        """Guardar un resultado y descartar entradas LRU si hace falta"""
+        bytes_ = len(json.dumps(valor)) + _BYTES_BASE_ENTRADA
+        if bytes_ > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = _Entrada(
+                dict(valor), version, time.monotonic() + self.ttl, bytes_)
+            self.bytes += bytes_
+            while (len(self._entradas) > self.max_entradas or
+                   self.bytes > self.max_bytes):
+                self._quitar(next(iter(self._entradas)))
+                self.evictions += 1
+
+    def invalidar(self, finca: Optional[str] = None):
+        """Vaciar la caché completa o solo las entradas de una finca"""
+        with self._lock:
+            for clave in list(self._entradas):
+                if finca is None or clave[0] == finca:
+                    self._quitar(clave)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.hits + self.misses
+        return {
+            "entries": len(self._entradas),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expiradas,
+            "hit_rate": round(self.hits / consultas * 100, 1)
+            if consultas else 0.0
+        }
@@ -0,0 +1,353 @@
+"""
+Predictores compilados: scaler + modelo de scikit-learn convertidos en
+operaciones NumPy puras para evitar la validación y el despacho de sklearn
+en cada llamada
+"""
+import logging
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tolerancia de la verificación contra sklearn al compilar
+RTOL = 1e-7
+ATOL = 1e-9
+
+# Por encima de estas filas los árboles compilados son más lentos que el
+# recorrido en Cython de sklearn, y se usa el modelo original
+FILAS_MAX_ARBOLES = 128
+
+
+class _Escalado:
+    """
+    Réplica exacta de `scaler.transform` como una lista de pasos
+    elementales, en el mismo orden en que los aplica sklearn.
+    """
+
+    def __init__(self, pasos: Sequence[Tuple[str, Any]]):
+        self.pasos = list(pasos)
+
+    def aplicar(self, X: np.ndarray) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        for operacion, valor in self.pasos:
+            if operacion == "restar":
+                X -= valor
+            elif operacion == "dividir":
+                X /= valor
+            elif operacion == "multiplicar":
+                X *= valor
+            elif operacion == "sumar":
+                X += valor
+            else:  # recortar
+                np.clip(X, valor[0], valor[1], out=X)
+        return X
+
+    def afin(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(a, b) tales que transform(X) = X * a + b, si el escalado es
+        afín"""
+        a, b = np.float64(1.0), np.float64(0.0)
+        for operacion, valor in self.pasos:
+            if operacion == "restar":
+                b = b - valor
+            elif operacion == "dividir":
+                a, b = a / valor, b / valor
+            elif operacion == "multiplicar":
+                a, b = a * valor, b * valor
+            elif operacion == "sumar":
+                b = b + valor
+            else:
+                return None
+        return a, b
+
+
+def _vectores(afin: Tuple, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    a, b = afin
+    return (np.broadcast_to(np.asarray(a, dtype=np.float64), (n,)),
+            np.broadcast_to(np.asarray(b, dtype=np.float64), (n,)))
+
+
+def _escalado(scaler) -> Optional[_Escalado]:
+    """Pasos del scaler, o None si su tipo no está soportado"""
+    if scaler is None or scaler == "passthrough":
+        return _Escalado([])
+    tipo = type(scaler).__name__
+    if tipo == "StandardScaler":
+        pasos = []
+        if scaler.with_mean:
+            pasos.append(("restar", scaler.mean_))
+        if scaler.with_std:
+            pasos.append(("dividir", scaler.scale_))
+        return _Escalado(pasos)
+    if tipo == "MinMaxScaler":
+        pasos = [("multiplicar", scaler.scale_), ("sumar", scaler.min_)]
+        if getattr(scaler, "clip", False):
+            pasos.append(("recortar", scaler.feature_range))
+        return _Escalado(pasos)
+    if tipo == "RobustScaler":
+        pasos = []
+        if scaler.with_centering:
+            pasos.append(("restar", scaler.center_))
+        if scaler.with_scaling:
+            pasos.append(("dividir", scaler.scale_))
+        return _Escalado(pasos)
+    if tipo == "MaxAbsScaler":
+        return _Escalado([("dividir", scaler.scale_)])
+    return None
+
+
+class PredictorLineal:
+    """Modelo lineal con el scaler incorporado: X @ W + c"""
+
+    tipo = "lineal"
+
+    def __init__(self, coef: np.ndarray, intercepto, escalado: _Escalado):
+        coef = np.asarray(coef, dtype=np.float64)
+        self.una_salida = coef.ndim == 1
+        W = coef.reshape(-1, 1) if self.una_salida else coef.T
+        c = np.broadcast_to(np.asarray(intercepto, dtype=np.float64),
+                            (W.shape[1],))
+        afin = escalado.afin()
+        self.escalado = None if afin is not None else escalado
+        if afin is not None:
+            a, b = _vectores(afin, W.shape[0])
+            W, c = a[:, None] * W, b @ W + c
+        self.W, self.c = np.ascontiguousarray(W), np.ascontiguousarray(c)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if self.escalado is not None:
+            X = self.escalado.aplicar(X)
+        y = X @ self.W + self.c
+        return y[:, 0] if self.una_salida else y
+
+
+_ACTIVACIONES = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "logistic": lambda x: np.divide(1.0, 1.0 + np.exp(-x), out=x),
+}
+
+
+class PredictorMLP:
+    """MLPRegressor con el scaler plegado en la primera capa"""
+
+    tipo = "mlp"
+
+    def __init__(self, modelo, escalado: _Escalado):
+        self.activacion = _ACTIVACIONES[modelo.activation]
+        self.salida = _ACTIVACIONES[modelo.out_activation_]
+        # Las capas siguientes se usan tal cual (sin copia: si el modelo
+        # está mapeado en memoria, siguen compartidas entre workers)
+        self.pesos: List[np.ndarray] = list(modelo.coefs_)
+        self.sesgos: List[np.ndarray] = list(modelo.intercepts_)
+        afin = escalado.afin()
+        self.escalado = None if afin is not None else escalado
+        if afin is not None:
+            W1 = self.pesos[0]
+            a, b = _vectores(afin, W1.shape[0])
+            self.sesgos[0] = b @ W1 + self.sesgos[0]
+            self.pesos[0] = a[:, None] * W1
+        self.una_salida = self.pesos[-1].shape[1] == 1
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if self.escalado is not None:
+            X = self.escalado.aplicar(X)
+        ultima = len(self.pesos) - 1
+        for i, (W, b) in enumerate(zip(self.pesos, self.sesgos)):
+            X = X @ W
+            X += b
+            X = self.activacion(X) if i < ultima else self.salida(X)
+        return X[:, 0] if self.una_salida else X
+
+
+class PredictorArboles:
+    """
+    Árboles de decisión (un árbol, bosque o gradient boosting) aplanados en
+    arreglos contiguos y recorridos para todas las filas y árboles a la vez.
+
+    El scaler no se pliega en los umbrales: sklearn compara en float32
+    después de escalar, y se reproduce exactamente ese orden. Los lotes de
+    más de FILAS_MAX_ARBOLES filas se delegan en `respaldo` (sklearn).
+    """
+
+    tipo = "arboles"
+
+    def __init__(self, arboles: Sequence, escalado: _Escalado,
+                 base: np.ndarray, factor: float, una_salida: bool,
+                 respaldo: Optional[Callable[[np.ndarray],
+                                             np.ndarray]] = None):
+        self.escalado = escalado
+        self.respaldo = respaldo
+        self.base = np.asarray(base, dtype=np.float64)
+        self.factor = factor
+        self.una_salida = una_salida
+        raices, desplazamiento = [], 0
+        feature, threshold, izquierda, derecha, valores = [], [], [], [], []
+        profundidad = 0
+        for arbol in arboles:
+            t = arbol.tree_
+            raices.append(desplazamiento)
+            hoja = t.children_left == -1
+            feature.append(np.where(hoja, 0, t.feature))
+            threshold.append(t.threshold)
+            # Las hojas apuntan a sí mismas para poder seguir iterando
+            propios = np.arange(t.node_count) + desplazamiento
+            izquierda.append(np.where(hoja, propios,
+                                      t.children_left + desplazamiento))
+            derecha.append(np.where(hoja, propios,
+                                    t.children_right + desplazamiento))
+            valores.append(t.value[:, :, 0])
+            desplazamiento += t.node_count
+            profundidad = max(profundidad, t.max_depth)
+        self.raices = np.array(raices, dtype=np.intp)
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.izquierda = np.concatenate(izquierda).astype(np.intp)
+        self.derecha = np.concatenate(derecha).astype(np.intp)
+        self.valores = np.ascontiguousarray(np.concatenate(valores))
+        self.profundidad = profundidad
+
+    def predict(self, X) -> np.ndarray:
+        if self.respaldo is not None and len(X) > FILAS_MAX_ARBOLES:
+            return self.respaldo(X)
+        X = self.escalado.aplicar(X).astype(np.float32)
+        n = len(X)
+        nodos = np.broadcast_to(self.raices, (n, len(self.raices))).copy()
+        filas = np.arange(n)[:, None]
+        for _ in range(self.profundidad):
+            va_izquierda = (X[filas, self.feature[nodos]] <=
+                            self.threshold[nodos])
+            nodos = np.where(va_izquierda, self.izquierda[nodos],
+                             self.derecha[nodos])
+        y = self.base + self.factor * self.valores[nodos].sum(axis=1)
+        return y[:, 0] if self.una_salida else y
+
+
+class PredictorMultiSalida:
+    """MultiOutputRegressor: un predictor compilado por salida"""
+
+    tipo = "multisalida"
+
+    def __init__(self, predictores: Sequence):
+        self.predictores = list(predictores)
+
+    def predict(self, X) -> np.ndarray:
+        return np.column_stack([p.predict(X) for p in self.predictores])
+
+
+def _compilar_modelo(modelo, escalado: _Escalado, scaler):
+    modelo = getattr(modelo, "best_estimator_", modelo)
+    tipo = type(modelo).__name__
+    modulo = type(modelo).__module__
+
+    def respaldo(X):
+        return modelo.predict(X if scaler is None else scaler.transform(X))
+
+    if tipo == "MultiOutputRegressor":
+        predictores = [_compilar_modelo(e, escalado, scaler)
+                       for e in modelo.estimators_]
+        if any(p is None for p in predictores):
+            return None
+        return PredictorMultiSalida(predictores)
+
+    if tipo == "MLPRegressor" and modelo.activation in _ACTIVACIONES:
+        return PredictorMLP(modelo, escalado)
+
+    if (modulo.startswith("sklearn.linear_model") and
+            hasattr(modelo, "coef_") and hasattr(modelo, "intercept_") and
+            not hasattr(modelo, "classes_")):
+        return PredictorLineal(modelo.coef_, modelo.intercept_, escalado)
+
+    if tipo == "DecisionTreeRegressor":
+        salidas = modelo.n_outputs_
+        return PredictorArboles([modelo], escalado, np.zeros(salidas), 1.0,
+                                salidas == 1, respaldo)
+
+    if tipo in ("RandomForestRegressor", "ExtraTreesRegressor"):
+        salidas = modelo.n_outputs_
+        return PredictorArboles(modelo.estimators_, escalado,
+                                np.zeros(salidas),
+                                1.0 / len(modelo.estimators_), salidas == 1,
+                                respaldo)
+
+    if tipo == "GradientBoostingRegressor":
+        if isinstance(modelo.init_, str) and modelo.init_ == "zero":
+            base = np.zeros(1)
+        elif type(modelo.init_).__name__ == "DummyRegressor":
+            base = np.ravel(modelo.init_.constant_)
+        else:
+            return None
+        return PredictorArboles(modelo.estimators_[:, 0], escalado, base,
+                                modelo.learning_rate, True, respaldo)
+
+    return None
+
+
+def _muestra(scaler, n_entradas: int, n: int) -> np.ndarray:
+    """Entradas aleatorias en el rango de los datos de entrenamiento"""
+    rng = np.random.default_rng(0)
+    if hasattr(scaler, "data_min_"):
+        bajo, alto = scaler.data_min_, scaler.data_max_
+    elif hasattr(scaler, "mean_") and getattr(scaler, "scale_", None) \
+            is not None:
+        bajo = scaler.mean_ - 3 * scaler.scale_
+        alto = scaler.mean_ + 3 * scaler.scale_
+    else:
+        bajo, alto = np.zeros(n_entradas), np.full(n_entradas, 50.0)
+    return rng.uniform(bajo, alto, (n, n_entradas))
+
+
+def verificar(predictor, modelo, scaler,
+              n: int = FILAS_MAX_ARBOLES) -> float:
+    """
+    Comparar el predictor compilado con sklearn sobre entradas aleatorias.
+
+    Returns:
+        float: Máxima diferencia absoluta encontrada
+
+    Raises:
+        ValueError: Si alguna salida difiere más que la tolerancia
+    """
+    n_entradas = getattr(modelo, "n_features_in_", None) or \
+        getattr(scaler, "n_features_in_", 3)
+    X = _muestra(scaler, n_entradas, n)
+    Xs = scaler.transform(X) if scaler is not None else X
+    esperado = np.asarray(modelo.predict(Xs), dtype=np.float64)
+    obtenido = predictor.predict(X)
+    if esperado.shape != obtenido.shape:
+        raise ValueError(f"Forma distinta: {obtenido.shape} frente a "
+                         f"{esperado.shape}")
+    if not np.allclose(obtenido, esperado, rtol=RTOL, atol=ATOL):
+        raise ValueError("Las salidas no coinciden con sklearn")
+    return float(np.max(np.abs(obtenido - esperado))) if esperado.size \
+        else 0.0
+
+
+def compilar(modelo, scaler) -> Optional[Any]:
+    """
+    Compilar scaler + modelo en un predictor NumPy que recibe las entradas
+    sin escalar.
+
+    Returns:
+        El predictor verificado contra sklearn, o None si el tipo de modelo
+        o scaler no está soportado o la verificación falla (se sigue
+        usando sklearn)
+    """
+    try:
+        escalado = _escalado(scaler)
+        if escalado is None:
+            return None
+        predictor = _compilar_modelo(modelo, escalado, scaler)
+        if predictor is None:
+            return None
+        diferencia = verificar(predictor, modelo, scaler)
+        logger.info(f"⚡ Predictor {predictor.tipo} compilado "
+                    f"(diferencia máxima {diferencia:.2e})")
+        return predictor
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo compilar el modelo "
+                       f"{type(modelo).__name__}: {e}")
+        return None
@@ -0,0 +1,439 @@
+"""
+Cola de envío de correos con conexiones SMTP reutilizadas
+"""
+import base64
+import logging
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from app.ejecutores import ColaLlenaError
+from app.metrics import invoice_stage_seconds, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def es_transitorio(error: Exception) -> bool:
+    """Decidir si un error de SMTP merece un reintento"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx: rechazo temporal (límite de tasa, buzón ocupado...)
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # Errores de red: conexión rechazada, timeout, DNS
+    return isinstance(error, OSError)
+
+
+# Bloque de lectura del PDF: múltiplo de 57 bytes = líneas base64 de 76
+_BLOQUE_PDF = 57 * 1024
+
+
+class ArchivoDemasiadoGrande(ValueError):
+    """El adjunto supera el tamaño máximo permitido"""
+
+
+def escribir_mensaje_pdf(destino: str, remitente: str, destinatario: str,
+                         asunto: str, html: str, pdf: BinaryIO,
+                         max_bytes: int,
+                         nombre_pdf: str = "guia.pdf") -> int:
+    """
+    Escribir en `destino` un correo MIME completo (CRLF) con el HTML y el
+    PDF adjunto, leyendo y codificando el PDF por bloques para no tenerlo
+    entero en memoria.
+
+    Returns:
+        int: Tamaño del PDF en bytes
+
+    Raises:
+        ArchivoDemasiadoGrande: Si el PDF supera max_bytes
+    """
+    marcador = f"__PDF_{uuid.uuid4().hex}__"
+    msg = MIMEMultipart()
+    msg["From"] = remitente
+    msg["To"] = destinatario
+    msg["Subject"] = asunto
+    msg.attach(MIMEText(html, "html"))
+
+    part = MIMEBase("application", "octet-stream", Name=nombre_pdf)
+    part["Content-Transfer-Encoding"] = "base64"
+    part["Content-Disposition"] = f'attachment; filename="{nombre_pdf}"'
+    part.set_payload(marcador)
+    msg.attach(part)
+
+    # La estructura la genera email; solo el cuerpo del PDF se escribe aparte
+    texto = msg.as_string().replace("\r\n", "\n").replace("\n", "\r\n")
+    antes, despues = (p.encode("utf-8") for p in texto.split(marcador, 1))
+    if despues.startswith(b"\r\n"):
+        despues = despues[2:]
+
+    total = 0
+    with open(destino, "wb") as f:
+        f.write(antes)
+        while True:
+            bloque = pdf.read(_BLOQUE_PDF)
+            if not bloque:
+                break
+            total += len(bloque)
+            if total > max_bytes:
+                raise ArchivoDemasiadoGrande(
+                    f"El PDF supera el máximo de {max_bytes} bytes")
+            f.write(base64.encodebytes(bloque).replace(b"\n", b"\r\n"))
+        f.write(despues)
+    return total
+
+
+def enviar_archivo(server: smtplib.SMTP, remitente: str, destinatario: str,
+                   ruta: str, bloque: int = 64 * 1024):
+    """
+    Enviar un mensaje ya escrito en disco (líneas CRLF) transmitiéndolo por
+    bloques dentro del comando DATA, sin cargarlo entero en memoria.
+    """
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(remitente)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, resp, remitente)
+    code, resp = server.rcpt(destinatario)
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({destinatario: (code, resp)})
+    server.putcmd("data")
+    code, resp = server.getreply()
+    if code != 354:
+        raise smtplib.SMTPDataError(code, resp)
+
+    pendiente = bytearray()
+    with open(ruta, "rb") as f:
+        for linea in f:
+            # Dot-stuffing (RFC 5321, 4.5.2)
+            if linea.startswith(b"."):
+                pendiente += b"."
+            pendiente += linea
+            if len(pendiente) >= bloque:
+                server.send(bytes(pendiente))
+                pendiente.clear()
+    if pendiente and not pendiente.endswith(b"\r\n"):
+        pendiente += b"\r\n"
+    pendiente += b".\r\n"
+    server.send(bytes(pendiente))
+    code, resp = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+class _Trabajo:
+    __slots__ = ("id", "remitente", "destinatario", "mensaje", "archivo",
+                 "estado", "intentos", "error", "creado", "actualizado")
+
+    def __init__(self, remitente: str, destinatario: str,
+                 mensaje: Optional[str] = None,
+                 archivo: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.remitente = remitente
+        self.destinatario = destinatario
+        self.mensaje = mensaje
+        self.archivo = archivo
+        self.estado = "en_cola"
+        self.intentos = 0
+        self.error: Optional[str] = None
+        self.creado = time.time()
+        self.actualizado = self.creado
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "recipient": self.destinatario,
+            "status": self.estado,
+            "attempts": self.intentos,
+            "error": self.error,
+            "created": self.creado,
+            "updated": self.actualizado
+        }
+
+
+class ColaCorreos:
+    """
+    Cola acotada de correos atendida por un pequeño pool de trabajadores.
+
+    Cada trabajador mantiene su propia conexión SMTP autenticada y la
+    reutiliza entre envíos (se cierra tras `inactividad` segundos sin uso).
+    Los errores transitorios se reintentan con espera exponencial; el resto
+    marca el trabajo como fallido.
+
+    El estado de los trabajos vive en la memoria del proceso: solo lo
+    conoce la instancia que aceptó el correo.
+    """
+
+    def __init__(self, host: str, port: int, starttls: bool = True,
+                 conexiones: int = 2, max_cola: int = 100,
+                 max_intentos: int = 5, espera_base: float = 2.0,
+                 inactividad: float = 60.0, timeout: float = 30.0,
+                 max_trabajos_guardados: int = 1000):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.conexiones = conexiones
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.inactividad = inactividad
+        self.timeout = timeout
+        self.max_trabajos_guardados = max_trabajos_guardados
+        self._cola: "queue.Queue[Optional[_Trabajo]]" = queue.Queue(max_cola)
+        self._trabajos: "OrderedDict[str, _Trabajo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._detener = threading.Event()
+        self._cerrando = False
+        self._temporizadores: Dict[str, threading.Timer] = {}
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilos:
+                return
+            self._detener.clear()
+            for i in range(self.conexiones):
+                hilo = threading.Thread(target=self._trabajador,
+                                        name=f"smtp-{i}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def detener(self, espera: float = 0.0):
+        """
+        Dejar de aceptar correos, seguir enviando los pendientes durante
+        `espera` segundos como mucho y cerrar los trabajadores.
+
+        Los reintentos programados se adelantan. Los correos que no se
+        enviaron en el plazo se marcan como fallidos y quedan en el log.
+        """
+        with self._lock:
+            self._cerrando = True
+            temporizadores, self._temporizadores = self._temporizadores, {}
+        for temporizador in temporizadores.values():
+            temporizador.cancel()
+            self._volver_a_cola(*temporizador.args)
+
+        limite = time.monotonic() + espera
+        while self._sin_terminar() and time.monotonic() < limite:
+            time.sleep(0.05)
+
+        self._detener.set()
+        with self._lock:
+            hilos, self._hilos = self._hilos, []
+        while True:
+            try:
+                self._cola.get_nowait()
+            except queue.Empty:
+                break
+        for _ in hilos:
+            try:
+                self._cola.put_nowait(None)
+            except queue.Full:
+                pass
+        for hilo in hilos:
+            hilo.join(timeout=max(0.0, limite - time.monotonic()) + 1.0)
+
+        for trabajo in self._sin_terminar():
+            if trabajo.estado == "enviando":
+                # El trabajador sigue esperando al servidor SMTP
+                logger.error(f"❌ Correo {trabajo.id} a "
+                             f"{trabajo.destinatario} interrumpido durante "
+                             f"el envío al detener el servidor")
+                continue
+            self._fallar(trabajo, "El servidor se detuvo antes de enviarlo")
+
+    def _sin_terminar(self) -> List[_Trabajo]:
+        with self._lock:
+            return [t for t in self._trabajos.values()
+                    if t.estado not in ("enviado", "fallido")]
+
+    def _fallar(self, trabajo: _Trabajo, error: str):
+        logger.error(f"❌ Correo {trabajo.id} a {trabajo.destinatario} "
+                     f"fallido: {error}")
+        trabajo.estado = "fallido"
+        trabajo.error = error
+        trabajo.actualizado = time.time()
+        self._liberar(trabajo)
+
+    def encolar(self, remitente: str, destinatario: str,
+                mensaje: Optional[str] = None,
+                archivo: Optional[str] = None) -> str:
+        """
+        Aceptar un correo para su envío; devuelve el id del trabajo.
+
+        El mensaje puede darse como texto o como ruta a un archivo ya
+        escrito (que se elimina al terminar el trabajo).
+        """
+        if self._cerrando:
+            raise ColaLlenaError(
+                "El servidor se está deteniendo, inténtalo más tarde")
+        self._iniciar()
+        trabajo = _Trabajo(remitente, destinatario, mensaje, archivo)
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+        try:
+            self._cola.put_nowait(trabajo)
+        except queue.Full:
+            with self._lock:
+                del self._trabajos[trabajo.id]
+            raise ColaLlenaError(
+                "La cola de correos está llena, inténtalo más tarde")
+        with self._lock:
+            self._podar()
+        return trabajo.id
+
+    def _podar(self):
+        """Olvidar los trabajos terminados más antiguos"""
+        while len(self._trabajos) > self.max_trabajos_guardados:
+            for job_id, trabajo in self._trabajos.items():
+                if trabajo.estado in ("enviado", "fallido"):
+                    del self._trabajos[job_id]
+                    break
+            else:
+                return
+
+    def estado(self, job_id: str) -> Optional[Dict[str, Any]]:
+        trabajo = self._trabajos.get(job_id)
+        return trabajo.resumen() if trabajo else None
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def _conectar(self) -> smtplib.SMTP:
+        inicio = time.perf_counter()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            server.login(os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASS"))
+        except Exception:
+            server.close()
+            raise
+        invoice_stage_seconds.observe(time.perf_counter() - inicio,
+                                      stage="smtp_connect")
+        return server
+
+    @staticmethod
+    def _liberar(trabajo: _Trabajo):
+        """Soltar el contenido de un trabajo terminado"""
+        trabajo.mensaje = None
+        if trabajo.archivo:
+            try:
+                os.remove(trabajo.archivo)
+            except OSError:
+                pass
+            trabajo.archivo = None
+
+    @staticmethod
+    def _cerrar(server: Optional[smtplib.SMTP]):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _reprogramar(self, trabajo: _Trabajo):
+        trabajo.estado = "reintentando"
+        espera = self.espera_base * 2 ** (trabajo.intentos - 1)
+        espera *= random.uniform(0.8, 1.2)
+        temporizador = threading.Timer(espera, self._reencolar,
+                                       args=(trabajo,))
+        temporizador.daemon = True
+        with self._lock:
+            if not self._cerrando:
+                self._temporizadores[trabajo.id] = temporizador
+                temporizador.start()
+                return
+        # Sin tiempo para esperar: reintentar ya mientras dure el cierre
+        self._volver_a_cola(trabajo)
+
+    def _reencolar(self, trabajo: _Trabajo):
+        with self._lock:
+            # detener() ya lo adelantó
+            if self._temporizadores.pop(trabajo.id, None) is None:
+                return
+        self._volver_a_cola(trabajo)
+
+    def _volver_a_cola(self, trabajo: _Trabajo):
+        try:
+            # Nunca bloquear: el temporizador no debe quedar esperando hueco
+            self._cola.put_nowait(trabajo)
+        except queue.Full:
+            self._fallar(trabajo, f"Cola llena al reintentar: "
+                                  f"{trabajo.error}")
+
+    def _trabajador(self):
+        server: Optional[smtplib.SMTP] = None
+        ultimo_uso = 0.0
+        while not self._detener.is_set():
+            try:
+                trabajo = self._cola.get(timeout=self.inactividad)
+            except queue.Empty:
+                # Sin trabajo: liberar la conexión ociosa
+                self._cerrar(server)
+                server = None
+                continue
+            if trabajo is None:
+                break
+
+            trabajo.estado = "enviando"
+            trabajo.intentos += 1
+            trabajo.actualizado = time.time()
+            try:
+                if server is not None and \
+                        time.monotonic() - ultimo_uso > self.inactividad:
+                    self._cerrar(server)
+                    server = None
+                if server is None:
+                    server = self._conectar()
+                with invoice_stage_seconds.time(stage="send"):
+                    if trabajo.archivo:
+                        enviar_archivo(server, trabajo.remitente,
+                                       trabajo.destinatario, trabajo.archivo)
+                    else:
+                        server.sendmail(trabajo.remitente,
+                                        trabajo.destinatario, trabajo.mensaje)
+                ultimo_uso = time.monotonic()
+                trabajo.estado = "enviado"
+                trabajo.error = None
+                self._liberar(trabajo)
+            except Exception as e:
+                # La conexión puede haber quedado en un estado inválido
+                self._cerrar(server)
+                server = None
+                trabajo.error = str(e)
+                if es_transitorio(e) and trabajo.intentos < self.max_intentos:
+                    logger.warning(f"⚠️ Reintentando correo {trabajo.id} "
+                                   f"(intento {trabajo.intentos}): {e}")
+                    self._reprogramar(trabajo)
+                else:
+                    self._fallar(trabajo, str(e))
+            finally:
+                trabajo.actualizado = time.time()
+        self._cerrar(server)
+
+
+# Cola global de envío de facturas
+cola_correos = ColaCorreos(
+    host=os.getenv("SMTP_HOST", "smtp.gmail.com"),
+    port=int(os.getenv("SMTP_PORT", "587")),
+    starttls=os.getenv("SMTP_STARTTLS", "true").lower() != "false",
+    conexiones=int(os.getenv("SMTP_CONEXIONES", "2")),
+    max_cola=int(os.getenv("SMTP_COLA", "100")),
+    max_intentos=int(os.getenv("SMTP_MAX_INTENTOS", "5")),
+    espera_base=float(os.getenv("SMTP_ESPERA_BASE", "2"))
+)
+
+metrics.gauge(
+    "terrawa_invoice_queue_depth",
+    "Correos en cola pendientes de envío",
+    lambda: {(): cola_correos.pendientes()})
@@ -0,0 +1,107 @@
+"""
+Pools acotados para sacar del event loop la inferencia y la E/S bloqueante
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Sin pool de procesos: el registro de modelos, su versión (claves de la
+# caché de predicciones) y la telemetría del solver viven en el proceso
+# principal, y un fork con hilos de carga activos puede heredar sus locks
+TIPOS = ("thread", "inline")
+
+
+class ColaLlenaError(Exception):
+    """El pool ya tiene su cola completa y no admite más trabajos"""
+
+
+class BoundedExecutor:
+    """
+    Pool de hilos con un número máximo de trabajos pendientes.
+
+    `max_workers` fija el paralelismo por contenedor y `max_cola` cuántos
+    trabajos pueden esperar detrás; al superarse se lanza ColaLlenaError
+    en lugar de acumular trabajo sin límite. El tipo "inline" ejecuta en
+    el propio event loop (comportamiento anterior, útil para comparar).
+    """
+
+    def __init__(self, nombre: str, tipo: str = "thread",
+                 max_workers: int = 2, max_cola: int = 64):
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de pool desconocido: {tipo}")
+        self.nombre = nombre
+        self.tipo = tipo
+        self.max_workers = max_workers
+        self.max_cola = max_cola
+        self._cupos = threading.BoundedSemaphore(max_workers + max_cola)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.rechazados = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix=self.nombre)
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecutar fn(*args, **kwargs) en el pool y esperar su resultado"""
+        if self.tipo == "inline":
+            return fn(*args, **kwargs)
+
+        if not self._cupos.acquire(blocking=False):
+            self.rechazados += 1
+            raise ColaLlenaError(
+                f"Pool {self.nombre} saturado "
+                f"({self.max_workers} en ejecución, {self.max_cola} en cola)")
+        # Como asyncio.to_thread: el hilo ve los contextvars de quien llama
+        # (p. ej. las etapas de Server-Timing)
+        args = (fn,) + args
+        fn = contextvars.copy_context().run
+        self.en_curso += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(fn, *args, **kwargs))
+        finally:
+            self.en_curso -= 1
+            self._cupos.release()
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "tipo": self.tipo,
+            "max_workers": self.max_workers,
+            "max_cola": self.max_cola,
+            "en_curso": self.en_curso,
+            "rechazados": self.rechazados
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Inferencia (CPU): hilos, o inline según INFERENCIA_EJECUTOR
+ejecutor_inferencia = BoundedExecutor(
+    "inferencia",
+    tipo=os.getenv("INFERENCIA_EJECUTOR", "thread"),
+    max_workers=int(os.getenv("INFERENCIA_WORKERS", os.cpu_count() or 1)),
+    max_cola=int(os.getenv("INFERENCIA_COLA", "64"))
+)
+
+# E/S bloqueante (GCS, SMTP): siempre hilos
+ejecutor_io = BoundedExecutor(
+    "io",
+    tipo="inline" if os.getenv("IO_EJECUTOR") == "inline" else "thread",
+    max_workers=int(os.getenv("IO_WORKERS", "8")),
+    max_cola=int(os.getenv("IO_COLA", "64"))
+)
@@ -0,0 +1,242 @@
+"""
+Métricas en memoria (histogramas, contadores y gauges) en formato Prometheus
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Límites por defecto de los histogramas de latencia (segundos)
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+# Etapas medidas durante la solicitud en curso (cabecera Server-Timing)
+_etapas: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "etapas", default=None)
+
+
+@contextmanager
+def registrar_etapas() -> Iterator[Dict[str, float]]:
+    """
+    Acumular en un dict los segundos de cada `stage` medido con
+    Histogram.time dentro del bloque, incluido el trabajo enviado a
+    ejecutores de hilos (que copian el contexto).
+    """
+    etapas: Dict[str, float] = {}
+    token = _etapas.set(etapas)
+    try:
+        yield etapas
+    finally:
+        _etapas.reset(token)
+
+
+def server_timing(etapas: Dict[str, float]) -> str:
+    """Valor de la cabecera Server-Timing (duraciones en milisegundos)"""
+    return ", ".join(f"{etapa};dur={segundos * 1000:.1f}"
+                     for etapa, segundos in etapas.items())
+
+
+def _etiquetas(labels: Dict[str, str]) -> Etiquetas:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _formatear_etiquetas(etiquetas: Iterable[Tuple[str, str]]) -> str:
+    partes = []
+    for k, v in etiquetas:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatear_valor(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histogram:
+    """Histograma acumulativo con una serie por combinación de etiquetas"""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str,
+                 buckets: Iterable[float] = BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Etiquetas, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valor: float, **labels):
+        clave = _etiquetas(labels)
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [conteos por bucket (+Inf al final), suma, total]
+                serie = self._series[clave] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def observe_many(self, valores, **labels):
+        """Registrar de una vez muchos valores con las mismas etiquetas"""
+        valores = np.asarray(valores, dtype=float).ravel()
+        if not valores.size:
+            return
+        conteos = np.bincount(
+            np.searchsorted(self.buckets, valores, side="left"),
+            minlength=len(self.buckets) + 1)
+        clave = _etiquetas(labels)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, conteo in enumerate(conteos.tolist()):
+                serie[0][i] += conteo
+            serie[1] += float(valores.sum())
+            serie[2] += int(valores.size)
+
+    @contextmanager
+    def time(self, **labels):
+        """Medir la duración de un bloque `with`"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.observe(duracion, **labels)
+            etapas = _etapas.get()
+            if etapas is not None and "stage" in labels:
+                etapa = labels["stage"]
+                etapas[etapa] = etapas.get(etapa, 0.0) + duracion
+
+    def render(self) -> List[str]:
+        lineas = []
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2])
+                      for k, v in self._series.items()]
+        for clave, conteos, suma, total in sorted(series):
+            acumulado = 0
+            limites = self.buckets + (float("inf"),)
+            for limite, conteo in zip(limites, conteos):
+                acumulado += conteo
+                etiquetas = clave + (("le", _formatear_valor(limite)),)
+                lineas.append(f"{self.nombre}_bucket"
+                              f"{_formatear_etiquetas(etiquetas)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} "
+                          f"{suma!r}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} "
+                          f"{total}")
+        return lineas
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._series: Dict[Etiquetas, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad: float = 1, **labels):
+        clave = _etiquetas(labels)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + cantidad
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nombre}{_formatear_etiquetas(k)} {_formatear_valor(v)}"
+                for k, v in series]
+
+
+class Gauge:
+    """Valor instantáneo calculado al exportar las métricas"""
+
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str,
+                 funcion: Callable[[], Dict[Etiquetas, float]]):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+
+    def render(self) -> List[str]:
+        return [f"{self.nombre}{_formatear_etiquetas(k)} {_formatear_valor(v)}"
+                for k, v in sorted(self.funcion().items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            existente = self._metricas.get(metrica.nombre)
+            if existente is not None:
+                return existente
+            self._metricas[metrica.nombre] = metrica
+            return metrica
+
+    def histogram(self, nombre: str, ayuda: str,
+                  buckets: Iterable[float] = BUCKETS_SEGUNDOS) -> Histogram:
+        return self._registrar(Histogram(nombre, ayuda, buckets))
+
+    def counter(self, nombre: str, ayuda: str) -> Counter:
+        return self._registrar(Counter(nombre, ayuda))
+
+    def gauge(self, nombre: str, ayuda: str,
+              funcion: Callable[[], Dict[Etiquetas, float]]) -> Gauge:
+        return self._registrar(Gauge(nombre, ayuda, funcion))
+
+    def render(self) -> str:
+        """Exportar todas las métricas en formato de texto de Prometheus"""
+        lineas = []
+        with self._lock:
+            metricas = list(self._metricas.values())
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.render())
+        return "\n".join(lineas) + "\n"
+
+
+# Registro global de métricas de la aplicación
+metrics = MetricsRegistry()
+
+predict_stage_seconds = metrics.histogram(
+    "terrawa_predict_stage_seconds",
+    "Duración de cada etapa de /predict por finca")
+predict_solver_iterations = metrics.histogram(
+    "terrawa_predict_solver_iterations",
+    "Iteraciones (llamadas al modelo) del solucionador por fila",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 75, 100))
+predict_solver_residual = metrics.histogram(
+    "terrawa_predict_solver_residual",
+    "Residuo final |AnimalesM - objetivo| del solucionador por fila",
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100))
+predict_solver_nonconverged = metrics.counter(
+    "terrawa_predict_solver_nonconverged_total",
+    "Filas que no convergieron dentro de max_iteraciones")
+invoice_stage_seconds = metrics.histogram(
+    "terrawa_invoice_stage_seconds",
+    "Duración de cada etapa de /send-invoice")
+model_registry_events = metrics.counter(
+    "terrawa_model_registry_events_total",
+    "Cargas, aciertos y desalojos del registro de modelos por finca")
+gcs_operation_seconds = metrics.histogram(
+    "terrawa_gcs_operation_seconds",
+    "Duración de las operaciones de app/storage.py contra GCS")
@@ -0,0 +1,747 @@
+"""
+Catálogo de fincas y registro en memoria de sus modelos y scalers
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, \
+    Optional, Tuple
+
+import numpy as np
+
+from app.compilado import compilar
+from app.metrics import model_registry_events, predict_stage_seconds
+
+if TYPE_CHECKING:  # google.cloud.storage y joblib se importan al usarse
+    from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+
+def separar_ruta_gcs(ruta: str) -> Tuple[str, str]:
+    """Separar una ruta gs://bucket/blob en (bucket, blob)"""
+    bucket_name, blob_name = ruta.replace("gs://", "").split("/", 1)
+    return bucket_name, blob_name
+
+
+def cargar_artefacto(ruta: str, mmap: bool = True) -> Any:
+    """
+    Cargar un modelo o scaler serializado con joblib.
+
+    Con `mmap`, los arreglos NumPy de los artefactos guardados sin compresión
+    (ver herramientas/convertir_modelos_mmap.py) quedan mapeados en memoria
+    de solo lectura, así que los workers que abren el mismo archivo
+    comparten sus páginas. Los pickles comprimidos o antiguos se cargan
+    igual que antes.
+    """
+    import joblib
+
+    if not mmap:
+        return joblib.load(ruta)
+    with warnings.catch_warnings():
+        # joblib avisa cuando el archivo comprimido no se puede mapear
+        warnings.simplefilter("ignore", UserWarning)
+        return joblib.load(ruta, mmap_mode="r")
+
+
+def estimar_bytes(*objetos) -> int:
+    """
+    Estimar la memoria que ocupan uno o más objetos: tamaño de los arreglos
+    NumPy (también los mapeados, que ocupan caché de páginas al usarse)
+    más el tamaño superficial de los objetos Python que los contienen.
+
+    Los objetos sin `__dict__` (p. ej. los árboles de sklearn) se recorren
+    a través de `__getstate__`, que es lo que se serializa con joblib.
+    """
+    total = 0
+    # id -> objeto: conservar la referencia evita que un temporario de
+    # __getstate__ liberado deje su id a otro objeto
+    vistos: Dict[int, Any] = {}
+    pendientes = list(objetos)
+    while pendientes:
+        objeto = pendientes.pop()
+        if id(objeto) in vistos or isinstance(
+                objeto, (type, types.ModuleType, types.FunctionType,
+                         types.BuiltinFunctionType, types.MethodType)):
+            continue
+        vistos[id(objeto)] = objeto
+        if isinstance(objeto, np.ndarray):
+            if isinstance(objeto.base, np.ndarray):
+                pendientes.append(objeto.base)  # Vista: cuenta su base
+            else:
+                total += objeto.nbytes
+            continue
+        total += sys.getsizeof(objeto)
+        if isinstance(objeto, (str, bytes, bytearray, int, float, bool)):
+            continue
+        if isinstance(objeto, dict):
+            pendientes.extend(objeto.keys())
+            pendientes.extend(objeto.values())
+        elif isinstance(objeto, (list, tuple, set, frozenset)):
+            pendientes.extend(objeto)
+        else:
+            try:
+                estado = objeto.__getstate__()
+            except Exception:
+                continue
+            if isinstance(estado, tuple):  # (__dict__, __slots__)
+                estado = {k: v for parte in estado if isinstance(parte, dict)
+                          for k, v in parte.items()}
+            if isinstance(estado, dict):
+                pendientes.extend(estado.values())
+            elif getattr(objeto, "__slots__", None):
+                pendientes.extend(getattr(objeto, nombre, None)
+                                  for nombre in objeto.__slots__)
+    return total
+
+
+# Entradas (AnimalesM, Hectareas, Piscinas) de la predicción de prueba
+MUESTRA_HUMO = np.array([[10.0, 5.0, 3.0], [100.0, 20.0, 8.0]])
+
+
+class ModeloRechazado(Exception):
+    """La versión nueva de un modelo no pasó la predicción de prueba"""
+
+
+def prueba_humo(modelo, scaler):
+    """
+    Predicción de prueba antes de activar un modelo: debe devolver al menos
+    consumo y gramos, con valores finitos.
+
+    Raises:
+        ModeloRechazado: Si la predicción falla o no tiene esa forma
+    """
+    try:
+        entrada = MUESTRA_HUMO if scaler is None \
+            else scaler.transform(MUESTRA_HUMO)
+        prediccion = np.asarray(modelo.predict(entrada), dtype=float)
+        prediccion = prediccion.reshape(len(MUESTRA_HUMO), -1)
+    except Exception as e:
+        raise ModeloRechazado(f"La predicción de prueba falló: {e}")
+    if prediccion.shape[1] < 2:
+        raise ModeloRechazado("El modelo debe predecir consumo y gramos")
+    if not np.all(np.isfinite(prediccion)):
+        raise ModeloRechazado("La predicción de prueba no es finita")
+
+
+def rutas_entorno(entorno: Optional[Mapping[str, str]] = None
+                  ) -> Dict[str, Dict[str, str]]:
+    """Fincas definidas con MODELO_PATH_<FINCA> y SCALER_PATH_<FINCA>"""
+    entorno = os.environ if entorno is None else entorno
+    rutas = {}
+    for clave, modelo in entorno.items():
+        if not clave.startswith("MODELO_PATH_"):
+            continue
+        finca = clave[len("MODELO_PATH_"):]
+        scaler = entorno.get(f"SCALER_PATH_{finca}")
+        if finca and modelo and scaler:
+            rutas[finca] = {"modelo": modelo, "scaler": scaler}
+    return dict(sorted(rutas.items()))
+
+
+class CatalogoFincas:
+    """
+    Rutas del modelo y el scaler de cada finca.
+
+    Con `manifiesto` (gs://bucket/fincas.json) las fincas se leen de ese
+    objeto, que se revisa como mucho cada `refrescar_cada` segundos y solo
+    se descarga de nuevo cuando cambia su generación. Sin manifiesto, o si
+    no se puede leer y no hay una copia anterior, se usan las variables de
+    entorno MODELO_PATH_<FINCA> / SCALER_PATH_<FINCA>.
+
+    Formato del manifiesto (`generaciones`, opcional, fija la finca a esas
+    generaciones de modelo y scaler en todas las instancias):
+        {"fincas": {"GROVITAL": {"modelo": "gs://...",
+                                 "scaler": "gs://...",
+                                 "generaciones": [1712..., 1712...]}}}
+    """
+
+    def __init__(self, manifiesto: Optional[str] = None,
+                 refrescar_cada: float = 300.0,
+                 entorno: Optional[Mapping[str, str]] = None):
+        self.manifiesto = manifiesto or None
+        self.refrescar_cada = refrescar_cada
+        self.cliente: Optional[Callable[[], "storage.Client"]] = None
+        self._entorno = entorno
+        self._rutas: Optional[Dict[str, Dict[str, str]]] = None
+        self._generacion: Optional[int] = None
+        self._revisado_en = 0.0
+        self._refrescando = False
+        self._lock = threading.Lock()
+        self.origen: Optional[str] = None
+
+    def _leer_manifiesto(self) -> Optional[Dict[str, Dict[str, str]]]:
+        """Descargar el manifiesto si cambió; None si sigue igual"""
+        from google.api_core.exceptions import NotModified
+
+        bucket_name, blob_name = separar_ruta_gcs(self.manifiesto)
+        blob = self.cliente().bucket(bucket_name).blob(blob_name)
+        try:
+            if self._generacion is not None:
+                contenido = blob.download_as_bytes(
+                    if_generation_not_match=self._generacion)
+            else:
+                contenido = blob.download_as_bytes()
+        except NotModified:
+            return None
+        datos = json.loads(contenido)
+        fincas = datos.get("fincas", datos) if isinstance(datos, dict) \
+            else None
+        if not isinstance(fincas, dict):
+            raise ValueError("El manifiesto no contiene un objeto 'fincas'")
+        rutas = {}
+        for finca, entrada in fincas.items():
+            if (isinstance(entrada, dict) and entrada.get("modelo") and
+                    entrada.get("scaler")):
+                rutas[finca] = {"modelo": entrada["modelo"],
+                                "scaler": entrada["scaler"]}
+                if entrada.get("generaciones"):
+                    rutas[finca]["generaciones"] = tuple(
+                        int(g) for g in entrada["generaciones"])
+            else:
+                logger.warning(f"⚠️ Finca {finca} del manifiesto sin "
+                               f"modelo/scaler; se ignora")
+        self._generacion = blob.generation
+        return rutas
+
+    def _refrescar(self):
+        self._revisado_en = time.monotonic()
+        if self.manifiesto is not None:
+            try:
+                rutas = self._leer_manifiesto()
+                if rutas is not None:
+                    if rutas != self._rutas:
+                        logger.info(f"📋 Manifiesto de fincas cargado: "
+                                    f"{len(rutas)} fincas")
+                    self._rutas, self.origen = rutas, "manifiesto"
+                if self._rutas is not None:
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer el manifiesto "
+                               f"{self.manifiesto}: {e}")
+                if self._rutas is not None:
+                    return
+        self._rutas, self.origen = rutas_entorno(self._entorno), "entorno"
+
+    def _refrescar_en_fondo(self):
+        try:
+            with self._lock:
+                self._refrescar()
+        finally:
+            self._refrescando = False
+
+    @property
+    def cargado(self) -> bool:
+        """True si ya hay rutas y `rutas()` no va a esperar a GCS"""
+        return self._rutas is not None
+
+    def rutas(self) -> Dict[str, Dict[str, str]]:
+        """
+        Rutas por finca. Solo la primera llamada espera al manifiesto; las
+        revisiones posteriores se hacen en un hilo y mientras tanto se
+        sirve la lista anterior.
+        """
+        if self._rutas is None:
+            with self._lock:
+                if self._rutas is None:
+                    self._refrescar()
+        elif (self.manifiesto is not None and not self._refrescando and
+              time.monotonic() - self._revisado_en >= self.refrescar_cada):
+            self._refrescando = True
+            threading.Thread(target=self._refrescar_en_fondo,
+                             name="catalogo-fincas", daemon=True).start()
+        return self._rutas
+
+
+# Contadores del registro -> etiqueta `event` de las métricas
+_EVENTOS = {"cargas": "load", "aciertos": "hit", "desalojos": "eviction",
+            "cambios": "swap", "rechazos": "rejected"}
+
+
+class _EntradaModelo:
+    """Par (modelo, scaler) cargado junto con las generaciones de origen"""
+
+    __slots__ = ("modelo", "scaler", "generaciones", "verificado_en",
+                 "bytes")
+
+    def __init__(self, modelo, scaler, generaciones: Tuple[int, int]):
+        self.modelo = modelo
+        self.scaler = scaler
+        self.generaciones = generaciones
+        self.verificado_en = time.monotonic()
+        self.bytes = estimar_bytes(modelo, scaler)
+
+
+class ModelRegistry:
+    """
+    Mantiene en memoria el par (best_model, scaler) de cada finca.
+
+    Los blobs solo se vuelven a descargar cuando cambia su generación en
+    GCS, y esa comprobación se hace como mucho cada `revalidar_cada`
+    segundos, en un hilo aparte: mientras tanto se sigue sirviendo la
+    versión en memoria. Una versión nueva se descarga, se valida con
+    `prueba` (una predicción de prueba) y solo entonces reemplaza a la
+    anterior de forma atómica; las solicitudes en curso terminan con la
+    referencia que ya tenían. Las primeras solicitudes concurrentes de una
+    finca sin modelo en memoria comparten una sola carga (single-flight).
+
+    Una finca puede fijarse a unas generaciones concretas (`fijar`, o
+    `generaciones` en el manifiesto) para volver a una versión anterior;
+    requiere el versionado de objetos del bucket.
+
+    Los archivos locales llevan la generación en el nombre y se escriben de
+    forma atómica: varios workers del mismo contenedor reutilizan la misma
+    descarga y, con `mmap`, comparten las páginas de los arreglos.
+
+    Las fincas salen del `catalogo` y sus modelos se cargan bajo demanda.
+    Con `memoria_max_bytes` > 0, al superarse ese presupuesto (según
+    estimar_bytes) se desalojan los modelos usados hace más tiempo (LRU),
+    junto con sus copias locales; el recién cargado nunca se desaloja.
+    """
+
+    def __init__(self, catalogo: CatalogoFincas,
+                 revalidar_cada: float = 300.0,
+                 directorio_local: str = "/tmp", mmap: bool = True,
+                 compilar: bool = True, memoria_max_bytes: int = 0,
+                 prueba: Callable[[Any, Any], None] = prueba_humo,
+                 max_historial: int = 5):
+        self.catalogo = catalogo
+        self.revalidar_cada = revalidar_cada
+        self.directorio_local = directorio_local
+        self.mmap = mmap
+        self.compilar = compilar
+        self.memoria_max_bytes = memoria_max_bytes
+        self._entradas: "OrderedDict[str, _EntradaModelo]" = OrderedDict()
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+        self._client: Optional["storage.Client"] = None
+        self.prueba = prueba
+        self.max_historial = max_historial
+        self.contadores: Dict[str, Dict[str, int]] = {}
+        self.fijadas: Dict[str, Tuple[int, int]] = {}
+        self.historial: Dict[str, List[Dict[str, Any]]] = {}
+        self.errores: Dict[str, Optional[str]] = {}
+        self._revisando = set()
+        self.precarga: Dict[str, Dict[str, Any]] = {}
+        self.precarga_completa = False
+        self.precarga_fallidas: List[str] = []
+        if self.catalogo.cliente is None:
+            self.catalogo.cliente = self._get_client
+
+    @property
+    def rutas(self) -> Dict[str, Dict[str, str]]:
+        return self.catalogo.rutas()
+
+    def fincas(self) -> List[str]:
+        return list(self.rutas)
+
+    def existe(self, finca: str) -> bool:
+        return finca in self.rutas
+
+    def _get_client(self) -> "storage.Client":
+        """Cliente de GCS compartido, creado en el primer uso"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import storage
+                    self._client = storage.Client()
+        return self._client
+
+    def _lock_finca(self, finca: str) -> threading.RLock:
+        # Reentrante: fijar/liberar lo mantienen durante `actualizar`
+        with self._lock:
+            if finca not in self._locks:
+                self._locks[finca] = threading.RLock()
+            return self._locks[finca]
+
+    def _generacion(self, ruta: str) -> int:
+        """Consultar la generación actual de un blob (solo metadatos)"""
+        bucket_name, blob_name = separar_ruta_gcs(ruta)
+        blob = self._get_client().bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"No existe el archivo {ruta}")
+        return blob.generation
+
+    def _generaciones_actuales(self, finca: str) -> Tuple[int, int]:
+        return (self._generacion(self.rutas[finca]['modelo']),
+                self._generacion(self.rutas[finca]['scaler']))
+
+    def _generaciones_objetivo(self, finca: str) -> Tuple[int, int]:
+        """Generaciones que debe servir la finca: las fijadas en esta
+        instancia, las fijadas en el manifiesto o las últimas de GCS"""
+        with self._lock:
+            fijada = self.fijadas.get(finca)
+        if fijada is not None:
+            return fijada
+        fijadas = self.rutas[finca].get("generaciones")
+        if fijadas:
+            return fijadas
+        return self._generaciones_actuales(finca)
+
+    def _descargar(self, ruta: str, generacion: int, destino: str):
+        """Descargar una generación concreta de un blob a disco"""
+        if os.path.exists(destino):
+            return  # Otro worker ya descargó esta generación
+        bucket_name, blob_name = separar_ruta_gcs(ruta)
+        bucket = self._get_client().bucket(bucket_name)
+        blob = bucket.blob(blob_name, generation=generacion)
+        # Archivo temporal + rename: nunca se pisa un archivo ya mapeado
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            blob.download_to_filename(temporal)
+            os.replace(temporal, destino)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _ruta_local(self, finca: str, tipo: str, generacion: int) -> str:
+        return f"{self.directorio_local}/{finca}_{tipo}_{generacion}.pkl"
+
+    def _limpiar_generaciones(self, finca: str, vigentes: Tuple[str, str]):
+        """Borrar copias locales de generaciones anteriores de la finca"""
+        for tipo in ("modelo", "scaler"):
+            patron = f"{self.directorio_local}/{finca}_{tipo}_*.pkl"
+            for ruta in glob.glob(patron):
+                if ruta not in vigentes:
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        pass
+
+    def _cargar(self, finca: str,
+                generaciones: Tuple[int, int]) -> _EntradaModelo:
+        rutas = self.rutas[finca]
+        modelo_local = self._ruta_local(finca, "modelo", generaciones[0])
+        scaler_local = self._ruta_local(finca, "scaler", generaciones[1])
+
+        for intento in range(2):
+            with predict_stage_seconds.time(finca=finca,
+                                            stage="model_download"):
+                self._descargar(rutas['modelo'], generaciones[0],
+                                modelo_local)
+                self._descargar(rutas['scaler'], generaciones[1],
+                                scaler_local)
+            try:
+                with predict_stage_seconds.time(finca=finca,
+                                                stage="unpickle"):
+                    best_model = cargar_artefacto(modelo_local, self.mmap)
+                    scaler = cargar_artefacto(scaler_local, self.mmap)
+                break
+            except FileNotFoundError:
+                # Otro worker desalojó la finca y borró la copia local
+                if intento:
+                    raise
+
+        if self.compilar:
+            # El predictor compilado ya incluye el scaler (scaler=None)
+            with predict_stage_seconds.time(finca=finca, stage="compile"):
+                compilado = compilar(best_model, scaler)
+            if compilado is not None:
+                best_model, scaler = compilado, None
+
+        try:
+            with predict_stage_seconds.time(finca=finca, stage="validate"):
+                self.prueba(best_model, scaler)
+        except ModeloRechazado:
+            with self._lock:
+                self._contar(finca, "rechazos")
+            raise
+        # Los mapeos abiertos sobreviven al borrado del archivo
+        self._limpiar_generaciones(finca, (modelo_local, scaler_local))
+        logger.info(f"📦 Modelo de {finca} cargado (generaciones "
+                    f"{generaciones[0]}/{generaciones[1]})")
+        return _EntradaModelo(best_model, scaler, generaciones)
+
+    def _vigente(self, entrada: Optional[_EntradaModelo]) -> bool:
+        return (entrada is not None and
+                time.monotonic() - entrada.verificado_en < self.revalidar_cada)
+
+    def _contar(self, finca: str, evento: str):
+        contadores = self.contadores.setdefault(
+            finca, dict.fromkeys(_EVENTOS, 0))
+        contadores[evento] += 1
+        model_registry_events.inc(finca=finca, event=_EVENTOS[evento])
+
+    def _acierto(self, finca: str, entrada: _EntradaModelo):
+        with self._lock:
+            if self._entradas.get(finca) is entrada:
+                self._entradas.move_to_end(finca)
+            self._contar(finca, "aciertos")
+        return entrada.modelo, entrada.scaler
+
+    def _guardar(self, finca: str, entrada: _EntradaModelo):
+        """Registrar un modelo recién cargado y ajustar el presupuesto"""
+        desalojadas = []
+        with self._lock:
+            anterior = self._entradas.get(finca)
+            self._entradas[finca] = entrada
+            self._entradas.move_to_end(finca)
+            self._contar(finca, "cargas")
+            if anterior is not None:
+                self._contar(finca, "cambios")
+            historial = self.historial.setdefault(finca, [])
+            generaciones = list(entrada.generaciones)
+            if not historial or historial[-1]["generaciones"] != generaciones:
+                historial.append({"generaciones": generaciones,
+                                  "activado": time.time()})
+                del historial[:-self.max_historial]
+            while (self.memoria_max_bytes > 0 and len(self._entradas) > 1 and
+                   self.bytes_en_memoria() > self.memoria_max_bytes):
+                antigua, desalojada = self._entradas.popitem(last=False)
+                self._contar(antigua, "desalojos")
+                desalojadas.append((antigua, desalojada))
+        if entrada.bytes > self.memoria_max_bytes > 0:
+            logger.warning(f"⚠️ El modelo de {finca} ({entrada.bytes} "
+                           f"bytes) supera por sí solo el presupuesto de "
+                           f"memoria")
+        for antigua, desalojada in desalojadas:
+            # Las solicitudes en curso conservan su referencia al modelo
+            logger.info(f"♻️ Modelo de {antigua} desalojado "
+                        f"({desalojada.bytes} bytes)")
+            self._limpiar_generaciones(antigua, ())
+
+    def bytes_en_memoria(self) -> int:
+        return sum(e.bytes for e in list(self._entradas.values()))
+
+    def obtener(self, finca: str) -> Tuple[Any, Any]:
+        """Obtener (best_model, scaler) de la finca, cargándolos si hace
+        falta"""
+        entrada = self._entradas.get(finca)
+        if entrada is not None:
+            if not self._vigente(entrada):
+                self._revisar_en_fondo(finca)
+            return self._acierto(finca, entrada)
+
+        if not self.existe(finca):
+            self.invalidar(finca)
+            raise ValueError(f"Finca {finca} no válida")
+
+        with self._lock_finca(finca):
+            # Otra solicitud pudo haber cargado el modelo mientras esperábamos
+            entrada = self._entradas.get(finca)
+            if entrada is not None:
+                return self._acierto(finca, entrada)
+
+            with predict_stage_seconds.time(finca=finca,
+                                            stage="model_version"):
+                generaciones = self._generaciones_objetivo(finca)
+            entrada = self._cargar(finca, generaciones)
+            self._guardar(finca, entrada)
+            return entrada.modelo, entrada.scaler
+
+    def _revisar_en_fondo(self, finca: str):
+        """Buscar una versión nueva sin bloquear la solicitud actual"""
+        with self._lock:
+            if finca in self._revisando:
+                return
+            self._revisando.add(finca)
+        threading.Thread(target=self._revisar, args=(finca,),
+                         name=f"revisar-{finca}", daemon=True).start()
+
+    def _revisar(self, finca: str):
+        try:
+            self.actualizar(finca)
+        except Exception as e:
+            # Se sigue sirviendo la versión en memoria
+            logger.warning(f"⚠️ No se pudo actualizar el modelo de "
+                           f"{finca}: {e}")
+        finally:
+            with self._lock:
+                self._revisando.discard(finca)
+
+    def actualizar(self, finca: str,
+                   generaciones: Optional[Tuple[int, int]] = None
+                   ) -> Dict[str, Any]:
+        """
+        Descargar y validar la versión que corresponde a la finca (o las
+        `generaciones` indicadas) y activarla si es distinta de la actual.
+
+        Raises:
+            ModeloRechazado: Si la versión nueva no pasa la prueba; la
+                anterior sigue activa
+        """
+        if not self.existe(finca):
+            raise ValueError(f"Finca {finca} no válida")
+        with self._lock_finca(finca):
+            entrada = self._entradas.get(finca)
+            anterior = entrada.generaciones if entrada else None
+            try:
+                objetivo = tuple(generaciones) if generaciones \
+                    else self._generaciones_objetivo(finca)
+                if entrada is not None and anterior == objetivo:
+                    cambio = False
+                else:
+                    self._guardar(finca, self._cargar(finca, objetivo))
+                    cambio = True
+            except Exception as e:
+                self.errores[finca] = str(e)
+                raise
+            finally:
+                if entrada is not None:
+                    # Reintentar como mucho cada revalidar_cada segundos
+                    entrada.verificado_en = time.monotonic()
+            self.errores[finca] = None
+            if cambio and anterior is not None:
+                logger.info(f"🔄 Modelo de {finca} cambiado de "
+                            f"{anterior[0]}/{anterior[1]} a "
+                            f"{objetivo[0]}/{objetivo[1]}")
+            return {"finca": finca,
+                    "anterior": list(anterior) if anterior else None,
+                    "actual": list(objetivo), "cambio": cambio}
+
+    def fijar(self, finca: str, generaciones: Tuple[int, int]
+              ) -> Dict[str, Any]:
+        """Servir unas generaciones concretas de la finca (p. ej. volver a
+        una versión anterior) hasta llamar a `liberar`"""
+        with self._lock_finca(finca):
+            with self._lock:
+                previa = self.fijadas.get(finca)
+                self.fijadas[finca] = tuple(int(g) for g in generaciones)
+            try:
+                return self.actualizar(finca)
+            except Exception:
+                with self._lock:
+                    if previa is None:
+                        self.fijadas.pop(finca, None)
+                    else:
+                        self.fijadas[finca] = previa
+                raise
+
+    def liberar(self, finca: str) -> Dict[str, Any]:
+        """Quitar la fijación y volver a la versión que toque; si esa
+        versión no pasa la prueba, la fijación se mantiene"""
+        with self._lock_finca(finca):
+            with self._lock:
+                previa = self.fijadas.pop(finca, None)
+            try:
+                return self.actualizar(finca)
+            except Exception:
+                if previa is not None:
+                    with self._lock:
+                        self.fijadas[finca] = previa
+                raise
+
+    def anterior(self, finca: str) -> Optional[Tuple[int, int]]:
+        """Generaciones activas antes de la actual, según el historial"""
+        actual = self.version(finca)
+        for registro in reversed(self.historial.get(finca, [])):
+            if tuple(registro["generaciones"]) != actual:
+                return tuple(registro["generaciones"])
+        return None
+
+    def versiones(self) -> Dict[str, Dict[str, Any]]:
+        """Versión activa, fijación, historial y último error por finca"""
+        rutas = self.rutas
+        with self._lock:
+            fijadas = dict(self.fijadas)
+        return {
+            finca: {
+                "generaciones": list(self.version(finca))
+                if self.version(finca) else None,
+                "fijada": list(fijadas[finca])
+                if finca in fijadas else None,
+                "fijada_manifiesto": list(rutas[finca]["generaciones"])
+                if rutas[finca].get("generaciones") else None,
+                "historial": list(self.historial.get(finca, [])),
+                "error": self.errores.get(finca)
+            }
+            for finca in rutas
+        }
+
+    def version(self, finca: str, revisar: bool = False
+                ) -> Optional[Tuple[int, int]]:
+        """
+        Generaciones (modelo, scaler) en memoria para la finca. Con
+        `revisar`, además lanza la revisión en fondo si ya venció
+        `revalidar_cada`, igual que `obtener`
+        """
+        entrada = self._entradas.get(finca)
+        if entrada is None:
+            return None
+        if revisar and not self._vigente(entrada):
+            self._revisar_en_fondo(finca)
+        return entrada.generaciones
+
+    def invalidar(self, finca: Optional[str] = None):
+        """Olvidar los modelos en memoria (de una finca o de todas)"""
+        with self._lock:
+            if finca is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(finca, None)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Uso de memoria y cargas, aciertos y desalojos por finca"""
+        with self._lock:
+            entradas = dict(self._entradas)
+            contadores = {f: dict(c) for f, c in self.contadores.items()}
+        rutas = self.rutas
+        fincas = {}
+        for finca in list(rutas) + [f for f in contadores
+                                    if f not in rutas]:
+            entrada = entradas.get(finca)
+            fincas[finca] = {
+                "en_memoria": entrada is not None,
+                "bytes": entrada.bytes if entrada else 0,
+                "generaciones": list(entrada.generaciones)
+                if entrada else None,
+                **contadores.get(finca, dict.fromkeys(_EVENTOS, 0))
+            }
+        return {
+            "origen_fincas": self.catalogo.origen,
+            "memoria_max_bytes": self.memoria_max_bytes,
+            "bytes_en_memoria": sum(e.bytes for e in entradas.values()),
+            "fincas": fincas
+        }
+
+    def _precargar_finca(self, finca: str):
+        inicio = time.perf_counter()
+        try:
+            self.obtener(finca)
+            self.precarga[finca] = {
+                "cargado": True,
+                "segundos": round(time.perf_counter() - inicio, 3),
+                "error": None
+            }
+        except Exception as e:
+            logger.error(f"❌ Error precargando el modelo de {finca}: {e}")
+            self.precarga[finca] = {
+                "cargado": False,
+                "segundos": round(time.perf_counter() - inicio, 3),
+                "error": str(e)
+            }
+
+    def precargar(self, max_workers: int = 6) -> Dict[str, Dict[str, Any]]:
+        """Cargar concurrentemente los modelos de todas las fincas"""
+        self.precarga_completa = False
+        fincas = self.fincas()
+        self.precarga = {finca: {"cargado": False, "segundos": None,
+                                 "error": None}
+                         for finca in fincas}
+        with ThreadPoolExecutor(max_workers=max_workers,
+                                thread_name_prefix="precarga") as pool:
+            list(pool.map(self._precargar_finca, fincas))
+        self.precarga_fallidas = sorted(
+            finca for finca, e in self.precarga.items() if not e["cargado"])
+        self.precarga_completa = True
+        cargadas = len(fincas) - len(self.precarga_fallidas)
+        if cargadas:
+            logger.info(f"🔥 Precarga terminada: {cargadas}/{len(fincas)} "
+                        f"fincas en memoria")
+        else:
+            logger.error("❌ Precarga terminada sin ningún modelo en memoria")
+        return self.precarga
+
+    @property
+    def precarga_lista(self) -> bool:
+        """Precarga terminada con al menos un modelo cargado"""
+        return self.precarga_completa and \
+            len(self.precarga_fallidas) < len(self.precarga)
@@ -0,0 +1,221 @@
+"""
+Tabla de búsqueda Gramos -> Rendimiento y su descarga desde RENDIMIENTO_PATH
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class TablaRendimiento:
+    """
+    Tabla Gramos -> Rendimiento compilada una sola vez.
+
+    Dentro del rango de la tabla cada gramo se resuelve con un acceso
+    directo a un arreglo denso que ya contiene el valor de la clave más
+    cercana (en empate gana la clave menor, igual que el antiguo `min`
+    sobre las claves ordenadas). Fuera del rango se usa bisección sobre
+    las claves ordenadas.
+    """
+
+    def __init__(self, tabla: Mapping[int, int]):
+        if not tabla:
+            raise ValueError("La tabla de rendimiento está vacía")
+        self.claves = np.array(sorted(tabla), dtype=np.int64)
+        self.valores_claves = np.array([tabla[k] for k in self.claves],
+                                       dtype=np.int64)
+        self._claves_lista = self.claves.tolist()
+        self.minimo = int(self.claves[0])
+        self.maximo = int(self.claves[-1])
+
+        # Para cada gramo del rango, índice de la clave más cercana
+        gramos = np.arange(self.minimo, self.maximo + 1)
+        derecha = np.searchsorted(self.claves, gramos)
+        derecha = np.clip(derecha, 0, len(self.claves) - 1)
+        izquierda = np.clip(derecha - 1, 0, len(self.claves) - 1)
+        usar_izquierda = (np.abs(gramos - self.claves[izquierda]) <=
+                          np.abs(self.claves[derecha] - gramos))
+        cercana = np.where(usar_izquierda, izquierda, derecha)
+        self.denso = self.valores_claves[cercana]
+
+    @classmethod
+    def desde_filas(cls, filas: Iterable[Dict]) -> "TablaRendimiento":
+        """Construir la tabla a partir de las filas del JSON de rendimiento"""
+        return cls({int(fila["Gramos"]): int(fila["Rendimiento"])
+                    for fila in filas})
+
+    def valor(self, gramos: int) -> int:
+        """Rendimiento para un solo valor de gramos"""
+        if self.minimo <= gramos <= self.maximo:
+            return int(self.denso[int(gramos) - self.minimo])
+        i = bisect_left(self._claves_lista, gramos)
+        i = min(i, len(self._claves_lista) - 1)
+        return int(self.valores_claves[i])
+
+    def valores(self, gramos) -> np.ndarray:
+        """Rendimiento vectorizado para un arreglo de gramos"""
+        gramos = np.asarray(gramos, dtype=np.int64)
+        indices = np.clip(gramos, self.minimo, self.maximo) - self.minimo
+        return self.denso[indices]
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+
+class ProveedorRendimiento:
+    """
+    Mantiene la tabla de rendimiento en memoria a partir de una URL.
+
+    - Arranque inmediato desde la copia local en disco, si existe.
+    - Revalidación condicional (ETag / If-Modified-Since) en segundo plano.
+    - Cambio atómico de la tabla en memoria cuando el contenido cambia.
+    - Ante cualquier fallo se sigue usando la última copia válida.
+    """
+
+    def __init__(self, url: str, ruta_local: str = "/tmp/rendimiento.json",
+                 refrescar_cada: float = 600.0, timeout: float = 10.0):
+        self.url = url
+        self.ruta_local = ruta_local
+        self.refrescar_cada = refrescar_cada
+        self.timeout = timeout
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self._tabla: Optional[TablaRendimiento] = None
+        self._lock_carga = threading.Lock()
+        self._ultimo_intento = float("-inf")
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def tabla(self) -> TablaRendimiento:
+        """Tabla vigente; la carga en el primer uso si aún no hay ninguna"""
+        tabla = self._tabla
+        if tabla is None:
+            self.cargar_una_vez()
+            tabla = self._tabla
+            if tabla is None:
+                raise RuntimeError(
+                    "La tabla de rendimiento no está disponible")
+        return tabla
+
+    @property
+    def disponible(self) -> bool:
+        return self._tabla is not None
+
+    def cargar(self) -> bool:
+        """Cargar la copia local o, si no hay, descargar la tabla"""
+        if self._cargar_local():
+            return True
+        return self.revalidar()
+
+    def cargar_una_vez(self) -> bool:
+        """Como cargar(), pero sin repetir la descarga si otro hilo ya la
+        hizo o la está haciendo"""
+        with self._lock_carga:
+            if self._tabla is not None:
+                return True
+            # Tras un fallo no se reintenta en cada solicitud
+            if time.monotonic() - self._ultimo_intento < 5.0:
+                return False
+            self._ultimo_intento = time.monotonic()
+            return self.cargar()
+
+    def _cargar_local(self) -> bool:
+        if not os.path.exists(self.ruta_local):
+            return False
+        try:
+            with open(self.ruta_local, "r") as f:
+                copia = json.load(f)
+            if copia.get("url") != self.url:
+                return False
+            self._tabla = TablaRendimiento.desde_filas(copia["data"]["rows"])
+            self.etag = copia.get("etag")
+            self.last_modified = copia.get("last_modified")
+            logger.info(f"📄 Tabla de rendimiento cargada desde "
+                        f"{self.ruta_local}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Copia local de rendimiento inválida: {e}")
+            return False
+
+    def _guardar_local(self, data: Dict[str, Any]):
+        """Escribir la copia local de forma atómica (archivo temporal +
+        rename)"""
+        temporal = f"{self.ruta_local}.tmp"
+        try:
+            with open(temporal, "w") as f:
+                json.dump({"url": self.url,
+                           "etag": self.etag,
+                           "last_modified": self.last_modified,
+                           "data": data}, f)
+            os.replace(temporal, self.ruta_local)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar la copia local de "
+                           f"rendimiento: {e}")
+
+    def revalidar(self) -> bool:
+        """
+        Consultar la URL con una petición condicional.
+
+        Returns:
+            bool: True si hay una tabla válida en memoria tras la consulta
+        """
+        headers = {}
+        if self._tabla is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        try:
+            response = requests.get(self.url, headers=headers,
+                                    timeout=self.timeout)
+            if response.status_code == 304:
+                return True
+            if response.status_code != 200:
+                logger.error(f"❌ Error al descargar la tabla de rendimiento:"
+                             f" {response.status_code}")
+                return self.disponible
+
+            data = response.json()
+            tabla = TablaRendimiento.desde_filas(data["rows"])
+        except Exception as e:
+            logger.error(f"❌ Error actualizando la tabla de rendimiento: {e}")
+            return self.disponible
+
+        # Cambio atómico: las lecturas en curso conservan la tabla anterior
+        self._tabla = tabla
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self._guardar_local(data)
+        logger.info(f"✅ Tabla de rendimiento actualizada "
+                    f"({len(tabla)} filas)")
+        return True
+
+    def _bucle_refresco(self):
+        # Carga diferida (si nadie la hizo aún) y revalidación inmediata: la
+        # copia local puede ser vieja
+        self.cargar_una_vez()
+        self.revalidar()
+        while not self._detener.wait(self.refrescar_cada):
+            self.revalidar()
+
+    def iniciar_refresco(self):
+        """Revalidar la tabla periódicamente en un hilo de fondo"""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle_refresco,
+                                      name="refresco-rendimiento",
+                                      daemon=True)
+        self._hilo.start()
+
+    def detener_refresco(self):
+        self._detener.set()
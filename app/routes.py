@@ -1,20 +1,77 @@
 # app/routes.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, File, Form, Request, \
+    UploadFile
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
 import base64
-import smtplib
 import os
 from dotenv import load_dotenv
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 from email.mime.text import MIMEText
 import re
+import tempfile
+from app.correo import cola_correos, escribir_mensaje_pdf, \
+    ArchivoDemasiadoGrande
+from app.ejecutores import ejecutor_io, ColaLlenaError
+from app.metrics import invoice_stage_seconds
 
 # Cargar .env si aún no lo ha hecho main.py (opcional si ya cargaste antes)
 load_dotenv()
 
 router = APIRouter()
 
+# Tamaño máximo del PDF subido por multipart
+INVOICE_MAX_BYTES = int(float(os.getenv("INVOICE_MAX_MB", "10")) * 1024 * 1024)
+
+# Cuerpo multipart completo: el PDF más los campos de texto y encabezados
+INVOICE_MAX_BODY = INVOICE_MAX_BYTES + 1024 * 1024
+
+
+class RutaCuerpoLimitado(APIRoute):
+    """
+    Ruta que rechaza con 413 los cuerpos mayores que INVOICE_MAX_BODY antes
+    de que Starlette los vuelque a un archivo temporal (en Cloud Run /tmp
+    está en memoria).
+
+    Se comprueba Content-Length antes de leer nada y, para cuerpos sin
+    Content-Length (chunked) o con uno falso, se cuentan los bytes
+    recibidos y se corta la lectura en cuanto se supera el máximo.
+    """
+
+    def get_route_handler(self):
+        manejador = super().get_route_handler()
+
+        def demasiado_grande() -> HTTPException:
+            return HTTPException(
+                status_code=413,
+                detail=f"La solicitud supera el máximo de "
+                       f"{INVOICE_MAX_BODY} bytes")
+
+        async def manejador_limitado(request: Request):
+            largo = request.headers.get("content-length", "")
+            if largo.isdigit() and int(largo) > INVOICE_MAX_BODY:
+                raise demasiado_grande()
+
+            recibidos = 0
+            recibir = request.receive
+
+            async def recibir_contando():
+                nonlocal recibidos
+                mensaje = await recibir()
+                if mensaje["type"] == "http.request":
+                    recibidos += len(mensaje.get("body", b""))
+                    if recibidos > INVOICE_MAX_BODY:
+                        raise demasiado_grande()
+                return mensaje
+
+            return await manejador(Request(request.scope, recibir_contando))
+
+        return manejador_limitado
+
+
+router_subida = APIRouter(route_class=RutaCuerpoLimitado)
+
 
 class InvoiceRequest(BaseModel):
     recipient: str
@@ -29,7 +86,7 @@ def is_valid_email(email: str) -> bool:
     return re.match(pattern, email) is not None
 
 
-@router.post("/send-invoice")
+@router.post("/send-invoice", status_code=202)
 async def send_invoice(request: InvoiceRequest):
     try:
         # 1. Validar el correo manualmente
@@ -52,7 +109,8 @@ async def send_invoice(request: InvoiceRequest):
 
         # 3. Decodificar el PDF base64
         try:
-            pdf_bytes = base64.b64decode(request.pdf_base64)
+            with invoice_stage_seconds.time(stage="pdf_decode"):
+                pdf_bytes = base64.b64decode(request.pdf_base64)
         except Exception as decode_error:
             raise HTTPException(
                 status_code=400,
@@ -72,29 +130,13 @@ async def send_invoice(request: InvoiceRequest):
         part["Content-Disposition"] = 'attachment; filename="guia.pdf"'
         msg.attach(part)
 
-        # 6. Enviar correo
+        # 6. Encolar el correo; el envío ocurre en segundo plano
         try:
-            with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                server.starttls()
-                server.login(email_user, email_pass)
-                server.sendmail(email_user, request.recipient, msg.as_string())
-            return {"message": "Correo enviado con éxito"}
-        except smtplib.SMTPRecipientsRefused:
-            raise HTTPException(
-                status_code=400,
-                detail=f"El servidor rechazó el correo: {request.recipient}"
-            )
-        except smtplib.SMTPAuthenticationError:
-            raise HTTPException(
-                status_code=500,
-                detail="Error de autenticación SMTP. "
-                "Verifica las credenciales."
-            )
-        except Exception as smtp_error:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error al enviar correo: {str(smtp_error)}"
-            )
+            job_id = cola_correos.encolar(email_user, request.recipient,
+                                          msg.as_string())
+        except ColaLlenaError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return {"message": "Correo encolado para envío", "job_id": job_id}
 
     except HTTPException:
         raise
@@ -103,3 +145,79 @@ async def send_invoice(request: InvoiceRequest):
             status_code=500,
             detail=f"Error inesperado: {str(e)}"
         )
+
+
+@router.get("/send-invoice/{job_id}")
+async def invoice_status(job_id: str):
+    """
+    Consultar el estado de envío de una factura encolada.
+
+    El estado solo está en la memoria de la instancia que aceptó el correo:
+    con varias instancias (Cloud Run) otra instancia responde 404.
+    """
+    estado = cola_correos.estado(job_id)
+    if estado is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No existe el envío {job_id} en esta instancia"
+        )
+    return estado
+
+
+@router_subida.post("/send-invoice/upload", status_code=202)
+async def send_invoice_upload(
+    recipient: str = Form(...),
+    subject: str = Form(...),
+    html_body: str = Form(...),
+    pdf: UploadFile = File(...)
+):
+    """
+    Variante multipart/form-data de /send-invoice.
+
+    El PDF llega como archivo (sin base64), se codifica por bloques en un
+    mensaje temporal en disco y se transmite por SMTP sin cargarlo entero
+    en memoria. Los cuerpos mayores que INVOICE_MAX_BODY se rechazan antes
+    de leer el formulario (ver RutaCuerpoLimitado).
+    """
+    if not is_valid_email(recipient):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato de correo no válido: {recipient}"
+        )
+
+    email_user = os.getenv("EMAIL_USER")
+    email_pass = os.getenv("EMAIL_PASS")
+    if not email_user or not email_pass:
+        raise HTTPException(
+            status_code=500,
+            detail="Variables de entorno EMAIL_USER o EMAIL_PASS no están "
+                   "definidas. Asegúrate de configurarlas correctamente."
+        )
+
+    fd, ruta = tempfile.mkstemp(prefix="factura-", suffix=".eml")
+    os.close(fd)
+    try:
+        with invoice_stage_seconds.time(stage="pdf_spool"):
+            await ejecutor_io.run(
+                escribir_mensaje_pdf, ruta, email_user, recipient, subject,
+                html_body, pdf.file, INVOICE_MAX_BYTES)
+        job_id = cola_correos.encolar(email_user, recipient, archivo=ruta)
+    except ArchivoDemasiadoGrande as e:
+        os.remove(ruta)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ColaLlenaError as e:
+        os.remove(ruta)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        os.remove(ruta)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error inesperado: {str(e)}"
+        )
+    finally:
+        await pdf.close()
+
+    return {"message": "Correo encolado para envío", "job_id": job_id}
+
+
+router.include_router(router_subida)
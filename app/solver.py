@@ -0,0 +1,312 @@
+"""
+Solucionadores del ajuste de AnimalesM usado por /predict
+"""
+import threading
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+from app.metrics import predict_solver_iterations, \
+    predict_solver_nonconverged, predict_solver_residual
+
+# Campos devueltos por /predict, en el orden de la respuesta
+CAMPOS_RESULTADO = ("Consumo", "Gramos", "KGXHA", "LibrasTotal",
+                    "LibrasXHA", "Error2", "AnimalesM")
+
+METODOS = ("auto", "iterativo", "vectorizado")
+
+# Con "auto" se usa resolver_vectorizado si el modelo no está compilado
+# (cada llamada a sklearn tiene un coste fijo alto) y el tramo completo
+# (filas x candidatos) no pasa de este número de filas; si no, el bucle
+FILAS_MAX_VECTORIZADO = 1024
+
+
+def evaluar(modelo, scaler, animales: np.ndarray, hectareas: np.ndarray,
+            piscinas: np.ndarray,
+            obtener_rendimiento: Callable[[np.ndarray], np.ndarray]
+            ) -> Dict[str, np.ndarray]:
+    """
+    Evaluar el modelo y recalcular las variables dependientes para muchas
+    filas en una sola llamada a `scaler.transform` y `modelo.predict`.
+
+    `scaler` es None cuando el modelo es un predictor compilado que ya
+    incluye el escalado (ver app/compilado.py).
+    """
+    nuevo_dato = np.column_stack([animales, hectareas, piscinas]).astype(
+        float)
+    entrada = nuevo_dato if scaler is None else scaler.transform(nuevo_dato)
+    prediccion = np.asarray(modelo.predict(entrada))
+    prediccion = prediccion.reshape(len(nuevo_dato), -1)
+
+    hectareas_real = nuevo_dato[:, 1]
+    consumo = prediccion[:, 0]
+    gramos = np.round(prediccion[:, 1]).astype(np.int64)
+    rendimiento = obtener_rendimiento(gramos)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kg_x_ha = np.round(consumo / hectareas_real, 2)
+        libras_x_ha = np.round(kg_x_ha * (rendimiento / 100) * 100, 2)
+        libras_total = np.round(hectareas_real * libras_x_ha, 2)
+        error2 = np.round(libras_total * 0.98, 2)
+        animales_m = np.round(((libras_x_ha * 454) / gramos) / 10000, 2)
+
+    return {
+        "Consumo": consumo,
+        "Gramos": gramos,
+        "KGXHA": kg_x_ha,
+        "LibrasTotal": libras_total,
+        "LibrasXHA": libras_x_ha,
+        "Error2": error2,
+        "AnimalesM": animales_m
+    }
+
+
+def _residuo(animales_m: np.ndarray, objetivo: np.ndarray) -> np.ndarray:
+    residuo = np.abs(animales_m - objetivo)
+    residuo[~np.isfinite(residuo)] = np.inf
+    return residuo
+
+
+def _pendiente(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Pendiente por mínimos cuadrados de cada fila (0 si no se puede)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = x - x.mean(axis=1, keepdims=True)
+        pendiente = ((dx * (y - y.mean(axis=1, keepdims=True))).sum(axis=1)
+                     / (dx * dx).sum(axis=1))
+    pendiente[~np.isfinite(pendiente)] = 0.0
+    return pendiente
+
+
+def _solucion_vacia(n: int) -> Dict[str, np.ndarray]:
+    solucion = {campo: np.full(n, np.nan) for campo in CAMPOS_RESULTADO}
+    solucion["Gramos"] = np.zeros(n, dtype=np.int64)
+    solucion["Iteraciones"] = np.zeros(n, dtype=np.int64)
+    solucion["Convergio"] = np.zeros(n, dtype=bool)
+    solucion["Residuo"] = np.full(n, np.inf)
+    return solucion
+
+
+def resolver_iterativo(modelo, scaler, objetivo, hectareas, piscinas,
+                       obtener_rendimiento, margen_error=0.01,
+                       max_iteraciones=100) -> Dict[str, np.ndarray]:
+    """
+    Ajuste original de punto fijo con factor de amortiguación 0.1.
+
+    Cada iteración evalúa de una vez todas las filas que aún no
+    convergieron.
+    """
+    objetivo = np.asarray(objetivo, dtype=float)
+    hectareas = np.asarray(hectareas, dtype=float)
+    piscinas = np.asarray(piscinas, dtype=float)
+    solucion = _solucion_vacia(len(objetivo))
+
+    aniM = objetivo.copy()
+    activos = np.arange(len(objetivo))
+    for iteracion in range(1, max_iteraciones + 1):
+        if activos.size == 0:
+            break
+        evaluado = evaluar(modelo, scaler, aniM[activos],
+                           hectareas[activos], piscinas[activos],
+                           obtener_rendimiento)
+        for campo in CAMPOS_RESULTADO:
+            solucion[campo][activos] = evaluado[campo]
+        solucion["Iteraciones"][activos] = iteracion
+
+        diferencia = evaluado["AnimalesM"] - objetivo[activos]
+        residuo = _residuo(evaluado["AnimalesM"], objetivo[activos])
+        solucion["Residuo"][activos] = residuo
+
+        convergidos = residuo <= margen_error
+        solucion["Convergio"][activos[convergidos]] = True
+
+        # Ajustar AnimalesM de las filas que siguen activas
+        siguen = ~convergidos & np.isfinite(residuo)
+        aniM[activos[siguen]] -= diferencia[siguen] * 0.1
+        activos = activos[siguen]
+
+    return solucion
+
+
+def resolver_vectorizado(modelo, scaler, objetivo, hectareas, piscinas,
+                         obtener_rendimiento, margen_error=0.01,
+                         max_iteraciones=100,
+                         candidatos=16) -> Dict[str, np.ndarray]:
+    """
+    Mismo ajuste de punto fijo que resolver_iterativo, evaluando por
+    adelantado `candidatos` pasos por fila en cada llamada al modelo.
+
+    Cada ronda evalúa un tramo con el punto exacto actual y una
+    estimación de los siguientes, y rehace con esas evaluaciones la
+    trayectoria del bucle. Solo se aceptan los pasos cuyo punto estimado
+    coincide bit a bit con el recalculado, así que el resultado (punto de
+    parada, Iteraciones y campos) es el de resolver_iterativo. Como
+    AnimalesM se redondea a 2 decimales, la estimación suele acertar
+    varios pasos seguidos y hacen falta muchas menos llamadas al modelo.
+    """
+    objetivo = np.asarray(objetivo, dtype=float)
+    hectareas = np.asarray(hectareas, dtype=float)
+    piscinas = np.asarray(piscinas, dtype=float)
+    solucion = _solucion_vacia(len(objetivo))
+    if max_iteraciones < 1:
+        return solucion
+
+    m = candidatos
+    filas = np.arange(len(objetivo))
+    # Iteraciones ya hechas (exactas) y tramo a evaluar: la primera
+    # columna es el AnimalesM exacto de la siguiente iteración
+    hechas = np.zeros(len(objetivo), dtype=np.int64)
+    tramo = np.repeat(objetivo[:, None], m, axis=1)
+    while filas.size:
+        evaluado = evaluar(modelo, scaler, tramo.ravel(),
+                           np.repeat(hectareas[filas], m),
+                           np.repeat(piscinas[filas], m),
+                           obtener_rendimiento)
+        animales = evaluado["AnimalesM"].reshape(-1, m)
+        diferencia = animales - objetivo[filas, None]
+        residuo = _residuo(evaluado["AnimalesM"],
+                           np.repeat(objetivo[filas], m)).reshape(-1, m)
+
+        # Trayectoria del bucle con las evaluaciones del tramo
+        trayectoria = np.empty((len(filas), m + 1))
+        trayectoria[:, 0] = tramo[:, 0]
+        for k in range(m):
+            trayectoria[:, k + 1] = (trayectoria[:, k] -
+                                     diferencia[:, k] * 0.1)
+        exactos = np.cumprod(tramo == trayectoria[:, :m], axis=1,
+                             dtype=bool)
+        exactos[:, 0] = True
+
+        # El bucle para en el primer paso exacto que converge, no es
+        # finito o agota max_iteraciones
+        iteracion = hechas[filas, None] + np.arange(1, m + 1)
+        para = exactos & ((residuo <= margen_error) | np.isinf(residuo) |
+                          (iteracion >= max_iteraciones))
+        termina = para.any(axis=1)
+        k = np.argmax(para, axis=1)[termina]
+        origen = np.arange(len(filas))[termina] * m + k
+        fin = filas[termina]
+        for campo in CAMPOS_RESULTADO:
+            solucion[campo][fin] = evaluado[campo][origen]
+        solucion["Iteraciones"][fin] = iteracion[termina, k]
+        solucion["Residuo"][fin] = residuo[termina, k]
+        solucion["Convergio"][fin] = residuo[termina, k] <= margen_error
+
+        # Las demás avanzan los pasos exactos. El nuevo tramo estima los
+        # siguientes AnimalesM recalculados con lo evaluado en el mismo
+        # paso corregido por la pendiente local (redondeando como evaluar)
+        sigue = ~termina
+        filas, avance = filas[sigue], exactos[sigue].sum(axis=1)
+        anterior, recalculado = tramo[sigue], animales[sigue]
+        hechas[filas] += avance
+        pendiente = _pendiente(anterior, recalculado)
+        indice = np.arange(len(filas))
+        tramo = np.empty((len(filas), m))
+        tramo[:, 0] = trayectoria[sigue][indice, avance]
+        for c in range(1, m):
+            paso = np.minimum(avance + c - 1, m - 1)
+            estimado = np.round(
+                recalculado[indice, paso] + pendiente *
+                (tramo[:, c - 1] - anterior[indice, paso]), 2)
+            tramo[:, c] = (tramo[:, c - 1] -
+                           (estimado - objetivo[filas]) * 0.1)
+
+    return solucion
+
+
+def resolver(modelo, scaler, objetivo, hectareas, piscinas,
+             obtener_rendimiento, metodo="auto", margen_error=0.01,
+             max_iteraciones=100, candidatos=16) -> Dict[str, np.ndarray]:
+    """
+    Resolver AnimalesM para todas las filas con el método indicado. Los
+    dos métodos dan el mismo resultado; "auto" elige el más rápido.
+    """
+    if metodo == "auto":
+        metodo = "vectorizado" if scaler is not None and \
+            len(objetivo) * candidatos <= FILAS_MAX_VECTORIZADO \
+            else "iterativo"
+    if metodo == "iterativo":
+        return resolver_iterativo(modelo, scaler, objetivo, hectareas,
+                                  piscinas, obtener_rendimiento,
+                                  margen_error, max_iteraciones)
+    if metodo == "vectorizado":
+        return resolver_vectorizado(modelo, scaler, objetivo, hectareas,
+                                    piscinas, obtener_rendimiento,
+                                    margen_error, max_iteraciones,
+                                    candidatos)
+    raise ValueError(f"Método de solución desconocido: {metodo}")
+
+
+def fila_resultado(solucion: Dict[str, np.ndarray], i: int) -> Dict:
+    """Construir el diccionario de respuesta de /predict para la fila i"""
+    if not np.isfinite(solucion["AnimalesM"][i]):
+        raise ZeroDivisionError(
+            "El modelo predijo 0 gramos; no se puede calcular AnimalesM")
+    resultado = {campo: float(solucion[campo][i])
+                 for campo in CAMPOS_RESULTADO}
+    resultado["Gramos"] = int(solucion["Gramos"][i])
+    resultado["Iteraciones"] = int(solucion["Iteraciones"][i])
+    resultado["Convergio"] = bool(solucion["Convergio"][i])
+    return resultado
+
+
+class TelemetriaSolver:
+    """
+    Agregados por finca del solucionador: filas resueltas, iteraciones,
+    filas que no convergieron dentro de max_iteraciones (se devuelve el
+    último valor con Convergio=false) y residuo final |AnimalesM - objetivo|.
+    También alimenta los histogramas y contadores de /metrics.
+    """
+
+    def __init__(self):
+        self._fincas: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, finca: str, solucion: Dict[str, np.ndarray]):
+        iteraciones = solucion["Iteraciones"]
+        residuo = solucion["Residuo"]
+        finitos = residuo[np.isfinite(residuo)]
+        no_convergidas = int(np.count_nonzero(~solucion["Convergio"]))
+
+        predict_solver_iterations.observe_many(iteraciones, finca=finca)
+        predict_solver_residual.observe_many(finitos, finca=finca)
+        if no_convergidas:
+            predict_solver_nonconverged.inc(no_convergidas, finca=finca)
+
+        with self._lock:
+            agregado = self._fincas.setdefault(finca, {
+                "filas": 0, "iteraciones": 0, "iteraciones_max": 0,
+                "no_convergidas": 0, "residuo_suma": 0.0,
+                "residuo_max": 0.0, "residuo_no_finito": 0})
+            agregado["filas"] += len(iteraciones)
+            agregado["iteraciones"] += int(iteraciones.sum())
+            agregado["iteraciones_max"] = max(
+                agregado["iteraciones_max"],
+                int(iteraciones.max()) if len(iteraciones) else 0)
+            agregado["no_convergidas"] += no_convergidas
+            agregado["residuo_suma"] += float(finitos.sum())
+            if finitos.size:
+                agregado["residuo_max"] = max(agregado["residuo_max"],
+                                              float(finitos.max()))
+            agregado["residuo_no_finito"] += len(residuo) - finitos.size
+
+    def resumen(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            fincas = {f: dict(a) for f, a in self._fincas.items()}
+        resumen = {}
+        for finca, a in sorted(fincas.items()):
+            finitos = a["filas"] - a["residuo_no_finito"]
+            resumen[finca] = {
+                "filas": a["filas"],
+                "iteraciones_media": round(a["iteraciones"] / a["filas"], 2)
+                if a["filas"] else 0.0,
+                "iteraciones_max": a["iteraciones_max"],
+                "no_convergidas": a["no_convergidas"],
+                "tasa_no_convergencia": round(
+                    a["no_convergidas"] / a["filas"] * 100, 2)
+                if a["filas"] else 0.0,
+                "residuo_medio": a["residuo_suma"] / finitos
+                if finitos else None,
+                "residuo_max": a["residuo_max"],
+                "residuo_no_finito": a["residuo_no_finito"]
+            }
+        return resumen
@@ -1,18 +1,38 @@
 """
 Sistema de estadísticas y monitoreo de la aplicación
 """
+import atexit
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any
 import threading
 
 
 class StatsManager:
-    def __init__(self, stats_file: str = "app_stats.json"):
+    """
+    Contadores en memoria que se vuelcan a disco periódicamente.
+
+    Los incrementos solo tocan memoria; un hilo de fondo escribe el archivo
+    cada `flush_interval` segundos si hubo cambios, mediante un archivo
+    temporal y un rename atómico. Las estadísticas diarias con más de
+    `daily_retention_days` días se agregan en `monthly_stats`.
+    """
+
+    def __init__(self, stats_file: str = "app_stats.json",
+                 flush_interval: float = 10.0,
+                 daily_retention_days: int = 31):
         self.stats_file = stats_file
+        self.flush_interval = flush_interval
+        self.daily_retention_days = daily_retention_days
         self.lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
         self._load_stats()
+        self._flush_thread = threading.Thread(
+            target=self._flush_loop, name="stats-flush", daemon=True)
+        self._flush_thread.start()
+        atexit.register(self.close)
 
     def _load_stats(self):
         """Cargar estadísticas desde archivo"""
@@ -24,6 +44,8 @@ class StatsManager:
                 self.stats = self._get_default_stats()
         else:
             self.stats = self._get_default_stats()
+        self.stats.setdefault("monthly_stats", {})
+        self._rollup_daily_stats()
 
     def _get_default_stats(self) -> Dict[str, Any]:
         """Estadísticas por defecto"""
@@ -31,44 +53,61 @@ class StatsManager:
             "total_requests": 0,
             "successful_requests": 0,
             "failed_requests": 0,
-            "requests_by_finca": {
-                "CAMANOVILLO": 0,
-                "EXCANCRIGRU": 0,
-                "FERTIAGRO": 0,
-                "GROVITAL": 0,
-                "SUFAAZA": 0,
-                "TIERRAVID": 0
-            },
+            # Las fincas se agregan al registrar su primera solicitud
+            "requests_by_finca": {},
             "last_updated": datetime.now().isoformat(),
             "daily_stats": {},
+            "monthly_stats": {},
             "uptime_start": datetime.now().isoformat()
         }
 
-    def _save_stats(self):
-        """Guardar estadísticas en archivo"""
+    def _save_stats(self, content: str):
+        """Guardar estadísticas en archivo (temporal + rename atómico)"""
+        temp_file = f"{self.stats_file}.tmp"
         try:
-            with open(self.stats_file, 'w') as f:
-                json.dump(self.stats, f, indent=2)
+            with open(temp_file, 'w') as f:
+                f.write(content)
+            os.replace(temp_file, self.stats_file)
         except Exception as e:
             print(f"Error guardando estadísticas: {e}")
 
+    def flush(self):
+        """Volcar a disco los contadores si cambiaron desde el último
+        volcado"""
+        with self.lock:
+            if not self._dirty:
+                return
+            self._rollup_daily_stats()
+            content = json.dumps(self.stats, indent=2)
+            self._dirty = False
+        self._save_stats(content)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Detener el volcado periódico y guardar lo pendiente"""
+        self._stop.set()
+        self.flush()
+
     def increment_total_requests(self):
         """Incrementar contador de solicitudes totales"""
         with self.lock:
             self.stats["total_requests"] += 1
             self._update_daily_stats("total")
             self.stats["last_updated"] = datetime.now().isoformat()
-            self._save_stats()
+            self._dirty = True
 
     def increment_successful_requests(self, finca: str = None):
         """Incrementar contador de solicitudes exitosas"""
         with self.lock:
             self.stats["successful_requests"] += 1
-            if finca and finca in self.stats["requests_by_finca"]:
-                self.stats["requests_by_finca"][finca] += 1
+            if finca:
+                self._increment_finca(finca)
             self._update_daily_stats("successful")
             self.stats["last_updated"] = datetime.now().isoformat()
-            self._save_stats()
+            self._dirty = True
 
     def increment_failed_requests(self):
         """Incrementar contador de solicitudes fallidas"""
@@ -76,9 +115,30 @@ class StatsManager:
             self.stats["failed_requests"] += 1
             self._update_daily_stats("failed")
             self.stats["last_updated"] = datetime.now().isoformat()
-            self._save_stats()
+            self._dirty = True
+
+    def record_batch(self, successful_by_finca: Dict[str, int],
+                     failed: int):
+        """Registrar de una vez los resultados de un lote de solicitudes"""
+        successful = sum(successful_by_finca.values())
+        with self.lock:
+            self.stats["total_requests"] += successful + failed
+            self.stats["successful_requests"] += successful
+            self.stats["failed_requests"] += failed
+            for finca, count in successful_by_finca.items():
+                self._increment_finca(finca, count)
+            self._update_daily_stats("total", successful + failed)
+            self._update_daily_stats("successful", successful)
+            self._update_daily_stats("failed", failed)
+            self.stats["last_updated"] = datetime.now().isoformat()
+            self._dirty = True
 
-    def _update_daily_stats(self, stat_type: str):
+    def _increment_finca(self, finca: str, count: int = 1):
+        """Sumar solicitudes de una finca (ya validada por el llamador)"""
+        fincas = self.stats["requests_by_finca"]
+        fincas[finca] = fincas.get(finca, 0) + count
+
+    def _update_daily_stats(self, stat_type: str, count: int = 1):
         """Actualizar estadísticas diarias"""
         today = datetime.now().strftime("%Y-%m-%d")
         if today not in self.stats["daily_stats"]:
@@ -87,7 +147,22 @@ class StatsManager:
                 "successful": 0,
                 "failed": 0
             }
-        self.stats["daily_stats"][today][stat_type] += 1
+        self.stats["daily_stats"][today][stat_type] += count
+
+    def _rollup_daily_stats(self):
+        """Agregar en estadísticas mensuales los días fuera de retención"""
+        cutoff = (datetime.now() - timedelta(
+            days=self.daily_retention_days)).strftime("%Y-%m-%d")
+        daily = self.stats["daily_stats"]
+        for day in [d for d in daily if d < cutoff]:
+            counts = daily.pop(day)
+            month = self.stats["monthly_stats"].setdefault(day[:7], {
+                "total": 0,
+                "successful": 0,
+                "failed": 0
+            })
+            for stat_type, count in counts.items():
+                month[stat_type] = month.get(stat_type, 0) + count
 
     def get_success_rate(self) -> float:
         """Calcular tasa de éxito"""
@@ -129,9 +204,14 @@ class StatsManager:
             "today_stats": self.get_today_stats(),
             "most_used_finca": self.get_most_used_finca(),
             "requests_by_finca": self.stats["requests_by_finca"],
+            "monthly_stats": self.stats["monthly_stats"],
             "last_updated": self.stats["last_updated"]
         }
 
 
 # Instancia global del gestor de estadísticas
-stats_manager = StatsManager()
+stats_manager = StatsManager(
+    stats_file=os.getenv("STATS_FILE", "app_stats.json"),
+    flush_interval=float(os.getenv("STATS_FLUSH_SEGUNDOS", "10")),
+    daily_retention_days=int(os.getenv("STATS_DIAS_DETALLE", "31"))
+)
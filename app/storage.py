@@ -1,107 +1,211 @@
-from google.cloud import storage
+from google.api_core.exceptions import NotFound, NotModified, \
+    PreconditionFailed
+import gzip
 import os
 import json
 import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.metrics import gcs_operation_seconds
 
 load_dotenv()
 
-# Al inicio del archivo
+# Cliente y bucket se crean en el primer uso (init_storage), no al importar
 client = None
 bucket = None
+_init_lock = threading.Lock()
+
+# Hilos para las operaciones en lote; el pool HTTP del cliente se ajusta al
+# mismo tamaño para que cada hilo reutilice una conexión abierta
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "16"))
+_pool_hilos: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _configurar_pool_http(cliente):
+    """Ampliar el pool de conexiones de la sesión HTTP del cliente"""
+    try:
+        from requests.adapters import HTTPAdapter
+        adaptador = HTTPAdapter(pool_connections=STORAGE_WORKERS,
+                                pool_maxsize=STORAGE_WORKERS)
+        cliente._http.mount("https://", adaptador)
+    except Exception as e:
+        logging.getLogger(__name__).debug(
+            f"No se pudo ajustar el pool HTTP de GCS: {e}")
 
 
 def init_storage():
-    global client, bucket
+    """
+    Conectar con el bucket en el primer uso (no al importar el módulo).
 
+    Raises:
+        ValueError: Si faltan GCS_BUCKET_NAME o GOOGLE_CLOUD_PROJECT_ID
+        Exception: Si no se puede conectar con el bucket
+    """
     if client and bucket:
         return  # Ya está inicializado
 
+    with _init_lock:
+        if client and bucket:
+            return
+        _conectar()
+
+
+def _conectar():
+    global client, bucket
+
     BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
     PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
 
+    # Validación de variables de entorno críticas
     if not BUCKET_NAME or not PROJECT_ID:
-        raise ValueError("Variables de entorno necesarias no configuradas")
+        raise ValueError(
+            "Variables de entorno GCS_BUCKET_NAME y "
+            "GOOGLE_CLOUD_PROJECT_ID son requeridas"
+        )
 
+    # Intentar conectar con Google Cloud Storage con mejor manejo de errores
     try:
+        from google.cloud import storage
+
+        # Verificar si hay credenciales específicas en el archivo
         credentials_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         if credentials_file and os.path.exists(credentials_file):
             logger.info(f"🔑 Usando credenciales desde: {credentials_file}")
 
-        client = storage.Client(project=PROJECT_ID)
-        bucket = client.bucket(BUCKET_NAME)
+        nuevo_client = storage.Client(project=PROJECT_ID)
+        _configurar_pool_http(nuevo_client)
+        nuevo_bucket = nuevo_client.bucket(BUCKET_NAME)
 
-        bucket.exists()
+        # Test de conectividad
+        nuevo_bucket.exists()
         logger.info(f"✅ Conectado exitosamente a bucket: {BUCKET_NAME}")
+        client, bucket = nuevo_client, nuevo_bucket
 
     except Exception as e:
-        logger.error(f"❌ Error conectando a GCS: {e}")
-        raise Exception(f"Error de configuración de GCS: {str(e)}")
+        error_msg = str(e)
+        logger.error(
+            f"❌ Error conectando a Google Cloud Storage: {error_msg}")
+
+        # Proporcionar instrucciones específicas según el tipo de error
+        if ("DefaultCredentialsError" in error_msg or
+                "credentials were not found" in error_msg):
+            logger.error(
+                "🔧 SOLUCIÓN: Configurar credenciales de Google Cloud:")
+            logger.error("   Opción 1: gcloud auth application-default login")
+            logger.error(
+                "   Opción 2: Configurar GOOGLE_APPLICATION_CREDENTIALS")
+            logger.error("   Opción 3: Usar service account key file")
+        elif "does not exist" in error_msg:
+            logger.error(
+                f"🔧 SOLUCIÓN: Verificar que el bucket '{BUCKET_NAME}' existe"
+            )
+            logger.error(f"   Crear bucket: gsutil mb gs://{BUCKET_NAME}")
+        elif "Access Denied" in error_msg:
+            logger.error("🔧 SOLUCIÓN: Verificar permisos del bucket")
+            logger.error(
+                "   El usuario debe tener permisos de Storage Admin")
+
+        raise Exception(
+            f"Error de configuración de Google Cloud Storage: {error_msg}"
+        )
+
+
+def _bucket():
+    init_storage()
+    return bucket
 
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-
-# Validación de variables de entorno críticas
-if not BUCKET_NAME or not PROJECT_ID:
-    raise ValueError(
-        "Variables de entorno GCS_BUCKET_NAME y "
-        "GOOGLE_CLOUD_PROJECT_ID son requeridas"
-    )
-
-# Intentar conectar con Google Cloud Storage con mejor manejo de errores
-try:
-    # Verificar si hay credenciales específicas en el archivo
-    credentials_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    if credentials_file and os.path.exists(credentials_file):
-        logger.info(f"🔑 Usando credenciales desde: {credentials_file}")
-
-    client = storage.Client(project=PROJECT_ID)
-    bucket = client.bucket(BUCKET_NAME)
-
-    # Test de conectividad
-    bucket.exists()
-    logger.info(f"✅ Conectado exitosamente a bucket: {BUCKET_NAME}")
-
-except Exception as e:
-    error_msg = str(e)
-    logger.error(f"❌ Error conectando a Google Cloud Storage: {error_msg}")
-
-    # Proporcionar instrucciones específicas según el tipo de error
-    if ("DefaultCredentialsError" in error_msg or
-            "credentials were not found" in error_msg):
-        logger.error("🔧 SOLUCIÓN: Configurar credenciales de Google Cloud:")
-        logger.error("   Opción 1: gcloud auth application-default login")
-        logger.error("   Opción 2: Configurar GOOGLE_APPLICATION_CREDENTIALS")
-        logger.error("   Opción 3: Usar service account key file")
-    elif "does not exist" in error_msg:
-        logger.error(
-            f"🔧 SOLUCIÓN: Verificar que el bucket '{BUCKET_NAME}' existe"
-        )
-        logger.error(f"   Crear bucket: gsutil mb gs://{BUCKET_NAME}")
-    elif "Access Denied" in error_msg:
-        logger.error("🔧 SOLUCIÓN: Verificar permisos del bucket")
-        logger.error("   El usuario debe tener permisos de Storage Admin")
 
-    raise Exception(
-        f"Error de configuración de Google Cloud Storage: {error_msg}"
-    )
+class _CacheLecturas:
+    """
+    Caché LRU de lecturas acotada por bytes.
 
+    Guarda el contenido crudo de cada blob junto con su generación; la
+    siguiente lectura pide el blob con `if_generation_not_match` y, si GCS
+    responde 304, se reutiliza el contenido guardado. Con `ttl` > 0 las
+    entradas recientes se sirven sin consultar a GCS.
+    """
 
-def read_json_file(filename: str) -> Dict:
+    def __init__(self, max_bytes: int, ttl: float = 0.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # nombre -> (generación, contenido, momento de la última validación)
+        self._entradas: "OrderedDict[str, Tuple[int, bytes, float]]" = \
+            OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+    def obtener(self, nombre: str) -> Optional[Tuple[int, bytes, float]]:
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+            if entrada is not None:
+                self._entradas.move_to_end(nombre)
+            return entrada
+
+    def vigente(self, entrada: Tuple[int, bytes, float]) -> bool:
+        return self.ttl > 0 and time.monotonic() - entrada[2] < self.ttl
+
+    def guardar(self, nombre: str, generacion: Optional[int],
+                contenido: bytes):
+        if generacion is None or len(contenido) > self.max_bytes:
+            self.invalidar(nombre)
+            return
+        with self._lock:
+            anterior = self._entradas.pop(nombre, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[1])
+            self._entradas[nombre] = (generacion, contenido, time.monotonic())
+            self.bytes += len(contenido)
+            while self.bytes > self.max_bytes:
+                _, (_, viejo, _) = self._entradas.popitem(last=False)
+                self.bytes -= len(viejo)
+
+    def invalidar(self, nombre: Optional[str] = None):
+        with self._lock:
+            if nombre is None:
+                self._entradas.clear()
+                self.bytes = 0
+                return
+            anterior = self._entradas.pop(nombre, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[1])
+
+
+# Formato de escritura por defecto de write_json_file
+JSON_COMPACTO = os.getenv("STORAGE_JSON_COMPACTO", "false").lower() in (
+    "1", "true", "yes", "on")
+JSON_GZIP = os.getenv("STORAGE_JSON_GZIP", "false").lower() in (
+    "1", "true", "yes", "on")
+
+# Caché de lectura opcional (STORAGE_CACHE=false para desactivarla)
+cache_lecturas = None
+if os.getenv("STORAGE_CACHE", "true").lower() in ("1", "true", "yes", "on"):
+    cache_lecturas = _CacheLecturas(
+        max_bytes=int(float(os.getenv("STORAGE_CACHE_MAX_MB", "32")) *
+                      1024 * 1024),
+        ttl=float(os.getenv("STORAGE_CACHE_TTL", "0")))
+
+
+def read_json_file_with_generation(filename: str) -> Tuple[Dict, int]:
     """
-    Lee un archivo JSON desde Google Cloud Storage.
+    Lee un archivo JSON junto con su generación en GCS.
 
     Args:
         filename: Nombre del archivo a leer
 
     Returns:
-        Dict con el contenido del archivo o {} si no existe
+        Tuple[Dict, int]: Contenido ({} si no existe) y generación (0 si no
+        existe), lista para usar como `if_generation_match`
 
     Raises:
         Exception: Si hay error en la lectura del archivo
@@ -110,61 +214,205 @@ def read_json_file(filename: str) -> Dict:
         if not filename.endswith('.json'):
             filename += '.json'
 
-        blob = bucket.blob(filename)
-
-        if not blob.exists():
+        blob = _bucket().blob(filename)
+        entrada = cache_lecturas.obtener(filename) if cache_lecturas else None
+
+        if entrada is not None and cache_lecturas.vigente(entrada):
+            return json.loads(entrada[1]), entrada[0]
+
+        # Una sola petición: el 404 equivale a un archivo vacío y, si hay
+        # copia en caché, solo se descarga cuando cambió la generación
+        try:
+            with gcs_operation_seconds.time(operation="read"):
+                if entrada is not None:
+                    content = blob.download_as_bytes(
+                        if_generation_not_match=entrada[0])
+                else:
+                    content = blob.download_as_bytes()
+        except NotModified:
+            cache_lecturas.guardar(filename, entrada[0], entrada[1])
+            return json.loads(entrada[1]), entrada[0]
+        except NotFound:
+            if cache_lecturas:
+                cache_lecturas.invalidar(filename)
             logger.info(
                 f"📄 Archivo {filename} no existe, creando estructura vacía"
             )
-            return {}
-
-        content = blob.download_as_text()
-        data = json.loads(content)
+            return {}, 0
+
+        if cache_lecturas:
+            cache_lecturas.guardar(filename, blob.generation, content)
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"❌ Error decodificando JSON en {filename}: {e}")
+            return {}, blob.generation or 0
         logger.info(f"✅ Archivo {filename} leído exitosamente")
-        return data
+        return data, blob.generation or 0
 
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Error decodificando JSON en {filename}: {e}")
-        return {}
     except Exception as e:
         logger.error(f"❌ Error leyendo archivo {filename}: {e}")
         raise Exception(f"Error leyendo archivo {filename}: {str(e)}")
 
 
-def write_json_file(filename: str, data: Dict) -> bool:
+def read_json_file(filename: str) -> Dict:
+    """
+    Lee un archivo JSON desde Google Cloud Storage.
+
+    Args:
+        filename: Nombre del archivo a leer
+
+    Returns:
+        Dict con el contenido del archivo o {} si no existe
+
+    Raises:
+        Exception: Si hay error en la lectura del archivo
+    """
+    return read_json_file_with_generation(filename)[0]
+
+
+def _serializar(data: Dict, compact: bool, comprimir: bool) -> bytes:
+    if compact:
+        texto = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    else:
+        texto = json.dumps(data, indent=2, ensure_ascii=False)
+    contenido = texto.encode("utf-8")
+    return gzip.compress(contenido, compresslevel=6) if comprimir \
+        else contenido
+
+
+def write_json_file(filename: str, data: Dict,
+                    compact: Optional[bool] = None,
+                    gzip_encoding: Optional[bool] = None,
+                    if_generation_match: Optional[int] = None) -> bool:
     """
     Escribe un archivo JSON a Google Cloud Storage.
 
     Args:
         filename: Nombre del archivo a escribir
         data: Datos a escribir en formato dict
+        compact: JSON sin espacios (por defecto STORAGE_JSON_COMPACTO)
+        gzip_encoding: Subir comprimido con `Content-Encoding: gzip`; GCS lo
+            descomprime al leer (por defecto STORAGE_JSON_GZIP)
+        if_generation_match: Escribir solo si el archivo sigue en esa
+            generación (0 = solo si no existe)
 
     Returns:
         bool: True si se escribió exitosamente
 
     Raises:
+        PreconditionFailed: Si el archivo cambió desde if_generation_match
         Exception: Si hay error en la escritura
     """
     try:
         if not filename.endswith('.json'):
             filename += '.json'
 
-        blob = bucket.blob(filename)
-        json_string = json.dumps(data, indent=2, ensure_ascii=False)
-
-        blob.upload_from_string(
-            json_string,
-            content_type="application/json; charset=utf-8"
-        )
+        compact = JSON_COMPACTO if compact is None else compact
+        gzip_encoding = JSON_GZIP if gzip_encoding is None else gzip_encoding
+
+        blob = _bucket().blob(filename)
+        contenido = _serializar(data, compact, gzip_encoding)
+        if gzip_encoding:
+            blob.content_encoding = "gzip"
+
+        if cache_lecturas:
+            cache_lecturas.invalidar(filename)
+        with gcs_operation_seconds.time(operation="write"):
+            blob.upload_from_string(
+                contenido,
+                content_type="application/json; charset=utf-8",
+                if_generation_match=if_generation_match
+            )
 
         logger.info(f"✅ Archivo {filename} guardado exitosamente")
         return True
 
+    except PreconditionFailed:
+        logger.warning(f"⚠️ Archivo {filename} modificado por otra instancia")
+        raise
     except Exception as e:
         logger.error(f"❌ Error escribiendo archivo {filename}: {e}")
         raise Exception(f"Error escribiendo archivo {filename}: {str(e)}")
 
 
+def update_json_file(filename: str, funcion: Callable[[Dict], Dict],
+                     max_intentos: int = 5, **opciones) -> Dict:
+    """
+    Lee, modifica y escribe un archivo JSON con concurrencia optimista.
+
+    La escritura exige que el archivo siga en la generación leída; si otra
+    instancia lo modificó entre medio, se vuelve a leer y se reaplica
+    `funcion` sobre el contenido nuevo.
+
+    Args:
+        filename: Nombre del archivo a actualizar
+        funcion: Recibe el contenido actual y devuelve el nuevo
+        max_intentos: Intentos antes de rendirse ante conflictos
+        **opciones: compact / gzip_encoding para write_json_file
+
+    Returns:
+        Dict: Contenido escrito
+
+    Raises:
+        PreconditionFailed: Si persisten los conflictos tras max_intentos
+    """
+    for intento in range(1, max_intentos + 1):
+        data, generacion = read_json_file_with_generation(filename)
+        nuevo = funcion(data)
+        try:
+            write_json_file(filename, nuevo, if_generation_match=generacion,
+                            **opciones)
+            return nuevo
+        except PreconditionFailed:
+            if intento == max_intentos:
+                raise
+            # Espera corta con jitter para no chocar otra vez con el mismo
+            # escritor
+            time.sleep(random.uniform(0, 0.05 * 2 ** intento))
+    raise PreconditionFailed(f"Conflicto persistente en {filename}")
+
+
+def iter_file_pages(prefix: Optional[str] = None,
+                    page_size: int = 1000) -> Iterator[List[str]]:
+    """
+    Recorre los nombres de archivos del bucket página a página.
+
+    Cada página se pide a GCS solo cuando se consume, de modo que la memoria
+    no crece con el tamaño del bucket.
+
+    Args:
+        prefix: Prefijo de los nombres a listar (None = todo el bucket)
+        page_size: Nombres por página
+
+    Yields:
+        List[str]: Nombres de una página
+    """
+    paginas = _bucket().list_blobs(prefix=prefix, page_size=page_size).pages
+    while True:
+        with gcs_operation_seconds.time(operation="list"):
+            pagina = next(paginas, None)
+        if pagina is None:
+            return
+        yield [blob.name for blob in pagina]
+
+
+def iter_files(prefix: Optional[str] = None,
+               page_size: int = 1000) -> Iterator[str]:
+    """
+    Generador de nombres de archivos del bucket, con filtro por prefijo.
+
+    Args:
+        prefix: Prefijo de los nombres a listar (None = todo el bucket)
+        page_size: Nombres pedidos a GCS por página
+
+    Yields:
+        str: Nombre de cada archivo
+    """
+    for pagina in iter_file_pages(prefix, page_size):
+        yield from pagina
+
+
 def list_all_files() -> List[str]:
     """
     Lista todos los archivos en el bucket.
@@ -173,8 +421,7 @@ def list_all_files() -> List[str]:
         List[str]: Lista de nombres de archivos
     """
     try:
-        init_storage()
-        files = [blob.name for blob in bucket.list_blobs()]
+        files = list(iter_files())
         logger.info(f"📋 Listados {len(files)} archivos en el bucket")
         return files
     except Exception as e:
@@ -182,6 +429,98 @@ def list_all_files() -> List[str]:
         return []
 
 
+def _ejecutor() -> ThreadPoolExecutor:
+    global _pool_hilos
+    with _pool_lock:
+        if _pool_hilos is None:
+            _pool_hilos = ThreadPoolExecutor(
+                max_workers=STORAGE_WORKERS, thread_name_prefix="gcs")
+        return _pool_hilos
+
+
+def _en_paralelo(funcion: Callable, claves: List[str],
+                 argumentos: Iterable[Tuple]) -> Dict[str, Dict]:
+    """Ejecutar funcion(*args) por archivo y recoger resultado o error"""
+    futuros = [_ejecutor().submit(funcion, *args) for args in argumentos]
+    resultados = {}
+    for clave, futuro in zip(claves, futuros):
+        try:
+            resultados[clave] = {"ok": True, "data": futuro.result(),
+                                 "error": None}
+        except Exception as e:
+            resultados[clave] = {"ok": False, "data": None, "error": str(e)}
+    return resultados
+
+
+def read_many(filenames: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Lee varios archivos JSON en paralelo.
+
+    Args:
+        filenames: Nombres de los archivos a leer
+
+    Returns:
+        Dict por archivo con "ok", "data" (contenido o {} si no existe) y
+        "error"
+    """
+    filenames = list(filenames)
+    return _en_paralelo(read_json_file, filenames,
+                        ((f,) for f in filenames))
+
+
+def write_many(files: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Escribe varios archivos JSON en paralelo.
+
+    Args:
+        files: Contenido a escribir por nombre de archivo
+
+    Returns:
+        Dict por archivo con "ok", "data" y "error"
+    """
+    return _en_paralelo(write_json_file, list(files), files.items())
+
+
+def delete_many(filenames: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Elimina varios archivos en paralelo.
+
+    Args:
+        filenames: Nombres de los archivos a eliminar
+
+    Returns:
+        Dict por archivo con "ok" (False si no existía o falló), "data" y
+        "error"
+    """
+    filenames = list(filenames)
+    resultados = _en_paralelo(delete_file, filenames,
+                              ((f,) for f in filenames))
+    for resultado in resultados.values():
+        resultado["ok"] = bool(resultado["data"])
+    return resultados
+
+
+def read_prefix(prefix: str,
+                page_size: int = 100) -> Iterator[Tuple[str, Dict]]:
+    """
+    Lee todos los archivos JSON bajo un prefijo (p. ej. los de una finca).
+
+    Cada página del listado se descarga en paralelo mientras se recorre, así
+    que solo hay una página de documentos en memoria a la vez.
+
+    Yields:
+        Tuple[str, Dict]: Nombre y contenido de cada archivo legible
+    """
+    for pagina in iter_file_pages(prefix, page_size):
+        nombres = [n for n in pagina if n.endswith('.json')]
+        for nombre, resultado in read_many(nombres).items():
+            if resultado["ok"]:
+                yield nombre, resultado["data"]
+            else:
+                logger.error(f"❌ Error leyendo {nombre}: "
+                             f"{resultado['error']}")
+
+
 def file_exists(filename: str) -> bool:
     """
     Verifica si un archivo existe en el bucket.
@@ -195,8 +534,9 @@ def file_exists(filename: str) -> bool:
     try:
         if not filename.endswith('.json'):
             filename += '.json'
-        blob = bucket.blob(filename)
-        exists = blob.exists()
+        blob = _bucket().blob(filename)
+        with gcs_operation_seconds.time(operation="exists"):
+            exists = blob.exists()
         status = 'existe' if exists else 'no existe'
         logger.info(f"🔍 Archivo {filename} {status}")
         return exists
@@ -219,13 +559,16 @@ def delete_file(filename: str) -> bool:
         if not filename.endswith('.json'):
             filename += '.json'
 
-        blob = bucket.blob(filename)
+        blob = _bucket().blob(filename)
 
-        if not blob.exists():
+        if cache_lecturas:
+            cache_lecturas.invalidar(filename)
+        try:
+            with gcs_operation_seconds.time(operation="delete"):
+                blob.delete()
+        except NotFound:
             logger.warning(f"⚠️ Archivo {filename} no existe para eliminar")
             return False
-
-        blob.delete()
         logger.info(f"🗑️ Archivo {filename} eliminado exitosamente")
         return True
 
@@ -0,0 +1,378 @@
+"""
+Trabajos asíncronos de predicción por lotes: el cliente envía la carga,
+recibe un id y consulta el progreso mientras los resultados se escriben en
+el bucket por partes
+"""
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.ejecutores import ColaLlenaError, ejecutor_inferencia, ejecutor_io
+from app.metrics import predict_stage_seconds
+from app.solver import CAMPOS_RESULTADO, fila_resultado
+from app.stats import stats_manager
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS = list(CAMPOS_RESULTADO) + ["Iteraciones", "Convergio"]
+TERMINADOS = ("completado", "fallido", "interrumpido")
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def job_id_valido(job_id: str) -> bool:
+    """Los ids se usan en nombres de objetos: solo hex de uuid4"""
+    return bool(_JOB_ID.match(job_id))
+
+
+def _storage():
+    # app.storage importa google-api-core: solo al escribir el primer trabajo
+    from app import storage
+    return storage
+
+
+def parte_columnar(job_id: str, numero: int, finca: Optional[str],
+                   indices: Sequence[int],
+                   entradas: Sequence[np.ndarray],
+                   solucion: Optional[Dict[str, np.ndarray]],
+                   error: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Serializar una parte en columnas: una lista por campo en lugar de un
+    objeto por fila (mucho menos JSON para miles de filas). Las filas con
+    error tienen null en todas las columnas y el mensaje en `errores`.
+    """
+    n = len(indices)
+    resultados: Dict[str, List] = {c: [None] * n for c in COLUMNAS}
+    errores: List[Optional[str]] = [error] * n
+    if solucion is not None:
+        for fila in range(n):
+            try:
+                resultado = fila_resultado(solucion, fila)
+            except Exception as e:
+                errores[fila] = str(e)
+                continue
+            for columna in COLUMNAS:
+                resultados[columna][fila] = resultado[columna]
+    return {
+        "job_id": job_id,
+        "parte": numero,
+        "finca": finca,
+        "filas": n,
+        "indices": [int(i) for i in indices],
+        "entradas": {
+            "AnimalesM": [float(v) for v in entradas[0]],
+            "Hectareas": [float(v) for v in entradas[1]],
+            "Piscinas": [int(v) for v in entradas[2]]
+        },
+        "resultados": resultados,
+        "errores": errores
+    }
+
+
+class _Trabajo:
+    __slots__ = ("id", "por_finca", "invalidos", "total", "procesadas",
+                 "exitosas", "fallidas", "partes", "estado", "error",
+                 "creado", "actualizado", "escritura")
+
+    def __init__(self, total: int,
+                 por_finca: Dict[str, Tuple[List[int], List[np.ndarray]]],
+                 invalidos: Dict[int, str]):
+        self.id = uuid.uuid4().hex
+        self.por_finca = por_finca
+        self.invalidos = invalidos
+        self.total = total
+        self.procesadas = 0
+        self.exitosas = 0
+        self.fallidas = 0
+        self.partes: List[Dict[str, Any]] = []
+        self.estado = "en_cola"
+        self.error: Optional[str] = None
+        self.creado = time.time()
+        self.actualizado = self.creado
+        self.escritura: Optional[asyncio.Lock] = None
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.estado,
+            "total": self.total,
+            "processed": self.procesadas,
+            "successful": self.exitosas,
+            "failed": self.fallidas,
+            "progress": round(self.procesadas / self.total, 4)
+            if self.total else 1.0,
+            "parts": list(self.partes),
+            "error": self.error,
+            "created": self.creado,
+            "updated": self.actualizado
+        }
+
+
+class TrabajosPrediccion:
+    """
+    Trabajos de predicción ejecutados en segundo plano dentro del event
+    loop del servidor.
+
+    Cada trabajo recorre sus filas por finca en bloques de `bloque` filas;
+    cada bloque se resuelve con `resolver(finca, animales, hectareas,
+    piscinas)` en ejecutor_inferencia y se escribe como una parte JSON
+    columnar en `{prefijo}/{job_id}/parte-NNNNN.json`, de modo que las
+    partes terminadas pueden descargarse mientras sigue el cálculo. El
+    resumen se guarda también en `{prefijo}/{job_id}/estado.json` tras cada
+    parte para poder consultarlo desde cualquier instancia.
+
+    Mientras el trabajo no termina, `updated` se renueva cada `latido`
+    segundos. Si la instancia se pierde, el trabajo deja de latir y quien
+    lea su estado del bucket lo ve como fallido pasados `caducidad`
+    segundos.
+
+    Solo `concurrencia` trabajos se ejecutan a la vez; los bloques ceden
+    ante la carga interactiva: pasan por `admision` (ControlAdmision) sin
+    ocupar su cola y, si el pool de inferencia está lleno, se reintenta
+    tras una espera en lugar de fallar.
+    """
+
+    def __init__(self, resolver: Callable, prefijo: str = "predicciones",
+                 bloque: int = 2000, concurrencia: int = 1,
+                 max_cola: int = 10, max_filas: int = 50000,
+                 max_trabajos_guardados: int = 100,
+                 espera_saturado: float = 0.5, latido: float = 15.0,
+                 caducidad: float = 120.0, admision=None):
+        self.resolver = resolver
+        self.prefijo = prefijo.strip("/")
+        self.bloque = bloque
+        self.concurrencia = concurrencia
+        self.max_cola = max_cola
+        self.max_filas = max_filas
+        self.max_trabajos_guardados = max_trabajos_guardados
+        self.espera_saturado = espera_saturado
+        self.latido = latido
+        self.caducidad = caducidad
+        self.admision = admision
+        self._trabajos: "OrderedDict[str, _Trabajo]" = OrderedDict()
+        self._tareas = set()
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+    def archivo(self, job_id: str, nombre: str) -> str:
+        return f"{self.prefijo}/{job_id}/{nombre}.json"
+
+    def archivo_parte(self, job_id: str, numero: int) -> str:
+        return self.archivo(job_id, f"parte-{numero:05d}")
+
+    def enviar(self, total: int,
+               por_finca: Dict[str, Tuple[List[int], List[np.ndarray]]],
+               invalidos: Dict[int, str]) -> str:
+        """
+        Aceptar un trabajo y programarlo; devuelve su id.
+
+        Args:
+            total: Número de filas enviadas
+            por_finca: Para cada finca, índices originales de sus filas y
+                los arreglos [AnimalesM, Hectareas, Piscinas]
+            invalidos: Mensaje de error de las filas que no pasaron la
+                validación, por índice original
+
+        Raises:
+            ColaLlenaError: Si ya hay demasiados trabajos sin terminar
+        """
+        pendientes = sum(1 for t in self._trabajos.values()
+                         if t.estado not in TERMINADOS)
+        if pendientes >= self.concurrencia + self.max_cola:
+            raise ColaLlenaError(
+                "Hay demasiados trabajos de predicción en curso, "
+                "inténtalo más tarde")
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrencia)
+
+        trabajo = _Trabajo(total, por_finca, invalidos)
+        self._trabajos[trabajo.id] = trabajo
+        self._podar()
+        tarea = asyncio.get_running_loop().create_task(
+            self._ejecutar(trabajo), name=f"trabajo-{trabajo.id}")
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return trabajo.id
+
+    def _podar(self):
+        """Olvidar los trabajos terminados más antiguos (siguen en GCS)"""
+        while len(self._trabajos) > self.max_trabajos_guardados:
+            for job_id, trabajo in self._trabajos.items():
+                if trabajo.estado in TERMINADOS:
+                    del self._trabajos[job_id]
+                    break
+            else:
+                return
+
+    def estado(self, job_id: str) -> Optional[Dict[str, Any]]:
+        trabajo = self._trabajos.get(job_id)
+        return trabajo.resumen() if trabajo else None
+
+    async def estado_persistido(self, job_id: str) -> Optional[Dict]:
+        """Estado del trabajo en memoria o, si lo ejecutó otra instancia,
+        el último guardado en el bucket"""
+        estado = self.estado(job_id)
+        if estado is not None:
+            return estado
+        estado = await ejecutor_io.run(_storage().read_json_file,
+                                       self.archivo(job_id, "estado"))
+        if not estado:
+            return None
+        if estado.get("status") not in TERMINADOS and \
+                time.time() - estado.get("updated", 0) > self.caducidad:
+            # La instancia que lo ejecutaba dejó de latir
+            estado["status"] = "fallido"
+            estado["error"] = ("El trabajo dejó de actualizarse: la "
+                               "instancia que lo ejecutaba se perdió")
+        return estado
+
+    async def leer_parte(self, job_id: str, numero: int) -> Optional[Dict]:
+        parte = await ejecutor_io.run(_storage().read_json_file,
+                                      self.archivo_parte(job_id, numero))
+        return parte or None
+
+    def por_estado(self) -> Dict[Tuple, float]:
+        conteo: Dict[Tuple, float] = {}
+        for trabajo in list(self._trabajos.values()):
+            clave = (("status", trabajo.estado),)
+            conteo[clave] = conteo.get(clave, 0) + 1
+        return conteo
+
+    async def detener(self, espera: float = 2.0):
+        """
+        Cancelar los trabajos en curso y esperar como mucho `espera`
+        segundos a que guarden su estado "interrumpido" en el bucket
+        """
+        tareas = list(self._tareas)
+        for tarea in tareas:
+            tarea.cancel()
+        if tareas:
+            await asyncio.wait(tareas, timeout=espera)
+
+    async def _reintentar(self, ejecutor, *args):
+        """Ejecutar en el pool esperando mientras esté saturado"""
+        while True:
+            try:
+                return await ejecutor.run(*args)
+            except ColaLlenaError:
+                await asyncio.sleep(self.espera_saturado)
+
+    async def _guardar_parte(self, trabajo: _Trabajo, finca: Optional[str],
+                             contenido: Dict[str, Any], exitosas: int):
+        numero = contenido["parte"]
+        nombre = self.archivo_parte(trabajo.id, numero)
+        await self._reintentar(ejecutor_io, _storage().write_json_file,
+                               nombre, contenido, True)
+        filas = contenido["filas"]
+        trabajo.partes.append({"part": numero, "file": nombre,
+                               "finca": finca, "rows": filas})
+        trabajo.procesadas += filas
+        trabajo.exitosas += exitosas
+        trabajo.fallidas += filas - exitosas
+        trabajo.actualizado = time.time()
+        stats_manager.record_batch({finca: exitosas} if finca else {},
+                                   filas - exitosas)
+        await self._guardar_estado(trabajo)
+
+    async def _guardar_estado(self, trabajo: _Trabajo):
+        if trabajo.escritura is None:
+            trabajo.escritura = asyncio.Lock()
+        # En orden: un latido lento no debe pisar un estado más reciente
+        async with trabajo.escritura:
+            await self._reintentar(ejecutor_io, _storage().write_json_file,
+                                   self.archivo(trabajo.id, "estado"),
+                                   trabajo.resumen(), True)
+
+    async def _latir(self, trabajo: _Trabajo):
+        """Renovar `updated` en el bucket mientras el trabajo siga vivo"""
+        while True:
+            await asyncio.sleep(self.latido)
+            trabajo.actualizado = time.time()
+            try:
+                await self._guardar_estado(trabajo)
+            except Exception as e:
+                logger.warning(f"⚠️ Latido del trabajo {trabajo.id} "
+                               f"fallido: {e}")
+
+    async def _ejecutar(self, trabajo: _Trabajo):
+        latido = asyncio.get_running_loop().create_task(
+            self._latir(trabajo), name=f"latido-{trabajo.id}")
+        interrupcion = None
+        try:
+            # Visible desde otras instancias también mientras espera turno
+            await self._guardar_estado(trabajo)
+            async with self._semaforo:
+                trabajo.estado = "procesando"
+                trabajo.actualizado = time.time()
+                await self._procesar(trabajo)
+                trabajo.estado = "completado"
+        except asyncio.CancelledError as e:
+            # Se relanza después de guardar el estado: si no, el bucket
+            # seguiría diciendo "procesando" tras el reinicio
+            interrupcion = e
+            trabajo.estado = "interrumpido"
+            trabajo.error = "El servidor se detuvo antes de terminar"
+        except Exception as e:
+            logger.error(f"❌ Trabajo de predicción {trabajo.id} "
+                         f"fallido: {e}")
+            trabajo.estado = "fallido"
+            trabajo.error = str(e)
+        finally:
+            latido.cancel()
+            trabajo.por_finca = {}
+            trabajo.invalidos = {}
+            trabajo.actualizado = time.time()
+        try:
+            await self._guardar_estado(trabajo)
+        except Exception as e:
+            logger.error(f"❌ No se pudo guardar el estado del trabajo "
+                         f"{trabajo.id}: {e}")
+        if interrupcion is not None:
+            raise interrupcion
+
+    async def _resolver_bloque(self, finca: str,
+                               entradas: Sequence[np.ndarray]):
+        if self.admision is None:
+            return await self._reintentar(ejecutor_inferencia,
+                                          self.resolver, finca, *entradas)
+        async with self.admision.admitir_en_fondo(finca,
+                                                  self.espera_saturado):
+            return await self._reintentar(ejecutor_inferencia,
+                                          self.resolver, finca, *entradas)
+
+    async def _procesar(self, trabajo: _Trabajo):
+        numero = 0
+        if trabajo.invalidos:
+            indices = sorted(trabajo.invalidos)
+            contenido = parte_columnar(
+                trabajo.id, numero, None, indices, [[], [], []], None)
+            contenido["entradas"] = None
+            contenido["errores"] = [trabajo.invalidos[i] for i in indices]
+            await self._guardar_parte(trabajo, None, contenido, 0)
+            numero += 1
+
+        for finca, (indices, columnas) in trabajo.por_finca.items():
+            for desde in range(0, len(indices), self.bloque):
+                hasta = min(desde + self.bloque, len(indices))
+                entradas = [c[desde:hasta] for c in columnas]
+                solucion, error = None, None
+                try:
+                    with predict_stage_seconds.time(finca=finca,
+                                                    stage="job_chunk"):
+                        solucion = await self._resolver_bloque(finca,
+                                                               entradas)
+                except Exception as e:
+                    # Como en /predict/batch: el bloque falla, el trabajo no
+                    error = str(e)
+                contenido = parte_columnar(
+                    trabajo.id, numero, finca, indices[desde:hasta],
+                    entradas, solucion, error)
+                exitosas = sum(e is None for e in contenido["errores"])
+                await self._guardar_parte(trabajo, finca, contenido,
+                                          exitosas)
+                numero += 1
@@ -0,0 +1,96 @@
+"""
+Prueba de carga con tráfico concurrente mezclado de /predict y /stats.
+
+Uso:
+    python benchmarks/carga_mixta.py --url http://localhost:8080 \
+        --concurrencia 40 --duracion 20 --proporcion-predict 0.5
+
+Compara la latencia de cola (p95/p99) de ambos endpoints ejecutando el
+servidor con INFERENCIA_EJECUTOR=inline (todo en el event loop) y con
+INFERENCIA_EJECUTOR=thread.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+FINCAS = ["CAMANOVILLO", "EXCANCRIGRU", "FERTIAGRO", "GROVITAL", "SUFAAZA",
+          "TIERRAVID"]
+
+
+def percentiles(latencias):
+    if not latencias:
+        return {"n": 0}
+    ms = np.array(latencias) * 1000
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2)
+    }
+
+
+def trabajador(args, fin, latencias, errores, lock):
+    sesion = requests.Session()
+    rng = random.Random()
+    while time.monotonic() < fin:
+        if rng.random() < args.proporcion_predict:
+            endpoint = "/predict"
+            payload = {
+                "finca": rng.choice(FINCAS),
+                "AnimalesM": rng.uniform(5, 25),
+                "Hectareas": rng.uniform(1, 10),
+                "Piscinas": rng.randint(1, 20)
+            }
+            inicio = time.perf_counter()
+            r = sesion.post(args.url + endpoint, json=payload, timeout=300)
+        else:
+            endpoint = "/stats"
+            inicio = time.perf_counter()
+            r = sesion.get(args.url + endpoint, timeout=300)
+        duracion = time.perf_counter() - inicio
+        with lock:
+            if r.status_code == 200:
+                latencias[endpoint].append(duracion)
+            else:
+                errores[endpoint] = errores.get(endpoint, 0) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrencia", type=int, default=40)
+    parser.add_argument("--duracion", type=float, default=20.0)
+    parser.add_argument("--proporcion-predict", type=float, default=0.5)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    latencias = {"/predict": [], "/stats": []}
+    errores = {}
+    lock = threading.Lock()
+    fin = time.monotonic() + args.duracion
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        for _ in range(args.concurrencia):
+            pool.submit(trabajador, args, fin, latencias, errores, lock)
+
+    resultado = {
+        "concurrencia": args.concurrencia,
+        "duracion_s": args.duracion,
+        "endpoints": {e: percentiles(v) for e, v in latencias.items()},
+        "errores": errores
+    }
+    texto = json.dumps(resultado, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmarks sin conexión del servidor completo.
+
+Levanta la aplicación real (main.app) con uvicorn contra un sustituto local
+de GCS, modelos sintéticos, una tabla de rendimiento servida por HTTP local
+y un SMTP local, y mide throughput y latencias p50/p95/p99 de cada
+escenario. Los resultados se escriben en JSON para comparar ejecuciones.
+
+Uso:
+    python benchmarks/escenarios.py --salida resultados.json
+    python benchmarks/escenarios.py --latencia-gcs-ms 30 --duracion 5 \
+        --escenarios predict,predict_concurrente
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import fake_gcs  # noqa: E402
+import sinteticos  # noqa: E402
+from carga_mixta import percentiles  # noqa: E402
+
+ESCENARIOS = ("predict", "predict_concurrente", "predict_repetido", "stats",
+              "send_invoice")
+
+# PDF mínimo para /send-invoice (~20 KB)
+PDF = b"%PDF-1.4\n" + os.urandom(20 * 1024) + b"\n%%EOF\n"
+
+
+def preparar_entorno(directorio: str, latencia_gcs_ms: float):
+    """Instalar los sustitutos y definir las variables de entorno"""
+    fake_gcs.instalar(latencia_ms=latencia_gcs_ms)
+    entorno = sinteticos.publicar_modelos()
+    _, puerto_smtp = sinteticos.servir_smtp()
+    entorno.update({
+        "RENDIMIENTO_PATH": sinteticos.servir_rendimiento(directorio),
+        "RENDIMIENTO_CACHE_PATH": f"{directorio}/rendimiento_cache.json",
+        "GCS_BUCKET_NAME": "modelos-benchmark",
+        "GOOGLE_CLOUD_PROJECT_ID": "benchmark",
+        "EMAIL_USER": "benchmark@example.com",
+        "EMAIL_PASS": "benchmark",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(puerto_smtp),
+        "SMTP_STARTTLS": "false",
+        "STATS_FILE": f"{directorio}/app_stats.json",
+    })
+    os.environ.update(entorno)
+
+
+def arrancar_servidor():
+    """Importar main y servirlo con uvicorn en un hilo; devuelve la URL"""
+    import socket
+    import uvicorn
+
+    os.chdir(RAIZ)  # static/ y templates/ son rutas relativas
+    import main
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    servidor = uvicorn.Server(uvicorn.Config(
+        main.app, host="127.0.0.1", port=puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{puerto}"
+
+
+def _solicitud(escenario: str, url: str, sesion: requests.Session,
+               rng: random.Random):
+    if escenario in ("predict", "predict_concurrente"):
+        return sesion.post(url + "/predict", json={
+            "finca": rng.choice(sinteticos.FINCAS),
+            "AnimalesM": round(rng.uniform(5, 25), 3),
+            "Hectareas": round(rng.uniform(1, 10), 3),
+            "Piscinas": rng.randint(1, 20)
+        }, timeout=300)
+    if escenario == "predict_repetido":
+        return sesion.post(url + "/predict", json={
+            "finca": "GROVITAL", "AnimalesM": 12.0, "Hectareas": 5.0,
+            "Piscinas": 3
+        }, timeout=300)
+    if escenario == "stats":
+        return sesion.get(url + "/stats", timeout=300)
+    if escenario == "send_invoice":
+        return sesion.post(url + "/send-invoice", json={
+            "recipient": "cliente@example.com",
+            "pdf_base64": base64.b64encode(PDF).decode(),
+            "subject": "Guía",
+            "html_body": "<p>Guía adjunta</p>"
+        }, timeout=300)
+    raise ValueError(f"Escenario desconocido: {escenario}")
+
+
+def ejecutar_escenario(escenario: str, url: str, concurrencia: int,
+                       duracion: float):
+    latencias, errores = [], {}
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+
+    def trabajador(semilla):
+        sesion, rng = requests.Session(), random.Random(semilla)
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                r = _solicitud(escenario, url, sesion, rng)
+                codigo = r.status_code
+            except requests.RequestException as e:
+                codigo = type(e).__name__
+            transcurrido = time.perf_counter() - inicio
+            with lock:
+                if codigo in (200, 202):
+                    latencias.append(transcurrido)
+                else:
+                    errores[str(codigo)] = errores.get(str(codigo), 0) + 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(trabajador, range(concurrencia)))
+    total = time.perf_counter() - inicio
+
+    resultado = percentiles(latencias)
+    resultado.update({
+        "concurrencia": concurrencia,
+        "throughput_rps": round(len(latencias) / total, 2),
+        "errores": errores
+    })
+    return resultado
+
+
+def _commit_actual() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "desconocido"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--duracion", type=float, default=10.0,
+                        help="Segundos por escenario")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--latencia-gcs-ms", type=float, default=0.0,
+                        help="Latencia simulada por llamada a GCS")
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="terrawa-bench-")
+    preparar_entorno(directorio, args.latencia_gcs_ms)
+    url = arrancar_servidor()
+
+    resultados = {}
+    for escenario in args.escenarios.split(","):
+        concurrencia = 1 if escenario == "predict" else args.concurrencia
+        # Una pasada corta de calentamiento (carga de modelos, conexiones)
+        ejecutar_escenario(escenario, url, concurrencia, 1.0)
+        resultados[escenario] = ejecutar_escenario(
+            escenario, url, concurrencia, args.duracion)
+        print(f"{escenario}: {json.dumps(resultados[escenario])}",
+              file=sys.stderr)
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "parametros": vars(args),
+        "configuracion": {k: os.environ.get(k) for k in (
+            "PREDICT_SOLVER", "INFERENCIA_EJECUTOR", "INFERENCIA_WORKERS",
+            "PREDICT_CACHE")},
+        "llamadas_gcs": dict(fake_gcs.llamadas),
+        "escenarios": resultados
+    }
+    texto = json.dumps(informe, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Sustituto local en memoria de la parte de `google.cloud.storage` que usa el
+servidor (Client, Bucket, Blob), con latencia simulada opcional.
+
+Uso:
+    import fake_gcs
+    fake_gcs.instalar(latencia_ms=20)   # antes de importar main/app.storage
+    fake_gcs.subir("bucket", "modelos/x.pkl", datos)
+"""
+import gzip
+import itertools
+import sys
+import threading
+import time
+import types
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from google.api_core.exceptions import NotFound, NotModified, \
+        PreconditionFailed
+except ImportError:  # pragma: no cover - entorno sin google-api-core
+    class NotFound(Exception):
+        code = 404
+
+    class NotModified(Exception):
+        code = 304
+
+    class PreconditionFailed(Exception):
+        code = 412
+
+_lock = threading.Lock()
+_generaciones = itertools.count(int(time.time() * 1_000_000))
+# bucket -> nombre -> (generación, contenido, metadatos)
+_objetos: Dict[str, Dict[str, Tuple[int, bytes, Dict]]] = {}
+# (bucket, nombre, generación) -> contenido de versiones anteriores
+_historial: Dict[Tuple[str, str, int], bytes] = {}
+_latencia = 0.0
+llamadas = {"metadatos": 0, "descargas": 0, "subidas": 0, "borrados": 0,
+            "listados": 0}
+
+
+def _esperar(tipo: str):
+    llamadas[tipo] += 1
+    if _latencia:
+        time.sleep(_latencia)
+
+
+def subir(bucket: str, nombre: str, contenido: bytes,
+          content_type: Optional[str] = None) -> int:
+    """Crear o reemplazar un objeto directamente (sin latencia)"""
+    with _lock:
+        generacion = next(_generaciones)
+        _objetos.setdefault(bucket, {})[nombre] = (
+            generacion, contenido, {"content_type": content_type})
+        _historial[(bucket, nombre, generacion)] = contenido
+        return generacion
+
+
+def limpiar():
+    with _lock:
+        _objetos.clear()
+        _historial.clear()
+    for tipo in llamadas:
+        llamadas[tipo] = 0
+
+
+class Blob:
+    def __init__(self, name: str, bucket: "Bucket",
+                 generation: Optional[int] = None):
+        self.name = name
+        self.bucket = bucket
+        self._generacion_fija = generation
+        self.generation = generation
+        self.size = None
+        self.content_type = None
+        self.content_encoding = None
+        self.cache_control = None
+
+    def _leer(self) -> Tuple[int, bytes, Dict]:
+        with _lock:
+            actual = _objetos.get(self.bucket.name, {}).get(self.name)
+            if self._generacion_fija is not None:
+                contenido = _historial.get(
+                    (self.bucket.name, self.name, self._generacion_fija))
+                if contenido is None:
+                    raise NotFound(f"No such object: {self.name}#"
+                                   f"{self._generacion_fija}")
+                metadatos = actual[2] if actual else {}
+                return self._generacion_fija, contenido, metadatos
+            if actual is None:
+                raise NotFound(f"No such object: {self.bucket.name}/"
+                               f"{self.name}")
+            return actual
+
+    def _actualizar(self, generacion: int, contenido: bytes, metadatos: Dict):
+        self.generation = generacion
+        self.size = len(contenido)
+        self.content_type = metadatos.get("content_type")
+        self.content_encoding = metadatos.get("content_encoding")
+
+    def exists(self, **kwargs) -> bool:
+        _esperar("metadatos")
+        try:
+            self._leer()
+            return True
+        except NotFound:
+            return False
+
+    def reload(self, **kwargs):
+        _esperar("metadatos")
+        self._actualizar(*self._leer())
+
+    def download_as_bytes(self, if_generation_not_match=None,
+                          if_generation_match=None, raw_download=False,
+                          **kwargs) -> bytes:
+        _esperar("descargas")
+        generacion, contenido, metadatos = self._leer()
+        if (if_generation_not_match is not None and
+                generacion == if_generation_not_match):
+            raise NotModified("304 Not Modified")
+        if (if_generation_match is not None and
+                generacion != if_generation_match):
+            raise PreconditionFailed("412 Precondition Failed")
+        self._actualizar(generacion, contenido, metadatos)
+        if metadatos.get("content_encoding") == "gzip" and not raw_download:
+            return gzip.decompress(contenido)
+        return contenido
+
+    def download_as_text(self, encoding: str = "utf-8", **kwargs) -> str:
+        return self.download_as_bytes(**kwargs).decode(encoding)
+
+    def download_to_filename(self, filename: str, **kwargs):
+        contenido = self.download_as_bytes(**kwargs)
+        with open(filename, "wb") as f:
+            f.write(contenido)
+
+    def download_to_file(self, file_obj, **kwargs):
+        file_obj.write(self.download_as_bytes(**kwargs))
+
+    def upload_from_string(self, data, content_type=None,
+                           if_generation_match=None, **kwargs):
+        _esperar("subidas")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with _lock:
+            objetos = _objetos.setdefault(self.bucket.name, {})
+            actual = objetos.get(self.name)
+            if if_generation_match is not None:
+                generacion_actual = actual[0] if actual else 0
+                if generacion_actual != if_generation_match:
+                    raise PreconditionFailed("412 Precondition Failed")
+            generacion = next(_generaciones)
+            metadatos = {"content_type": content_type,
+                         "content_encoding": self.content_encoding}
+            objetos[self.name] = (generacion, bytes(data), metadatos)
+            _historial[(self.bucket.name, self.name, generacion)] = \
+                bytes(data)
+        self._actualizar(generacion, bytes(data), metadatos)
+
+    def upload_from_filename(self, filename: str, content_type=None,
+                             **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type=content_type,
+                                    **kwargs)
+
+    def upload_from_file(self, file_obj, content_type=None, **kwargs):
+        self.upload_from_string(file_obj.read(), content_type=content_type,
+                                **kwargs)
+
+    def delete(self, if_generation_match=None, **kwargs):
+        _esperar("borrados")
+        with _lock:
+            objetos = _objetos.get(self.bucket.name, {})
+            actual = objetos.get(self.name)
+            if actual is None:
+                raise NotFound(f"No such object: {self.bucket.name}/"
+                               f"{self.name}")
+            if (if_generation_match is not None and
+                    actual[0] != if_generation_match):
+                raise PreconditionFailed("412 Precondition Failed")
+            del objetos[self.name]
+
+
+class _Pagina(list):
+    pass
+
+
+class _Iterador:
+    """Iterador de blobs con `.pages`, como HTTPIterator"""
+
+    def __init__(self, blobs: List[Blob], page_size: int):
+        self._blobs = blobs
+        self._page_size = max(1, page_size)
+
+    def __iter__(self):
+        for pagina in self.pages:
+            yield from pagina
+
+    @property
+    def pages(self):
+        for i in range(0, len(self._blobs), self._page_size):
+            _esperar("listados")
+            yield _Pagina(self._blobs[i:i + self._page_size])
+
+
+class Bucket:
+    def __init__(self, client: "Client", name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name: str, generation: Optional[int] = None,
+             **kwargs) -> Blob:
+        return Blob(blob_name, self, generation=generation)
+
+    def get_blob(self, blob_name: str, generation: Optional[int] = None,
+                 **kwargs) -> Optional[Blob]:
+        blob = Blob(blob_name, self, generation=generation)
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+        return blob
+
+    def exists(self, **kwargs) -> bool:
+        _esperar("metadatos")
+        return True
+
+    def list_blobs(self, prefix: Optional[str] = None,
+                   max_results: Optional[int] = None,
+                   page_size: Optional[int] = None, **kwargs) -> _Iterador:
+        with _lock:
+            nombres = sorted(n for n in _objetos.get(self.name, {})
+                             if prefix is None or n.startswith(prefix))
+            blobs = []
+            for nombre in nombres[:max_results]:
+                blob = Blob(nombre, self)
+                blob._actualizar(*_objetos[self.name][nombre])
+                blobs.append(blob)
+        return _Iterador(blobs, page_size or 1000)
+
+
+class Client:
+    def __init__(self, project: Optional[str] = None, credentials=None,
+                 **kwargs):
+        self.project = project
+
+    def bucket(self, bucket_name: str, **kwargs) -> Bucket:
+        return Bucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name: str, **kwargs) -> Bucket:
+        return Bucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, **kwargs) -> _Iterador:
+        nombre = getattr(bucket_or_name, "name", bucket_or_name)
+        return Bucket(self, nombre).list_blobs(**kwargs)
+
+
+def instalar(latencia_ms: float = 0.0):
+    """Registrar este módulo como `google.cloud.storage`"""
+    global _latencia
+    _latencia = latencia_ms / 1000.0
+
+    modulo = types.ModuleType("google.cloud.storage")
+    modulo.Client = Client
+    modulo.Bucket = Bucket
+    modulo.Blob = Blob
+    modulo.__version__ = "fake"
+
+    try:
+        import google.cloud as google_cloud
+    except ImportError:
+        google = sys.modules.setdefault("google", types.ModuleType("google"))
+        google_cloud = types.ModuleType("google.cloud")
+        google.cloud = google_cloud
+        sys.modules["google.cloud"] = google_cloud
+    google_cloud.storage = modulo
+    sys.modules["google.cloud.storage"] = modulo
+    return modulo
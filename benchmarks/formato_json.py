@@ -0,0 +1,131 @@
+"""
+Tamaño y tiempo de subida de write_json_file según el formato: JSON con
+sangría (formato original), JSON compacto y JSON compacto con gzip.
+
+Uso:
+    python benchmarks/formato_json.py --mbps 50 --latencia-gcs-ms 30 \
+        --salida formato.json
+
+Las subidas se hacen contra el sustituto local de GCS (benchmarks/fake_gcs),
+que añade la latencia fija por petición; el tiempo de transferencia en red
+se estima aparte con el ancho de banda indicado, ya que el sustituto no lo
+simula. Los documentos imitan los archivos reales: estadísticas diarias por
+finca y lotes de resultados de /predict.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_gcs  # noqa: E402
+from sinteticos import FINCAS  # noqa: E402
+
+FORMATOS = {
+    "indentado": {"compact": False, "gzip_encoding": False},
+    "compacto": {"compact": True, "gzip_encoding": False},
+    "compacto_gzip": {"compact": True, "gzip_encoding": True},
+}
+
+
+def documento_estadisticas(dias: int) -> dict:
+    diarias = {}
+    for d in range(dias):
+        fecha = f"2025-{1 + d // 28:02d}-{1 + d % 28:02d}"
+        diarias[fecha] = {"successful": random.randint(0, 5000),
+                          "failed": random.randint(0, 50),
+                          "fincas": {f: random.randint(0, 1000)
+                                     for f in FINCAS}}
+    return {"total_requests": 123456, "successful_requests": 120000,
+            "failed_requests": 3456,
+            "requests_by_finca": {f: random.randint(0, 50000)
+                                  for f in FINCAS},
+            "daily_stats": diarias, "monthly_stats": {}}
+
+
+def documento_resultados(filas: int) -> dict:
+    resultados = []
+    for _ in range(filas):
+        resultados.append({
+            "finca": random.choice(FINCAS),
+            "resultado": {
+                "Consumo": round(random.uniform(100, 5000), 2),
+                "Gramos": round(random.uniform(5, 40), 2),
+                "KGXHA": round(random.uniform(100, 3000), 2),
+                "LibrasTotal": round(random.uniform(1000, 90000), 2),
+                "LibrasXHA": round(random.uniform(100, 6000), 2),
+                "Error2": round(random.uniform(0, 0.01), 6),
+                "AnimalesM": round(random.uniform(10, 200), 3),
+                "Iteraciones": random.randint(1, 6),
+                "Convergio": True},
+            "error": None})
+    return {"total": filas, "exitosas": filas, "fallidas": 0,
+            "resultados": resultados}
+
+
+def medir(storage, nombre: str, data: dict, opciones: dict,
+          repeticiones: int, mbps: float) -> dict:
+    contenido = storage._serializar(data, opciones["compact"],
+                                    opciones["gzip_encoding"])
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        storage.write_json_file(nombre, data, **opciones)
+        tiempos.append(time.perf_counter() - inicio)
+    assert storage.read_json_file(nombre) == data
+    tiempos.sort()
+    local = tiempos[len(tiempos) // 2]
+    red = len(contenido) * 8 / (mbps * 1_000_000)
+    return {"bytes": len(contenido),
+            "subida_local_ms": round(local * 1000, 2),
+            "subida_estimada_ms": round((local + red) * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mbps", type=float, default=50.0,
+                        help="Ancho de banda de subida supuesto")
+    parser.add_argument("--latencia-gcs-ms", type=float, default=30.0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    random.seed(0)
+    fake_gcs.instalar(latencia_ms=args.latencia_gcs_ms)
+    os.environ.setdefault("GCS_BUCKET_NAME", "terrawa-bench")
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT_ID", "terrawa-bench")
+    os.environ["STORAGE_CACHE"] = "false"
+    from app import storage
+
+    documentos = {
+        "estadisticas_365_dias": documento_estadisticas(365),
+        "resultados_100": documento_resultados(100),
+        "resultados_10000": documento_resultados(10000),
+    }
+    resultados = {}
+    for nombre, data in documentos.items():
+        resultados[nombre] = {
+            formato: medir(storage, f"bench/{nombre}_{formato}", data,
+                           opciones, args.repeticiones, args.mbps)
+            for formato, opciones in FORMATOS.items()}
+        base = resultados[nombre]["indentado"]["bytes"]
+        for formato in resultados[nombre].values():
+            formato["relativo"] = round(formato["bytes"] / base, 3)
+        print(json.dumps({nombre: resultados[nombre]}), file=sys.stderr)
+
+    texto = json.dumps({"mbps": args.mbps,
+                        "latencia_gcs_ms": args.latencia_gcs_ms,
+                        "resultados": resultados}, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Memoria pico al preparar una factura: ruta JSON + base64 (/send-invoice)
+frente a la ruta multipart con PDF volcado a disco (/send-invoice/upload).
+
+Uso:
+    python benchmarks/memoria_factura.py --tamanos-mb 1,5,10 --salida mem.json
+
+Se mide con tracemalloc la memoria Python asignada desde que el cuerpo de
+la solicitud está disponible hasta que el mensaje queda listo para SMTP:
+- base64: json.loads -> InvoiceRequest -> b64decode -> MIMEApplication ->
+  msg.as_string() (lo que hace send_invoice)
+- multipart: escribir_mensaje_pdf leyendo el PDF ya volcado a disco por
+  el parser multipart (lo que hace send_invoice_upload)
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from app.correo import escribir_mensaje_pdf  # noqa: E402
+from app.routes import InvoiceRequest  # noqa: E402
+
+
+def ruta_base64(cuerpo: bytes) -> str:
+    request = InvoiceRequest(**json.loads(cuerpo))
+    pdf_bytes = base64.b64decode(request.pdf_base64)
+    msg = MIMEMultipart()
+    msg["From"] = "benchmark@example.com"
+    msg["To"] = request.recipient
+    msg["Subject"] = request.subject
+    msg.attach(MIMEText(request.html_body, "html"))
+    part = MIMEApplication(pdf_bytes, Name="guia.pdf")
+    part["Content-Disposition"] = 'attachment; filename="guia.pdf"'
+    msg.attach(part)
+    return msg.as_string()
+
+
+def ruta_multipart(ruta_pdf: str, destino: str):
+    with open(ruta_pdf, "rb") as pdf:
+        escribir_mensaje_pdf(destino, "benchmark@example.com",
+                             "cliente@example.com", "Guía",
+                             "<p>Guía adjunta</p>", pdf, 1 << 40)
+
+
+def medir(funcion, *args) -> float:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    funcion(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(pico / (1024 * 1024), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanos-mb", default="1,5,10,20")
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="terrawa-mem-")
+    resultados = []
+    for tamano in [float(t) for t in args.tamanos_mb.split(",")]:
+        pdf = os.urandom(int(tamano * 1024 * 1024))
+        ruta_pdf = f"{directorio}/guia.pdf"
+        with open(ruta_pdf, "wb") as f:
+            f.write(pdf)
+        cuerpo = json.dumps({
+            "recipient": "cliente@example.com",
+            "pdf_base64": base64.b64encode(pdf).decode(),
+            "subject": "Guía",
+            "html_body": "<p>Guía adjunta</p>"
+        }).encode()
+        del pdf
+
+        resultados.append({
+            "pdf_mb": tamano,
+            "cuerpo_json_mb": round(len(cuerpo) / (1024 * 1024), 2),
+            "pico_base64_mb": medir(ruta_base64, cuerpo),
+            "pico_multipart_mb": medir(ruta_multipart, ruta_pdf,
+                                       f"{directorio}/mensaje.eml")
+        })
+        print(json.dumps(resultados[-1]), file=sys.stderr)
+
+    texto = json.dumps({"resultados": resultados}, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Memoria por worker al cargar los modelos con y sin mapeo en memoria.
+
+Uso:
+    python benchmarks/memoria_workers.py --workers 4 --fincas 6 \
+        --capas 1024,1024 --salida workers.json
+
+Se guarda un modelo sintético por finca (joblib sin compresión, el formato
+que produce herramientas/convertir_modelos_mmap.py) y se arrancan N
+procesos que cargan todos los modelos con `cargar_artefacto`, hacen una
+predicción y, con todos los procesos vivos a la vez, leen
+/proc/self/smaps_rollup. Se informan RSS, PSS (memoria compartida
+repartida entre procesos) y memoria privada por worker. Con mmap las
+páginas de los arreglos cuentan en el RSS de cada worker pero no se
+duplican: la diferencia real se ve en PSS y en la memoria privada.
+Solo Linux.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import warnings
+from typing import Dict, List
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+
+def _memoria() -> Dict[str, float]:
+    campos = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if len(partes) == 3 and partes[2] == "kB":
+                campos[partes[0].rstrip(":")] = int(partes[1])
+    privada = campos.get("Private_Clean", 0) + campos.get("Private_Dirty", 0)
+    return {"rss_mb": round(campos["Rss"] / 1024, 1),
+            "pss_mb": round(campos["Pss"] / 1024, 1),
+            "privada_mb": round(privada / 1024, 1)}
+
+
+def _worker(rutas: List[str], mmap: bool, barrera, cola):
+    from app.modelos import cargar_artefacto
+    import sklearn.neural_network  # noqa: F401  (misma base en ambos modos)
+
+    base = _memoria()
+    modelos = [cargar_artefacto(ruta, mmap) for ruta in rutas]
+    for modelo in modelos:
+        modelo.predict(np.ones((1, 3)))
+    barrera.wait()
+    memoria = _memoria()
+    memoria["modelos_privada_mb"] = round(
+        memoria["privada_mb"] - base["privada_mb"], 1)
+    cola.put(memoria)
+    barrera.wait()
+
+
+def medir(rutas: List[str], workers: int, mmap: bool) -> Dict:
+    contexto = multiprocessing.get_context("spawn")
+    barrera, cola = contexto.Barrier(workers), contexto.Queue()
+    procesos = [contexto.Process(target=_worker,
+                                 args=(rutas, mmap, barrera, cola))
+                for _ in range(workers)]
+    for proceso in procesos:
+        proceso.start()
+    resultados = [cola.get(timeout=600) for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+    promedio = {clave: round(sum(r[clave] for r in resultados) / workers, 1)
+                for clave in resultados[0]}
+    promedio["pss_total_mb"] = round(
+        sum(r["pss_mb"] for r in resultados), 1)
+    return promedio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--fincas", type=int, default=6)
+    parser.add_argument("--capas", default="1024,1024",
+                        help="Neuronas por capa oculta del MLP sintético")
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPRegressor
+
+    warnings.simplefilter("ignore", ConvergenceWarning)
+    capas = tuple(int(c) for c in args.capas.split(","))
+    rng = np.random.default_rng(0)
+    X, y = rng.uniform(1, 30, (200, 3)), rng.uniform(1, 30, (200, 2))
+    directorio = tempfile.mkdtemp(prefix="terrawa-workers-")
+    rutas = []
+    for i in range(args.fincas):
+        modelo = MLPRegressor(hidden_layer_sizes=capas, max_iter=1,
+                              random_state=i).fit(X, y)
+        ruta = f"{directorio}/finca{i}.joblib"
+        joblib.dump(modelo, ruta, compress=0)
+        rutas.append(ruta)
+    tamano = sum(os.path.getsize(r) for r in rutas) / (1024 * 1024)
+
+    resultado = {
+        "workers": args.workers,
+        "fincas": args.fincas,
+        "capas": list(capas),
+        "artefactos_mb": round(tamano, 1),
+        "sin_mmap": medir(rutas, args.workers, mmap=False),
+        "con_mmap": medir(rutas, args.workers, mmap=True),
+    }
+    texto = json.dumps(resultado, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Perfil de arranque en frío del servidor.
+
+Dos mediciones:
+
+- importtime: ejecuta `python -X importtime -c "import main"` en un
+  proceso nuevo y resume el tiempo de importación por paquete raíz y los
+  módulos más costosos (incluye el código que main ejecuta al importarse).
+- ttfb: arranca uvicorn en un proceso nuevo contra el sustituto local de
+  GCS y mide, desde el arranque del proceso, el tiempo hasta el primer byte
+  de /api/system/health y hasta la primera respuesta 200 de /predict.
+
+Uso:
+    python benchmarks/perfil_arranque.py importtime --top 15
+    python benchmarks/perfil_arranque.py ttfb --repeticiones 5 \
+        --latencia-rendimiento-ms 300 --salida arranque.json
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS)
+
+_LINEA_IMPORTTIME = re.compile(
+    r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _entorno(directorio: str, latencia_rendimiento_ms: float,
+             latencia_gcs_ms: float) -> Dict[str, str]:
+    """Publicar modelos sintéticos y devolver el entorno del proceso hijo"""
+    import fake_gcs
+    import sinteticos
+
+    fake_gcs.instalar()
+    entorno = dict(os.environ)
+    entorno.update(sinteticos.publicar_modelos())
+    with open(f"{directorio}/gcs.pkl", "wb") as f:
+        pickle.dump({(b, n): o[1] for b, objetos in fake_gcs._objetos.items()
+                     for n, o in objetos.items()}, f)
+    entorno.update({
+        "RENDIMIENTO_PATH": sinteticos.servir_rendimiento(
+            directorio, latencia_ms=latencia_rendimiento_ms),
+        "GCS_BUCKET_NAME": "modelos-benchmark",
+        "GOOGLE_CLOUD_PROJECT_ID": "benchmark",
+        "STATS_FILE": f"{directorio}/app_stats.json",
+        "BENCH_GCS_ESTADO": f"{directorio}/gcs.pkl",
+        "BENCH_LATENCIA_GCS_MS": str(latencia_gcs_ms),
+    })
+    return entorno
+
+
+def analizar_importtime(salida: str, top: int) -> Dict:
+    """Resumir la salida de -X importtime"""
+    modulos = []
+    for linea in salida.splitlines():
+        m = _LINEA_IMPORTTIME.match(linea)
+        if m:
+            modulos.append((m.group(4), int(m.group(1)), int(m.group(2)),
+                            len(m.group(3)) // 2))
+    por_paquete: Dict[str, int] = {}
+    for nombre, propio, _, _ in modulos:
+        raiz = nombre.split(".")[0]
+        por_paquete[raiz] = por_paquete.get(raiz, 0) + propio
+    total = next((c for n, _, c, _ in modulos if n == "main"), None)
+    return {
+        "import_main_ms": round(total / 1000, 1) if total else None,
+        "por_paquete_ms": {
+            k: round(v / 1000, 1) for k, v in sorted(
+                por_paquete.items(), key=lambda x: -x[1])[:top]},
+        "modulos_propio_ms": {
+            n: round(p / 1000, 1) for n, p, _, _ in sorted(
+                modulos, key=lambda x: -x[1])[:top]},
+    }
+
+
+def medir_importtime(entorno: Dict[str, str], top: int) -> Dict:
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, timeout=300)
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr[-2000:])
+    return analizar_importtime(proceso.stderr, top)
+
+
+def hijo(puerto: int):
+    """Proceso servidor: carga el estado del GCS sustituto y arranca"""
+    import fake_gcs
+
+    fake_gcs.instalar(latencia_ms=float(
+        os.environ.get("BENCH_LATENCIA_GCS_MS", "0")))
+    with open(os.environ["BENCH_GCS_ESTADO"], "rb") as f:
+        for (bucket, nombre), contenido in pickle.load(f).items():
+            fake_gcs.subir(bucket, nombre, contenido)
+    print(f"T0 {time.time()}", flush=True)
+
+    import uvicorn
+    os.chdir(RAIZ)
+    sys.path.insert(0, RAIZ)
+    uvicorn.run("main:app", host="127.0.0.1", port=puerto,
+                log_level="warning")
+
+
+def _puerto_libre() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_ttfb(entorno: Dict[str, str], directorio: str) -> Dict:
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    # Sin copia local de rendimiento: arranque realmente en frío
+    entorno = dict(entorno, RENDIMIENTO_CACHE_PATH=(
+        f"{directorio}/rendimiento_{puerto}.json"))
+    inicio = time.time()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "hijo",
+         "--puerto", str(puerto)],
+        cwd=RAIZ, env=entorno, stdout=subprocess.PIPE, text=True)
+    t0 = {}
+    lector = threading.Thread(
+        target=lambda: t0.setdefault("t0", float(
+            proceso.stdout.readline().split()[1])), daemon=True)
+    lector.start()
+    try:
+        health = None
+        while health is None:
+            try:
+                requests.get(url + "/api/system/health", timeout=30)
+                health = time.time()
+            except requests.ConnectionError:
+                if proceso.poll() is not None:
+                    raise RuntimeError("El servidor terminó al arrancar")
+                time.sleep(0.005)
+        while True:
+            r = requests.post(url + "/predict", json={
+                "finca": "GROVITAL", "AnimalesM": 12.0, "Hectareas": 5.0,
+                "Piscinas": 3}, timeout=60)
+            if r.status_code == 200:
+                predict = time.time()
+                break
+            time.sleep(0.005)
+        lector.join(timeout=5)
+        base = t0.get("t0", inicio)
+        return {
+            "proceso_a_health_ms": round((health - inicio) * 1000, 1),
+            "health_ms": round((health - base) * 1000, 1),
+            "predict_ms": round((predict - base) * 1000, 1),
+        }
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+def _mediana(valores: List[float]) -> float:
+    valores = sorted(valores)
+    return valores[len(valores) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modo", choices=("importtime", "ttfb", "hijo"))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia-rendimiento-ms", type=float,
+                        default=300.0,
+                        help="Latencia simulada de RENDIMIENTO_PATH")
+    parser.add_argument("--latencia-gcs-ms", type=float, default=30.0)
+    parser.add_argument("--puerto", type=int)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    if args.modo == "hijo":
+        hijo(args.puerto)
+        return
+
+    directorio = tempfile.mkdtemp(prefix="terrawa-arranque-")
+    entorno = _entorno(directorio, args.latencia_rendimiento_ms,
+                       args.latencia_gcs_ms)
+    if args.modo == "importtime":
+        resultado = medir_importtime(entorno, args.top)
+    else:
+        corridas = []
+        for _ in range(args.repeticiones):
+            corridas.append(medir_ttfb(entorno, directorio))
+            print(json.dumps(corridas[-1]), file=sys.stderr)
+        resultado = {clave: _mediana([c[clave] for c in corridas])
+                     for clave in corridas[0]}
+        resultado["corridas"] = corridas
+
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                            cwd=RAIZ, capture_output=True, text=True)
+    texto = json.dumps({
+        "modo": args.modo,
+        "commit": commit.stdout.strip() or None,
+        "latencia_rendimiento_ms": args.latencia_rendimiento_ms,
+        "latencia_gcs_ms": args.latencia_gcs_ms,
+        "resultado": resultado}, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
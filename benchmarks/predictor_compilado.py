@@ -0,0 +1,151 @@
+"""
+Equivalencia y latencia del predictor compilado (app/compilado.py) frente
+a `scaler.transform` + `modelo.predict` de scikit-learn.
+
+Uso:
+    python benchmarks/predictor_compilado.py --muestras 2000 --salida comp.json
+
+Para cada combinación de scaler y tipo de modelo soportado se entrena un
+modelo sintético con la forma de /predict (3 entradas -> [Consumo, Gramos]),
+se compara la salida compilada con la de sklearn sobre entradas aleatorias
+(también fuera del rango de entrenamiento) y se mide la latencia de una
+fila y de lotes de 100 y 1000 filas (los árboles delegan en sklearn los
+lotes de más de FILAS_MAX_ARBOLES filas). Termina con código 1 si alguna
+combinación soportada no coincide dentro de la tolerancia.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from app.compilado import ATOL, FILAS_MAX_ARBOLES, RTOL, \
+    compilar  # noqa: E402
+
+
+def _escaladores():
+    from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, \
+        RobustScaler, StandardScaler
+    return {"StandardScaler": StandardScaler,
+            "MinMaxScaler": MinMaxScaler,
+            "MinMaxScaler(clip)": lambda: MinMaxScaler(clip=True),
+            "RobustScaler": RobustScaler,
+            "MaxAbsScaler": MaxAbsScaler}
+
+
+def _modelos():
+    from sklearn.ensemble import ExtraTreesRegressor, \
+        GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.linear_model import LinearRegression, Ridge
+    from sklearn.multioutput import MultiOutputRegressor
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.tree import DecisionTreeRegressor
+    return {
+        "MLP(relu)": lambda: MLPRegressor(hidden_layer_sizes=(64, 32),
+                                          max_iter=300, random_state=0),
+        "MLP(tanh)": lambda: MLPRegressor(hidden_layer_sizes=(32,),
+                                          activation="tanh", max_iter=300,
+                                          random_state=0),
+        "LinearRegression": LinearRegression,
+        "Ridge": Ridge,
+        "DecisionTree": lambda: DecisionTreeRegressor(random_state=0),
+        "RandomForest": lambda: RandomForestRegressor(
+            50, random_state=0, min_samples_leaf=2),
+        "ExtraTrees": lambda: ExtraTreesRegressor(50, random_state=0),
+        "MultiOutput(GradientBoosting)": lambda: MultiOutputRegressor(
+            GradientBoostingRegressor(n_estimators=100, random_state=0)),
+    }
+
+
+def _latencia(funcion, X, repeticiones: int) -> float:
+    funcion(X)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(X)
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--muestras", type=int, default=2000,
+                        help="Entradas aleatorias por comparación")
+    parser.add_argument("--repeticiones", type=int, default=300)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(2, 30, 1500), rng.uniform(1, 10, 1500),
+                         rng.integers(1, 20, 1500)])
+    gramos = 8 + 0.8 * X[:, 0] + rng.normal(0, 0.5, 1500)
+    Y = np.column_stack([X[:, 0] * X[:, 1] * gramos * 0.3, gramos])
+    # Entradas de prueba: rango de entrenamiento ampliado un 50 %
+    prueba = np.column_stack([rng.uniform(0, 45, args.muestras),
+                              rng.uniform(0, 15, args.muestras),
+                              rng.integers(0, 30, args.muestras)])
+    una_fila = np.array([[12.0, 5.0, 3.0]])
+
+    resultados, fallos = [], 0
+    for nombre_scaler, crear_scaler in _escaladores().items():
+        scaler = crear_scaler().fit(X)
+        Xs = scaler.transform(X)
+        for nombre_modelo, crear_modelo in _modelos().items():
+            modelo = crear_modelo().fit(Xs, Y)
+            predictor = compilar(modelo, scaler)
+            fila = {"scaler": nombre_scaler, "modelo": nombre_modelo,
+                    "compilado": predictor is not None}
+            if predictor is not None:
+                esperado = modelo.predict(scaler.transform(prueba))
+                # Por bloques pequeños: los árboles delegan en sklearn los
+                # lotes grandes y aquí interesa comparar la ruta compilada
+                obtenido = np.concatenate([
+                    predictor.predict(prueba[i:i + FILAS_MAX_ARBOLES])
+                    for i in range(0, len(prueba), FILAS_MAX_ARBOLES)])
+                coincide = bool(np.allclose(obtenido, esperado, rtol=RTOL,
+                                            atol=ATOL))
+                fallos += not coincide
+                lote = prueba[:1000]
+                fila.update({
+                    "tipo": predictor.tipo,
+                    "coincide": coincide,
+                    "diferencia_max": float(np.max(np.abs(
+                        obtenido - esperado))),
+                    "sklearn_1_fila_us": round(_latencia(
+                        lambda x: modelo.predict(scaler.transform(x)),
+                        una_fila, args.repeticiones), 1),
+                    "compilado_1_fila_us": round(_latencia(
+                        predictor.predict, una_fila, args.repeticiones), 1),
+                    "sklearn_100_filas_us": round(_latencia(
+                        lambda x: modelo.predict(scaler.transform(x)),
+                        lote[:100], args.repeticiones), 1),
+                    "compilado_100_filas_us": round(_latencia(
+                        predictor.predict, lote[:100], args.repeticiones),
+                        1),
+                    "sklearn_1000_filas_us": round(_latencia(
+                        lambda x: modelo.predict(scaler.transform(x)),
+                        lote, args.repeticiones // 10 or 1), 1),
+                    "compilado_1000_filas_us": round(_latencia(
+                        predictor.predict, lote,
+                        args.repeticiones // 10 or 1), 1),
+                })
+            resultados.append(fila)
+            print(json.dumps(fila), file=sys.stderr)
+
+    texto = json.dumps({"tolerancia": {"rtol": RTOL, "atol": ATOL},
+                        "fallos": fallos, "resultados": resultados},
+                       indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
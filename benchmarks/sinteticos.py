@@ -0,0 +1,147 @@
+"""
+Artefactos sintéticos para los benchmarks: modelos/scalers por finca con la
+forma que espera /predict (3 entradas -> [Consumo, Gramos]), una tabla de
+rendimiento servida por HTTP local y un servidor SMTP local que descarta
+los correos.
+"""
+import functools
+import http.server
+import io
+import json
+import socketserver
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import StandardScaler
+
+import fake_gcs
+
+FINCAS = ["CAMANOVILLO", "EXCANCRIGRU", "FERTIAGRO", "GROVITAL", "SUFAAZA",
+          "TIERRAVID"]
+
+
+def tabla_rendimiento():
+    """Filas Gramos -> Rendimiento con el formato de RENDIMIENTO_PATH"""
+    return {"rows": [{"Gramos": g, "Rendimiento": int(60 + 0.8 * g)}
+                     for g in range(1, 61)]}
+
+
+def entrenar_modelo(semilla: int = 0, muestras: int = 2000):
+    """
+    Entrenar un (modelo, scaler) sintético con un punto fijo alcanzable:
+    AnimalesM recalculado ~= 0.9 * AnimalesM + 1.
+    """
+    rng = np.random.default_rng(semilla)
+    X = np.column_stack([rng.uniform(2, 30, muestras),
+                         rng.uniform(1, 10, muestras),
+                         rng.integers(1, 20, muestras)])
+    gramos = 8 + 0.8 * X[:, 0]
+    rendimiento = 60 + 0.8 * np.round(gramos)
+    consumo = ((0.9 * X[:, 0] + 1.0) * gramos * 10000 * X[:, 1] /
+               (rendimiento * 454))
+    Y = np.column_stack([consumo, gramos])
+
+    scaler = StandardScaler().fit(X)
+    modelo = MLPRegressor(hidden_layer_sizes=(32, 32), max_iter=500,
+                          random_state=semilla)
+    modelo.fit(scaler.transform(X), Y)
+    return modelo, scaler
+
+
+def _serializar(objeto) -> bytes:
+    buffer = io.BytesIO()
+    joblib.dump(objeto, buffer)
+    return buffer.getvalue()
+
+
+def publicar_modelos(bucket: str = "modelos-benchmark"):
+    """
+    Subir al sustituto de GCS un modelo y un scaler por finca.
+
+    Returns:
+        Dict con las variables de entorno MODELO_PATH_* / SCALER_PATH_*
+    """
+    modelo, scaler = entrenar_modelo()
+    datos_modelo, datos_scaler = _serializar(modelo), _serializar(scaler)
+    entorno = {}
+    for finca in FINCAS:
+        fake_gcs.subir(bucket, f"{finca}/modelo.pkl", datos_modelo)
+        fake_gcs.subir(bucket, f"{finca}/scaler.pkl", datos_scaler)
+        entorno[f"MODELO_PATH_{finca}"] = f"gs://{bucket}/{finca}/modelo.pkl"
+        entorno[f"SCALER_PATH_{finca}"] = f"gs://{bucket}/{finca}/scaler.pkl"
+    return entorno
+
+
+class _SilencioHTTP(http.server.SimpleHTTPRequestHandler):
+    latencia = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+        super().do_GET()
+
+
+def servir_rendimiento(directorio: str, latencia_ms: float = 0.0) -> str:
+    """Servir la tabla de rendimiento por HTTP local; devuelve la URL"""
+    with open(f"{directorio}/rendimiento.json", "w") as f:
+        json.dump(tabla_rendimiento(), f)
+    manejador = type("_Manejador", (_SilencioHTTP,),
+                     {"latencia": latencia_ms / 1000.0})
+    servidor = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(manejador, directory=directorio))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}/rendimiento.json"
+
+
+class _ManejadorSMTP(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo (sin TLS) que acepta y descarta los mensajes"""
+
+    def _responder(self, linea: str):
+        self.wfile.write((linea + "\r\n").encode())
+
+    def handle(self):
+        self._responder("220 localhost SMTP benchmark")
+        en_datos = False
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            if en_datos:
+                if linea in (b".\r\n", b".\n"):
+                    en_datos = False
+                    self.server.recibidos += 1
+                    self._responder("250 OK")
+                continue
+            comando = linea.decode(errors="replace").strip().upper()
+            if comando.startswith(("EHLO", "HELO")):
+                self.wfile.write(b"250-localhost\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif comando.startswith("AUTH"):
+                self._responder("235 Authentication successful")
+            elif comando.startswith("DATA"):
+                en_datos = True
+                self._responder("354 End data with <CR><LF>.<CR><LF>")
+            elif comando.startswith("QUIT"):
+                self._responder("221 Bye")
+                return
+            else:
+                self._responder("250 OK")
+
+
+class _ServidorSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    recibidos = 0
+
+
+def servir_smtp():
+    """Arrancar el SMTP local; devuelve (servidor, puerto)"""
+    servidor = _ServidorSMTP(("127.0.0.1", 0), _ManejadorSMTP)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, servidor.server_address[1]
@@ -0,0 +1,132 @@
+"""
+Convertir los modelos y scalers de GCS a artefactos joblib sin compresión,
+cuyos arreglos NumPy se pueden mapear en memoria (`mmap_mode="r"`) y
+compartir entre workers.
+
+Uso:
+    # Rutas tomadas de MODELO_PATH_* / SCALER_PATH_* (.env o entorno)
+    python herramientas/convertir_modelos_mmap.py --sufijo .mmap.joblib
+
+    # Rutas explícitas, sin subir nada (solo informe)
+    python herramientas/convertir_modelos_mmap.py --sin-subir \
+        gs://bucket/modelos/GROVITAL.pkl
+
+Cada artefacto se sube junto al original con el sufijo indicado; el script
+imprime las variables de entorno a actualizar. Antes de subir se comprueba
+que el artefacto convertido carga con mmap y produce las mismas
+predicciones que el original.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from app.modelos import separar_ruta_gcs  # noqa: E402
+
+FINCAS = ["CAMANOVILLO", "EXCANCRIGRU", "FERTIAGRO", "GROVITAL", "SUFAAZA",
+          "TIERRAVID"]
+
+
+def rutas_configuradas() -> Dict[str, str]:
+    """Variable de entorno -> ruta gs:// de cada modelo y scaler"""
+    from decouple import config
+
+    rutas = {}
+    for finca in FINCAS:
+        for prefijo in ("MODELO_PATH", "SCALER_PATH"):
+            variable = f"{prefijo}_{finca}"
+            ruta = config(variable, default=None)
+            if ruta:
+                rutas[variable] = ruta
+    return rutas
+
+
+def bytes_mapeados(objeto) -> int:
+    """Bytes de arreglos np.memmap alcanzables desde el objeto cargado"""
+    vistos, total, pendientes = set(), 0, [objeto]
+    while pendientes:
+        actual = pendientes.pop()
+        if id(actual) in vistos:
+            continue
+        vistos.add(id(actual))
+        if isinstance(actual, np.memmap):
+            total += actual.nbytes
+        elif isinstance(actual, dict):
+            pendientes.extend(actual.values())
+        elif isinstance(actual, (list, tuple)):
+            pendientes.extend(actual)
+        elif hasattr(actual, "__dict__") and not isinstance(actual, type):
+            pendientes.extend(vars(actual).values())
+    return total
+
+
+def _comprobar(original, convertido):
+    """Mismas salidas en una muestra de entradas (modelos y scalers)"""
+    metodo = "predict" if hasattr(original, "predict") else "transform"
+    if not hasattr(original, metodo):
+        return
+    entradas = getattr(original, "n_features_in_", 3)
+    muestra = np.random.default_rng(0).uniform(1, 30, (64, entradas))
+    esperado = getattr(original, metodo)(muestra)
+    obtenido = getattr(convertido, metodo)(muestra)
+    if not np.allclose(esperado, obtenido, rtol=0, atol=0):
+        raise ValueError("El artefacto convertido no reproduce las salidas")
+
+
+def convertir(ruta: str, sufijo: str, subir: bool, directorio: str) -> str:
+    """Convertir un blob y devolver la ruta gs:// del artefacto nuevo"""
+    from google.cloud import storage
+
+    bucket_name, blob_name = separar_ruta_gcs(ruta)
+    bucket = storage.Client().bucket(bucket_name)
+    original_local = os.path.join(directorio, "original.pkl")
+    convertido_local = os.path.join(directorio, "convertido.joblib")
+    bucket.blob(blob_name).download_to_filename(original_local)
+
+    original = joblib.load(original_local)
+    joblib.dump(original, convertido_local, compress=0)
+    convertido = joblib.load(convertido_local, mmap_mode="r")
+    _comprobar(original, convertido)
+
+    base, _ = os.path.splitext(blob_name)
+    destino = base + sufijo
+    print(f"✅ {ruta}: {os.path.getsize(original_local)} -> "
+          f"{os.path.getsize(convertido_local)} bytes, "
+          f"{bytes_mapeados(convertido)} bytes mapeables", file=sys.stderr)
+    if subir:
+        bucket.blob(destino).upload_from_filename(
+            convertido_local, content_type="application/octet-stream")
+    return f"gs://{bucket_name}/{destino}"
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("rutas", nargs="*",
+                        help="Rutas gs:// (por defecto MODELO/SCALER_PATH_*)")
+    parser.add_argument("--sufijo", default=".mmap.joblib")
+    parser.add_argument("--sin-subir", action="store_true",
+                        help="Solo convertir y verificar, sin subir a GCS")
+    args = parser.parse_args(argv)
+
+    rutas = ({r: r for r in args.rutas} if args.rutas
+             else rutas_configuradas())
+    if not rutas:
+        parser.error("No hay rutas que convertir")
+
+    with tempfile.TemporaryDirectory(prefix="terrawa-mmap-") as directorio:
+        for variable, ruta in rutas.items():
+            nueva = convertir(ruta, args.sufijo, not args.sin_subir,
+                              directorio)
+            if not args.sin_subir:
+                print(f"{variable}={nueva}" if variable != ruta else nueva)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
 import numpy as np
-import joblib
 from dotenv import load_dotenv
 from decouple import config
 import warnings
-import requests
-from google.cloud import storage
-from fastapi import FastAPI, Request, HTTPException
+import threading
+import secrets
+from contextlib import nullcontext
+from fastapi import FastAPI, Request, Response, HTTPException, Header, \
+    Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, \
+    PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 from app.routes import router as main_router
 from app.stats import stats_manager
+from app.modelos import CatalogoFincas, ModelRegistry, ModeloRechazado
+from app.rendimiento import ProveedorRendimiento
+from app.cache import CachePredicciones
+from app.correo import cola_correos
+from app.metrics import metrics, predict_stage_seconds, \
+    registrar_etapas, server_timing
+from app.solver import resolver, fila_resultado, TelemetriaSolver
+from app.barrido import EJES, FORMATOS, Malla, ndjson, csv_filas, \
+    encabezado_csv, linea_error
+from app.ejecutores import ejecutor_inferencia, ejecutor_io, \
+    ColaLlenaError
+from app.trabajos import TrabajosPrediccion, job_id_valido
+from app.admision import ControlAdmision, AdmisionRechazada
 
 warnings.filterwarnings(
     "ignore", message="Skipping variable loading for optimizer")
@@ -40,53 +56,103 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Motor de plantillas
 templates = Jinja2Templates(directory="templates")
 
-# Rutas de los archivos (modelo y scaler por finca)
-modelos = {
-    'CAMANOVILLO': {
-        'modelo': config('MODELO_PATH_CAMANOVILLO'),
-        'scaler': config('SCALER_PATH_CAMANOVILLO')
-    },
-    'EXCANCRIGRU': {
-        'modelo': config('MODELO_PATH_EXCANCRIGRU'),
-        'scaler': config('SCALER_PATH_EXCANCRIGRU')
-    },
-    'FERTIAGRO': {
-        'modelo': config('MODELO_PATH_FERTIAGRO'),
-        'scaler': config('SCALER_PATH_FERTIAGRO')
-    },
-    'GROVITAL': {
-        'modelo': config('MODELO_PATH_GROVITAL'),
-        'scaler': config('SCALER_PATH_GROVITAL')
-    },
-    'SUFAAZA': {
-        'modelo': config('MODELO_PATH_SUFAAZA'),
-        'scaler': config('SCALER_PATH_SUFAAZA')
-    },
-    'TIERRAVID': {
-        'modelo': config('MODELO_PATH_TIERRAVID'),
-        'scaler': config('SCALER_PATH_TIERRAVID')
-    }
-}
+# Fincas y rutas de sus modelos: manifiesto en el bucket (FINCAS_MANIFEST,
+# gs://...) o, en su defecto, variables MODELO_PATH_<FINCA>/SCALER_PATH_<FINCA>
+catalogo_fincas = CatalogoFincas(
+    config('FINCAS_MANIFEST', default=None),
+    refrescar_cada=config('FINCAS_REFRESCAR_SEGUNDOS', default=300,
+                          cast=float)
+)
 
-rendimiento_path = config("RENDIMIENTO_PATH")
+# Modelos en memoria bajo demanda, con desalojo LRU al superar
+# MODELO_MEMORIA_MB; se revalida la generación en GCS cada N segundos
+registro_modelos = ModelRegistry(
+    catalogo_fincas,
+    revalidar_cada=config('MODELO_REVALIDAR_SEGUNDOS', default=300,
+                          cast=float),
+    mmap=config('MODELO_MMAP', default=True, cast=bool),
+    compilar=config('MODELO_COMPILAR', default=True, cast=bool),
+    memoria_max_bytes=int(config('MODELO_MEMORIA_MB', default=256,
+                                 cast=float) * 1024 * 1024)
+)
 
-# Descargar el JSON de rendimiento desde la URL
-response = requests.get(rendimiento_path)
+# Segundos para terminar de enviar los correos en cola al detenerse
+espera_cierre_correos = config('SMTP_ESPERA_CIERRE', default=8, cast=float)
+# Segundos para que los trabajos interrumpidos guarden su estado
+espera_cierre_trabajos = config('PREDICT_JOBS_ESPERA_CIERRE', default=1.5,
+                                cast=float)
+
+# Endpoints /admin/models: deshabilitados si no se define ADMIN_TOKEN
+admin_token = config('ADMIN_TOKEN', default='')
+
+# Solucionador de AnimalesM: "iterativo" (el ajuste original, una llamada
+# al modelo por paso), "vectorizado" (los mismos pasos, varios por
+# llamada) o "auto" (por defecto: vectorizado con modelos sin compilar y
+# lotes pequeños). Todos devuelven el mismo resultado
+solver_metodo = config('PREDICT_SOLVER', default='auto')
+margen_error = 0.01
+max_iteraciones = 100
+max_lote = config('PREDICT_BATCH_MAX', default=1000, cast=int)
+telemetria_solver = TelemetriaSolver()
+
+# Control de admisión de /predict, /predict/batch y /predict/sweep: cupos
+# global y por finca y una cola acotada; al llenarse se responde 503 con
+# Retry-After en lugar de acumular latencia
+admision_concurrentes = config('ADMISION_MAX_CONCURRENTES',
+                               default=2 * ejecutor_inferencia.max_workers,
+                               cast=int)
+control_admision = ControlAdmision(
+    max_concurrentes=admision_concurrentes,
+    max_por_finca=config('ADMISION_MAX_POR_FINCA',
+                         default=max(1, admision_concurrentes // 2),
+                         cast=int),
+    max_cola=config('ADMISION_COLA', default=32, cast=int),
+    espera_max=config('ADMISION_ESPERA_MAX', default=5, cast=float),
+    habilitado=config('ADMISION', default=True, cast=bool)
+)
 
-# Verificar si la solicitud fue exitosa
-if response.status_code == 200:
-    try:
-        rendimiento_data = response.json()
-    except requests.exceptions.JSONDecodeError:
-        print("Error al decodificar el JSON, contenido de la respuesta:")
-        print(response.text)  # Imprimir el contenido para ver qué se recibió
-else:
-    print(f"Error al descargar el archivo: {response.status_code}")
-    print(response.text)  # Imprimir el mensaje de error
+# Cabecera Server-Timing con la duración de cada etapa en /predict y
+# /predict/batch
+server_timing_habilitado = config('SERVER_TIMING', default=False, cast=bool)
+
+# /predict/sweep: puntos máximos de la malla y filas por bloque del solver
+max_puntos_barrido = config('SWEEP_MAX_PUNTOS', default=1000000, cast=int)
+bloque_barrido = config('SWEEP_BLOQUE', default=256, cast=int)
+
+# Caché de resultados de /predict (clave: finca + entradas cuantizadas)
+cache_habilitada = config('PREDICT_CACHE', default=True, cast=bool)
+cache_predicciones = CachePredicciones(
+    max_entradas=config('PREDICT_CACHE_MAX_ENTRADAS', default=10000,
+                        cast=int),
+    max_bytes=int(config('PREDICT_CACHE_MAX_MB', default=16, cast=float) *
+                  1024 * 1024),
+    ttl=config('PREDICT_CACHE_TTL', default=600, cast=float),
+    cuanto_animales=config('PREDICT_CACHE_CUANTO_ANIMALES', default=0.001,
+                           cast=float),
+    cuanto_hectareas=config('PREDICT_CACHE_CUANTO_HECTAREAS', default=0.001,
+                            cast=float)
+)
 
-# Convertir a un diccionario de búsqueda
-rendimiento_dict = {int(row["Gramos"]): int(row["Rendimiento"])
-                    for row in rendimiento_data["rows"]}
+# Precarga opcional de todos los modelos al arrancar el contenedor
+precarga_habilitada = config('MODELO_PRECARGA', default=False, cast=bool)
+precarga_hilos = config('MODELO_PRECARGA_HILOS', default=6, cast=int)
+
+rendimiento_path = config("RENDIMIENTO_PATH")
+
+# Tabla de rendimiento: copia local en disco + revalidación en segundo plano
+proveedor_rendimiento = ProveedorRendimiento(
+    rendimiento_path,
+    ruta_local=config('RENDIMIENTO_CACHE_PATH',
+                      default='/tmp/rendimiento.json'),
+    refrescar_cada=config('RENDIMIENTO_REFRESCAR_SEGUNDOS', default=600,
+                          cast=float)
+)
+
+# Arranque diferido: ni red ni librerías pesadas al importar; la tabla de
+# rendimiento se descarga en segundo plano al arrancar o en el primer uso
+arranque_diferido = config('ARRANQUE_DIFERIDO', default=True, cast=bool)
+if not arranque_diferido:
+    proveedor_rendimiento.cargar()
 
 
 # Modelos de datos para FastAPI
@@ -97,44 +163,191 @@ class PredictionRequest(BaseModel):
     Piscinas: int
 
 
+class GeneracionesModelo(BaseModel):
+    modelo: int
+    scaler: int
+
+
+class RangoBarrido(BaseModel):
+    inicio: float
+    fin: float
+    paso: float = 1.0
+
+
+class SweepRequest(BaseModel):
+    finca: str
+    AnimalesM: RangoBarrido
+    Hectareas: RangoBarrido
+    Piscinas: RangoBarrido
+    formato: str = "ndjson"
+
+
 def obtener_rendimiento(gramos_predicho):
-    return rendimiento_dict.get(gramos_predicho, rendimiento_dict[
-        min(rendimiento_dict.keys(), key=lambda x: abs(x - gramos_predicho))])
+    return proveedor_rendimiento.tabla.valor(gramos_predicho)
+
+
+def validar_solicitud(request: PredictionRequest):
+    """Validar los parámetros de una solicitud de predicción"""
+    if not all([request.finca, request.AnimalesM, request.Hectareas,
+                request.Piscinas]):
+        raise HTTPException(
+            status_code=400,
+            detail="Faltan parámetros requeridos"
+        )
 
+    # Verificar que la finca sea válida
+    if not registro_modelos.existe(request.finca):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Finca {request.finca} no válida"
+        )
 
-def descargar_modelo(bucket_name, source_blob_name, destination_file_name):
-    # Crear el cliente de Google Cloud Storage
-    storage_client = storage.Client()
 
-    # Referenciar el bucket
-    bucket = storage_client.bucket(bucket_name)
+async def catalogo_listo():
+    """
+    Dependencia de los endpoints que consultan las fincas: la primera
+    lectura del manifiesto se espera en ejecutor_io y no bloquea el event
+    loop (normalmente ya la hizo el hilo de arranque)
+    """
+    if not catalogo_fincas.cargado:
+        try:
+            await ejecutor_io.run(catalogo_fincas.rutas)
+        except ColaLlenaError as e:
+            raise servidor_saturado(e)
 
-    # Referenciar el blob (archivo dentro del bucket)
-    blob = bucket.blob(source_blob_name)
 
-    # Descargar el archivo al sistema local temporalmente
-    blob.download_to_filename(destination_file_name)
+def obtener_rendimiento_vector(gramos):
+    return proveedor_rendimiento.tabla.valores(gramos)
 
 
 def cargar_modelo_y_scaler(finca):
-    modelo_path = modelos[finca]['modelo']
-    scaler_path = modelos[finca]['scaler']
+    return registro_modelos.obtener(finca)
+
+
+def consultar_cache(request: PredictionRequest):
+    """Devolver (clave, resultado en caché o None) para una solicitud"""
+    if not cache_habilitada:
+        return None, None
+    clave = cache_predicciones.clave(request.finca, request.AnimalesM,
+                                     request.Hectareas, request.Piscinas)
+    # Un acierto no pasa por registro_modelos.obtener: revisar aquí la
+    # versión para que la caché no sirva el modelo anterior hasta el TTL
+    return clave, cache_predicciones.obtener(
+        clave, registro_modelos.version(request.finca, revisar=True))
+
+
+def guardar_en_cache(clave, finca, resultado):
+    """Guardar un resultado con la versión del modelo que lo produjo"""
+    if clave is not None:
+        cache_predicciones.guardar(clave, registro_modelos.version(finca),
+                                   resultado)
+
+
+def resolver_finca(finca, animales, hectareas, piscinas):
+    """Cargar el modelo de la finca y resolver AnimalesM para varias filas.
+
+    Se ejecuta dentro de ejecutor_inferencia, fuera del event loop.
+    """
+    best_model, scaler = cargar_modelo_y_scaler(finca)
+
+    def rendimiento_medido(gramos):
+        with predict_stage_seconds.time(finca=finca, stage="rendimiento"):
+            return obtener_rendimiento_vector(gramos)
+
+    with predict_stage_seconds.time(finca=finca, stage="solver"):
+        solucion = resolver(
+            best_model, scaler,
+            np.asarray(animales, dtype=float),
+            np.asarray(hectareas, dtype=float),
+            np.asarray(piscinas, dtype=float),
+            rendimiento_medido,
+            metodo=solver_metodo,
+            margen_error=margen_error,
+            max_iteraciones=max_iteraciones
+        )
+    telemetria_solver.registrar(finca, solucion)
+    return solucion
+
+
+# /predict/jobs: trabajos en segundo plano con resultados por partes en GCS
+trabajos_prediccion = TrabajosPrediccion(
+    resolver_finca,
+    prefijo=config('PREDICT_JOBS_PREFIJO', default='predicciones'),
+    bloque=config('PREDICT_JOBS_BLOQUE', default=2000, cast=int),
+    concurrencia=config('PREDICT_JOBS_CONCURRENCIA', default=1, cast=int),
+    max_cola=config('PREDICT_JOBS_COLA', default=10, cast=int),
+    # ~0.7 MB de memoria por cada 1000 filas al leer el cuerpo
+    max_filas=config('PREDICT_JOBS_MAX_FILAS', default=50000, cast=int),
+    latido=config('PREDICT_JOBS_LATIDO', default=15, cast=float),
+    caducidad=config('PREDICT_JOBS_CADUCIDAD', default=120, cast=float),
+    admision=control_admision
+)
+
+metrics.gauge(
+    "terrawa_model_registry_bytes",
+    "Memoria estimada de los modelos cargados por finca",
+    lambda: {(("finca", finca),): e["bytes"] for finca, e in
+             registro_modelos.estadisticas()["fincas"].items()
+             if e["en_memoria"]})
 
-    modelo_bucket_name, modelo_blob_name = modelo_path.replace(
-        "gs://", "").split("/", 1)
-    scaler_bucket_name, scaler_blob_name = scaler_path.replace(
-        "gs://", "").split("/", 1)
+metrics.gauge(
+    "terrawa_admission_queue_depth",
+    "Solicitudes esperando cupo en el control de admisión",
+    lambda: {(): control_admision.profundidad()})
 
-    modelo_local = f"/tmp/{finca}_modelo.pkl"
-    scaler_local = f"/tmp/{finca}_scaler.pkl"
+metrics.gauge(
+    "terrawa_admission_in_flight",
+    "Solicitudes admitidas en curso",
+    lambda: {(): control_admision.en_curso})
 
-    descargar_modelo(modelo_bucket_name, modelo_blob_name, modelo_local)
-    descargar_modelo(scaler_bucket_name, scaler_blob_name, scaler_local)
+metrics.gauge(
+    "terrawa_predict_jobs",
+    "Trabajos de predicción conocidos por la instancia, por estado",
+    trabajos_prediccion.por_estado)
 
-    best_model = joblib.load(modelo_local)
-    scaler = joblib.load(scaler_local)
 
-    return best_model, scaler
+def precalentar_librerias():
+    """Importar joblib/sklearn (más de 1 s) antes de la primera predicción"""
+    try:
+        import joblib  # noqa: F401
+        import sklearn.preprocessing  # noqa: F401
+    except ImportError as e:
+        print(f"⚠️ No se pudieron precalentar las librerías: {e}")
+
+
+@app.on_event("startup")
+def iniciar_precarga():
+    """Lanzar la precarga de modelos sin bloquear el arranque del servidor"""
+    proveedor_rendimiento.iniciar_refresco()
+    if catalogo_fincas.manifiesto:
+        # Leer el manifiesto antes de la primera solicitud
+        threading.Thread(target=catalogo_fincas.rutas,
+                         name="catalogo-fincas", daemon=True).start()
+    if arranque_diferido and not precarga_habilitada:
+        threading.Thread(target=precalentar_librerias,
+                         name="precalentar-librerias", daemon=True).start()
+    if precarga_habilitada:
+        threading.Thread(
+            target=registro_modelos.precargar,
+            kwargs={"max_workers": precarga_hilos},
+            name="precarga-modelos",
+            daemon=True
+        ).start()
+
+
+@app.on_event("shutdown")
+async def detener_trabajos():
+    # Antes de cerrar los pools: los trabajos guardan su estado con ejecutor_io
+    await trabajos_prediccion.detener(espera=espera_cierre_trabajos)
+
+
+@app.on_event("shutdown")
+def detener_ejecutores():
+    # Cloud Run da 10 s tras SIGTERM: enviar antes los correos pendientes
+    cola_correos.detener(espera=espera_cierre_correos)
+    ejecutor_inferencia.shutdown()
+    ejecutor_io.shutdown()
+    proveedor_rendimiento.detener_refresco()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -142,90 +355,120 @@ async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
-@app.get("/stats")
+@app.get("/stats", dependencies=[Depends(catalogo_listo)])
 async def get_stats():
     """Endpoint para obtener estadísticas de la aplicación"""
-    return stats_manager.get_all_stats()
+    stats = stats_manager.get_all_stats()
+    stats["prediction_cache"] = cache_predicciones.estadisticas()
+    stats["model_registry"] = registro_modelos.estadisticas()
+    stats["solver"] = telemetria_solver.resumen()
+    stats["admission"] = control_admision.estado()
+    return stats
+
+
+@app.get("/api/system/health")
+async def health():
+    """
+    Endpoint de salud; responde 503 hasta que termine la precarga, y
+    también después si no se pudo cargar el modelo de ninguna finca
+    """
+    sin_modelos = (precarga_habilitada and
+                   registro_modelos.precarga_completa and
+                   not registro_modelos.precarga_lista)
+    listo = (proveedor_rendimiento.disponible and not sin_modelos and
+             (not precarga_habilitada or registro_modelos.precarga_completa))
+    if listo:
+        estado = "ok"
+    else:
+        estado = "error" if sin_modelos else "warming"
+    contenido = {
+        "status": estado,
+        "rendimiento": {
+            "disponible": proveedor_rendimiento.disponible,
+            "etag": proveedor_rendimiento.etag
+        },
+        "precarga": {
+            "habilitada": precarga_habilitada,
+            "completa": registro_modelos.precarga_completa,
+            "fallidas": registro_modelos.precarga_fallidas,
+            "fincas": registro_modelos.precarga
+        }
+    }
+    return JSONResponse(contenido, status_code=200 if listo else 503)
+
 
+@app.get("/metrics", response_class=PlainTextResponse,
+         dependencies=[Depends(catalogo_listo)])
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
 
-@app.post("/predict")
-async def predict(request: PredictionRequest):
+
+def servidor_saturado(error: Exception) -> HTTPException:
+    """503 con Retry-After para rechazos de admisión o de los pools"""
+    reintentar_en = getattr(error, "reintentar_en", None) or \
+        control_admision.reintentar_en()
+    return HTTPException(status_code=503, detail=str(error),
+                         headers={"Retry-After": str(reintentar_en)})
+
+
+def medir_etapas():
+    """Registro de etapas de la solicitud si Server-Timing está activo"""
+    return registrar_etapas() if server_timing_habilitado else nullcontext()
+
+
+def agregar_server_timing(etapas, response: Response = None,
+                          error: HTTPException = None):
+    if etapas is None:
+        return
+    if response is not None:
+        response.headers["Server-Timing"] = server_timing(etapas)
+    if error is not None:
+        error.headers = {**(error.headers or {}),
+                         "Server-Timing": server_timing(etapas)}
+
+
+@app.post("/predict", dependencies=[Depends(catalogo_listo)])
+async def predict(request: PredictionRequest, response: Response):
+    finca = request.finca if registro_modelos.existe(request.finca) \
+        else "invalida"
+    with medir_etapas() as etapas:
+        try:
+            with predict_stage_seconds.time(finca=finca, stage="total"):
+                resultado = await _predict(request)
+        except HTTPException as e:
+            agregar_server_timing(etapas, error=e)
+            raise
+    agregar_server_timing(etapas, response)
+    return resultado
+
+
+async def _predict(request: PredictionRequest):
     # Incrementar contador de solicitudes totales
     stats_manager.increment_total_requests()
 
     try:
+        validar_solicitud(request)
+
         # Extraer los valores del modelo
         finca = request.finca
         animales_m = request.AnimalesM
         hectareas = request.Hectareas
         piscinas = request.Piscinas
 
-        if not all([finca, animales_m, hectareas, piscinas]):
-            raise HTTPException(
-                status_code=400,
-                detail="Faltan parámetros requeridos"
-            )
-
-        # Verificar que la finca sea válida
-        if finca not in modelos:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Finca {finca} no válida"
-            )
-
-        # Cargar el modelo y el escalador para la finca especificada
-        best_model, scaler = cargar_modelo_y_scaler(finca)
-
-        # Parámetros iniciales de la predicción
-        aniM_inicial = animales_m
-        hect = hectareas
-        pisc = piscinas
-
-        # Configuración del margen de error
-        margen_error = 0.01
-        max_iteraciones = 100
-
-        aniM = aniM_inicial
-        for _ in range(max_iteraciones):
-            nuevo_dato = np.array([[aniM, hect, pisc]])
-            nuevo_dato_scaled = scaler.transform(nuevo_dato)
-            prediccion = best_model.predict(nuevo_dato_scaled)
-
-            # Recuperar valores
-            hectareas_real = nuevo_dato[0][1]
-            consumo_predicho = prediccion[0][0]
-            gramos_predicho = int(round(prediccion[0][1]))
-            peso = gramos_predicho
-            rendimiento_predicho = obtener_rendimiento(gramos_predicho)
-
-            # Recalcular variables dependientes
-            kg_x_ha_predicho = round(consumo_predicho / hectareas_real, 2)
-            libras_x_ha_predicho = round(
-                kg_x_ha_predicho * (rendimiento_predicho / 100) * 100, 2)
-            libras_total_predicho = round(
-                hectareas_real * libras_x_ha_predicho, 2)
-            error2_predicho = round(libras_total_predicho * 0.98, 2)
-            animales_m = round(
-                ((libras_x_ha_predicho * 454) / peso) / 10000, 2)
-
-            # Verificar si se alcanzó el valor deseado
-            if abs(animales_m - aniM_inicial) <= margen_error:
-                break
-
-            # Ajustar el valor de AnimalesM para la próxima iteración
-            aniM -= (animales_m - aniM_inicial) * \
-                0.1  # Factor de ajuste dinámico
-
-        # Resultado de la predicción
-        resultado = {
-            "Consumo": consumo_predicho,
-            "Gramos": gramos_predicho,
-            "KGXHA": kg_x_ha_predicho,
-            "LibrasTotal": libras_total_predicho,
-            "LibrasXHA": libras_x_ha_predicho,
-            "Error2": error2_predicho,
-            "AnimalesM": animales_m
-        }
+        # Resultado ya calculado para las mismas entradas y modelo
+        clave, resultado = consultar_cache(request)
+        if resultado is None:
+            # Cargar el modelo y resolver AnimalesM fuera del event loop
+            async with control_admision.admitir(finca):
+                solucion = await ejecutor_inferencia.run(
+                    resolver_finca, finca, [animales_m], [hectareas],
+                    [piscinas])
+
+            # Resultado de la predicción
+            resultado = fila_resultado(solucion, 0)
+            guardar_en_cache(clave, finca, resultado)
 
         # Incrementar contador de solicitudes exitosas
         stats_manager.increment_successful_requests(finca)
@@ -236,11 +479,320 @@ async def predict(request: PredictionRequest):
         # Incrementar contador de solicitudes fallidas
         stats_manager.increment_failed_requests()
         raise
+    except (AdmisionRechazada, ColaLlenaError) as e:
+        stats_manager.increment_failed_requests()
+        raise servidor_saturado(e)
     except Exception as e:
         # Incrementar contador de solicitudes fallidas
         stats_manager.increment_failed_requests()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/predict/batch", dependencies=[Depends(catalogo_listo)])
+async def predict_batch(items: List[PredictionRequest], response: Response):
+    """
+    Predicción de muchas piscinas (de una o varias fincas) en una sola
+    solicitud. Los resultados se devuelven en el orden de entrada; los
+    errores se informan por elemento sin fallar el lote completo.
+    """
+    with medir_etapas() as etapas:
+        resultado = await _predict_batch(items)
+    agregar_server_timing(etapas, response)
+    return resultado
+
+
+async def _predict_batch(items: List[PredictionRequest]):
+    if len(items) > max_lote:
+        stats_manager.record_batch({}, len(items))
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote supera el máximo de {max_lote} elementos"
+        )
+
+    resultados = [None] * len(items)
+
+    # Agrupar por finca los elementos válidos que no estén en caché
+    exitosas_por_finca = {}
+    por_finca = {}
+    claves = {}
+    for i, item in enumerate(items):
+        try:
+            validar_solicitud(item)
+        except HTTPException as e:
+            resultados[i] = {"finca": item.finca, "resultado": None,
+                             "error": e.detail}
+            continue
+        claves[i], resultado = consultar_cache(item)
+        if resultado is not None:
+            resultados[i] = {"finca": item.finca, "resultado": resultado,
+                             "error": None}
+            exitosas_por_finca[item.finca] = \
+                exitosas_por_finca.get(item.finca, 0) + 1
+            continue
+        por_finca.setdefault(item.finca, []).append(i)
+
+    for finca, indices in por_finca.items():
+        try:
+            # Un cupo por finca; si se rechaza, los grupos ya resueltos
+            # quedan en caché para el reintento
+            async with control_admision.admitir(finca):
+                solucion = await ejecutor_inferencia.run(
+                    resolver_finca, finca,
+                    [items[i].AnimalesM for i in indices],
+                    [items[i].Hectareas for i in indices],
+                    [items[i].Piscinas for i in indices]
+                )
+        except (AdmisionRechazada, ColaLlenaError) as e:
+            stats_manager.record_batch({}, len(items))
+            raise servidor_saturado(e)
+        except Exception as e:
+            for i in indices:
+                resultados[i] = {"finca": finca, "resultado": None,
+                                 "error": str(e)}
+            continue
+
+        for fila, i in enumerate(indices):
+            try:
+                resultado = fila_resultado(solucion, fila)
+                guardar_en_cache(claves[i], finca, resultado)
+                resultados[i] = {"finca": finca, "resultado": resultado,
+                                 "error": None}
+                exitosas_por_finca[finca] = \
+                    exitosas_por_finca.get(finca, 0) + 1
+            except Exception as e:
+                resultados[i] = {"finca": finca, "resultado": None,
+                                 "error": str(e)}
+
+    # Un solo registro de estadísticas por lote
+    exitosas = sum(exitosas_por_finca.values())
+    stats_manager.record_batch(exitosas_por_finca, len(items) - exitosas)
+
+    return {
+        "total": len(items),
+        "exitosas": exitosas,
+        "fallidas": len(items) - exitosas,
+        "resultados": resultados
+    }
+
+
+@app.post("/predict/jobs", status_code=202,
+          dependencies=[Depends(catalogo_listo)])
+async def predict_jobs(items: List[PredictionRequest]):
+    """
+    Encolar una predicción demasiado grande para una sola solicitud. Las
+    filas se resuelven en segundo plano y los resultados se escriben en el
+    bucket por partes; el progreso se consulta en /predict/jobs/{job_id}.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="El trabajo está vacío")
+    if len(items) > trabajos_prediccion.max_filas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El trabajo supera el máximo de "
+                   f"{trabajos_prediccion.max_filas} elementos"
+        )
+
+    # Agrupar por finca como en /predict/batch, ya como arreglos
+    invalidos = {}
+    por_finca = {}
+    for i, item in enumerate(items):
+        try:
+            validar_solicitud(item)
+        except HTTPException as e:
+            invalidos[i] = e.detail
+            continue
+        por_finca.setdefault(item.finca, []).append(i)
+    columnas = {
+        finca: (indices, [
+            np.array([items[i].AnimalesM for i in indices], dtype=float),
+            np.array([items[i].Hectareas for i in indices], dtype=float),
+            np.array([items[i].Piscinas for i in indices], dtype=float)])
+        for finca, indices in por_finca.items()
+    }
+
+    try:
+        job_id = trabajos_prediccion.enviar(len(items), columnas, invalidos)
+    except ColaLlenaError as e:
+        raise servidor_saturado(e)
+    return {"message": "Trabajo de predicción encolado", "job_id": job_id,
+            "total": len(items)}
+
+
+@app.get("/predict/jobs/{job_id}")
+async def predict_job_status(job_id: str):
+    """Progreso de un trabajo y partes ya disponibles para descargar"""
+    estado = None
+    if job_id_valido(job_id):
+        estado = await trabajos_prediccion.estado_persistido(job_id)
+    if estado is None:
+        raise HTTPException(status_code=404,
+                            detail=f"No existe el trabajo {job_id}")
+    return estado
+
+
+@app.get("/predict/jobs/{job_id}/parts/{parte}")
+async def predict_job_part(job_id: str, parte: int):
+    """Descargar una parte terminada (formato columnar)"""
+    contenido = None
+    if job_id_valido(job_id) and parte >= 0:
+        contenido = await trabajos_prediccion.leer_parte(job_id, parte)
+    if contenido is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"La parte {parte} del trabajo {job_id} no existe o "
+                   f"aún no está lista")
+    return contenido
+
+
+def verificar_admin(x_admin_token: Optional[str] = Header(None)):
+    """Exigir la cabecera X-Admin-Token en los endpoints de administración"""
+    if not admin_token:
+        raise HTTPException(status_code=403,
+                            detail="Administración deshabilitada")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token,
+                                                       admin_token):
+        raise HTTPException(status_code=401, detail="Token no válido")
+
+
+async def cambiar_modelo(finca: str, funcion, *args):
+    """Ejecutar una operación de registro_modelos fuera del event loop"""
+    if not registro_modelos.existe(finca):
+        raise HTTPException(status_code=404,
+                            detail=f"Finca {finca} no válida")
+    try:
+        return await ejecutor_io.run(funcion, finca, *args)
+    except ModeloRechazado as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ColaLlenaError as e:
+        raise servidor_saturado(e)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@app.get("/admin/models", dependencies=[Depends(verificar_admin),
+                                        Depends(catalogo_listo)])
+async def admin_models():
+    """Versión activa, fijación e historial de los modelos por finca"""
+    return registro_modelos.versiones()
+
+
+@app.post("/admin/models/{finca}/refresh",
+          dependencies=[Depends(verificar_admin),
+                        Depends(catalogo_listo)])
+async def admin_refresh_model(finca: str):
+    """Buscar ya una versión nueva y activarla si pasa la prueba"""
+    return await cambiar_modelo(finca, registro_modelos.actualizar)
+
+
+@app.put("/admin/models/{finca}/pin",
+         dependencies=[Depends(verificar_admin),
+                       Depends(catalogo_listo)])
+async def admin_pin_model(finca: str, generaciones: GeneracionesModelo):
+    """Fijar la finca a unas generaciones concretas de modelo y scaler"""
+    return await cambiar_modelo(
+        finca, registro_modelos.fijar,
+        (generaciones.modelo, generaciones.scaler))
+
+
+@app.delete("/admin/models/{finca}/pin",
+            dependencies=[Depends(verificar_admin),
+                          Depends(catalogo_listo)])
+async def admin_unpin_model(finca: str):
+    """Quitar la fijación y volver a la última versión"""
+    return await cambiar_modelo(finca, registro_modelos.liberar)
+
+
+@app.post("/admin/models/{finca}/rollback",
+          dependencies=[Depends(verificar_admin),
+                        Depends(catalogo_listo)])
+async def admin_rollback_model(finca: str):
+    """Fijar la finca a la versión que estaba activa antes de la actual"""
+    anterior = registro_modelos.anterior(finca)
+    if anterior is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"No hay una versión anterior de {finca} en el historial")
+    return await cambiar_modelo(finca, registro_modelos.fijar, anterior)
+
+
+def crear_malla(barrido: SweepRequest) -> Malla:
+    """Validar un barrido y construir su malla (HTTPException 400)"""
+    if not registro_modelos.existe(barrido.finca):
+        raise HTTPException(status_code=400,
+                            detail=f"Finca {barrido.finca} no válida")
+    if barrido.formato not in FORMATOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no válido; use {', '.join(FORMATOS)}")
+    rangos = [getattr(barrido, eje) for eje in EJES]
+    try:
+        if any(rango.inicio <= 0 for rango in rangos):
+            raise ValueError("Los rangos deben empezar en valores positivos")
+        piscinas = barrido.Piscinas
+        if any(v != int(v) for v in (piscinas.inicio, piscinas.fin,
+                                     piscinas.paso)):
+            raise ValueError("Piscinas solo admite valores enteros")
+        malla = Malla([(r.inicio, r.fin, r.paso) for r in rangos])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if malla.total > max_puntos_barrido:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La malla tiene {malla.total} puntos; el máximo es "
+                   f"{max_puntos_barrido}")
+    return malla
+
+
+@app.post("/predict/sweep", dependencies=[Depends(catalogo_listo)])
+async def predict_sweep(barrido: SweepRequest, request: Request):
+    """
+    Evaluar una malla de escenarios (rangos de AnimalesM, Hectareas y
+    Piscinas) para una finca y transmitir los resultados en NDJSON o CSV a
+    medida que se resuelve cada bloque. Se detiene si el cliente se
+    desconecta.
+    """
+    malla = crear_malla(barrido)
+    finca, formato = barrido.finca, barrido.formato
+    serializar = csv_filas if formato == "csv" else ndjson
+    try:
+        control_admision.comprobar(finca)
+    except AdmisionRechazada as e:
+        raise servidor_saturado(e)
+    stats_manager.increment_total_requests()
+
+    async def generar():
+        completo = False
+        try:
+            if formato == "csv":
+                yield encabezado_csv()
+            for entradas in malla.bloques(bloque_barrido):
+                if await request.is_disconnected():
+                    break
+                # Un cupo por bloque: /predict se intercala con el barrido
+                async with control_admision.admitir(finca):
+                    with predict_stage_seconds.time(finca=finca,
+                                                    stage="sweep_block"):
+                        solucion = await ejecutor_inferencia.run(
+                            resolver_finca, finca, *entradas)
+                yield serializar(entradas, solucion)
+            else:
+                completo = True
+        except Exception as e:
+            # El estado HTTP ya se envió: el error va como última línea
+            yield linea_error(formato, str(e))
+        finally:
+            if completo:
+                stats_manager.increment_successful_requests(finca)
+            else:
+                stats_manager.increment_failed_requests()
+
+    headers = {"X-Sweep-Points": str(malla.total)}
+    if formato == "csv":
+        headers["Content-Disposition"] = \
+            f'attachment; filename="sweep_{finca}.csv"'
+    return StreamingResponse(generar(), media_type=FORMATOS[formato],
+                             headers=headers)
+
+
 # Incluir otras rutas
 app.include_router(main_router)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app/ y los sustitutos locales de benchmarks/ (GCS, modelos sintéticos)
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "benchmarks")]
@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesRegressor, \
+    GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.model_selection import GridSearchCV
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, \
+    PowerTransformer, RobustScaler, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from app import compilado
+from app.compilado import ATOL, FILAS_MAX_ARBOLES, RTOL, compilar
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning",
+                                        "ignore::RuntimeWarning")
+
+ESCALADORES = {
+    "sin_scaler": lambda: None,
+    "StandardScaler": StandardScaler,
+    "StandardScaler(sin media)": lambda: StandardScaler(with_mean=False),
+    "StandardScaler(sin escala)": lambda: StandardScaler(with_std=False),
+    "MinMaxScaler": MinMaxScaler,
+    "MinMaxScaler(clip)": lambda: MinMaxScaler(clip=True),
+    "RobustScaler": RobustScaler,
+    "RobustScaler(sin centrado)": lambda: RobustScaler(
+        with_centering=False),
+    "MaxAbsScaler": MaxAbsScaler,
+}
+
+MODELOS = {
+    "MLP(relu)": lambda: MLPRegressor(hidden_layer_sizes=(16, 8),
+                                      max_iter=50, random_state=0),
+    "MLP(tanh)": lambda: MLPRegressor(hidden_layer_sizes=(8,),
+                                      activation="tanh", max_iter=50,
+                                      random_state=0),
+    "MLP(logistic)": lambda: MLPRegressor(hidden_layer_sizes=(8,),
+                                          activation="logistic",
+                                          max_iter=50, random_state=0),
+    "MLP(identity)": lambda: MLPRegressor(hidden_layer_sizes=(8,),
+                                          activation="identity",
+                                          max_iter=50, random_state=0),
+    "LinearRegression": LinearRegression,
+    "Ridge": Ridge,
+    "Lasso": lambda: Lasso(alpha=0.01),
+    "DecisionTree": lambda: DecisionTreeRegressor(random_state=0),
+    "RandomForest": lambda: RandomForestRegressor(
+        10, min_samples_leaf=2, random_state=0),
+    "ExtraTrees": lambda: ExtraTreesRegressor(10, random_state=0),
+    "MultiOutput(GradientBoosting)": lambda: MultiOutputRegressor(
+        GradientBoostingRegressor(n_estimators=20, random_state=0)),
+    "MultiOutput(GradientBoosting init=zero)": lambda: MultiOutputRegressor(
+        GradientBoostingRegressor(n_estimators=20, init="zero",
+                                  random_state=0)),
+    "GridSearchCV(Ridge)": lambda: GridSearchCV(
+        Ridge(), {"alpha": [0.1, 1.0]}, cv=2),
+}
+
+
+def _datos():
+    """Entrenamiento con la forma de /predict: 3 entradas -> [Consumo,
+    Gramos]"""
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(2, 30, 300), rng.uniform(1, 10, 300),
+                         rng.integers(1, 20, 300)])
+    gramos = 8 + 0.8 * X[:, 0] + rng.normal(0, 0.5, 300)
+    Y = np.column_stack([X[:, 0] * X[:, 1] * gramos * 0.3, gramos])
+    return X, Y
+
+
+X_ENTRENAMIENTO, Y_ENTRENAMIENTO = _datos()
+
+
+def _entradas_borde(X: np.ndarray) -> np.ndarray:
+    """Filas de entrenamiento (coinciden con los umbrales de los árboles
+    tras el redondeo a float32), extremos, ceros, negativos, valores
+    fuera de rango y aleatorias en un rango ampliado"""
+    rng = np.random.default_rng(1)
+    bajo, alto = X.min(axis=0), X.max(axis=0)
+    return np.vstack([
+        X[:40],
+        bajo, alto, np.zeros(3), -alto, alto * 1e3,
+        [[0.0, 1e-9, 0.0], [1e6, 1e6, 1e6], [12.0, 5.0, 3.0]],
+        rng.uniform(bajo - (alto - bajo) / 2, alto + (alto - bajo) / 2,
+                    (200, 3)),
+    ])
+
+
+def _sklearn(modelo, scaler, X):
+    return modelo.predict(X if scaler is None else scaler.transform(X))
+
+
+def _entrenar(nombre_scaler, nombre_modelo):
+    scaler = ESCALADORES[nombre_scaler]()
+    X = X_ENTRENAMIENTO
+    if scaler is not None:
+        X = scaler.fit_transform(X)
+    modelo = MODELOS[nombre_modelo]().fit(X, Y_ENTRENAMIENTO)
+    return modelo, scaler
+
+
+@pytest.mark.parametrize("nombre_modelo", MODELOS)
+@pytest.mark.parametrize("nombre_scaler", ESCALADORES)
+def test_equivale_a_sklearn(nombre_scaler, nombre_modelo):
+    modelo, scaler = _entrenar(nombre_scaler, nombre_modelo)
+    predictor = compilar(modelo, scaler)
+    assert predictor is not None
+
+    X = _entradas_borde(X_ENTRENAMIENTO)
+    # Por bloques: los árboles delegan en sklearn los lotes grandes y aquí
+    # interesa la ruta compilada
+    obtenido = np.concatenate([
+        predictor.predict(X[i:i + FILAS_MAX_ARBOLES])
+        for i in range(0, len(X), FILAS_MAX_ARBOLES)])
+    esperado = _sklearn(modelo, scaler, X)
+    assert obtenido.shape == esperado.shape
+    np.testing.assert_allclose(obtenido, esperado, rtol=RTOL, atol=ATOL)
+
+    # Una fila, como /predict
+    fila = X[-1:]
+    np.testing.assert_allclose(predictor.predict(fila),
+                               _sklearn(modelo, scaler, fila),
+                               rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize("nombre_modelo", ["DecisionTree", "RandomForest"])
+def test_arboles_lotes_grandes(nombre_modelo):
+    modelo, scaler = _entrenar("StandardScaler", nombre_modelo)
+    predictor = compilar(modelo, scaler)
+    for n in (FILAS_MAX_ARBOLES, FILAS_MAX_ARBOLES + 1, 1000):
+        X = np.resize(_entradas_borde(X_ENTRENAMIENTO), (n, 3))
+        np.testing.assert_allclose(predictor.predict(X),
+                                   _sklearn(modelo, scaler, X),
+                                   rtol=RTOL, atol=ATOL)
+
+
+def test_una_salida():
+    modelo, scaler = _entrenar("StandardScaler", "Ridge")
+    modelo = Ridge().fit(scaler.transform(X_ENTRENAMIENTO),
+                         Y_ENTRENAMIENTO[:, 1])
+    predictor = compilar(modelo, scaler)
+    X = _entradas_borde(X_ENTRENAMIENTO)
+    obtenido = predictor.predict(X)
+    assert obtenido.ndim == 1
+    np.testing.assert_allclose(obtenido, _sklearn(modelo, scaler, X),
+                               rtol=RTOL, atol=ATOL)
+
+
+@pytest.mark.parametrize("crear_modelo, crear_scaler", [
+    (lambda: KNeighborsRegressor(3), StandardScaler),
+    (LinearRegression, PowerTransformer),
+    (lambda: MultiOutputRegressor(GradientBoostingRegressor(
+        n_estimators=5, init=LinearRegression())), StandardScaler),
+])
+def test_no_soportado_usa_sklearn(crear_modelo, crear_scaler):
+    scaler = crear_scaler().fit(X_ENTRENAMIENTO)
+    modelo = crear_modelo().fit(scaler.transform(X_ENTRENAMIENTO),
+                                Y_ENTRENAMIENTO)
+    assert compilar(modelo, scaler) is None
+
+
+def test_verificacion_fallida_usa_sklearn(monkeypatch):
+    modelo, scaler = _entrenar("StandardScaler", "Ridge")
+
+    def falla(*args, **kwargs):
+        raise ValueError("Las salidas no coinciden con sklearn")
+
+    monkeypatch.setattr(compilado, "verificar", falla)
+    assert compilar(modelo, scaler) is None
@@ -0,0 +1,198 @@
+import asyncio
+import io
+import logging
+import os
+import socket
+import time
+from email import message_from_bytes
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from app.correo import ColaCorreos, _Trabajo, escribir_mensaje_pdf
+from app.ejecutores import ColaLlenaError
+
+REMITENTE = "facturas@terrawa.test"
+
+
+class Buzon:
+    """Manejador de aiosmtpd que guarda los mensajes y puede fallar o
+    tardar en responder a DATA"""
+
+    def __init__(self):
+        self.mensajes = []
+        self.logins = 0
+        self.respuestas = []
+        self.demora = 0.0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.demora:
+            await asyncio.sleep(self.demora)
+        if self.respuestas:
+            return self.respuestas.pop(0)
+        self.mensajes.append(envelope.content)
+        return "250 OK"
+
+    def autenticar(self, server, session, envelope, mecanismo, datos):
+        self.logins += 1
+        return AuthResult(success=True)
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def esperar(condicion, limite: float = 5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "tiempo de espera agotado"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def buzon(monkeypatch):
+    monkeypatch.setenv("EMAIL_USER", REMITENTE)
+    monkeypatch.setenv("EMAIL_PASS", "secreto")
+    buzon = Buzon()
+    controlador = Controller(buzon, hostname="127.0.0.1",
+                             port=_puerto_libre(),
+                             authenticator=buzon.autenticar,
+                             auth_require_tls=False)
+    controlador.start()
+    buzon.port = controlador.port
+    yield buzon
+    controlador.stop()
+
+
+@pytest.fixture
+def crear_cola(buzon):
+    colas = []
+
+    def crear(**opciones):
+        opciones = {"starttls": False, "conexiones": 1,
+                    "espera_base": 0.01, "timeout": 5.0, **opciones}
+        cola = ColaCorreos("127.0.0.1", buzon.port, **opciones)
+        colas.append(cola)
+        return cola
+
+    yield crear
+    for cola in colas:
+        cola.detener()
+
+
+def _encolar(cola, n: int = 1):
+    return [cola.encolar(REMITENTE, "cliente@terrawa.test",
+                         f"Subject: factura {i}\r\n\r\nhola {i}\r\n")
+            for i in range(n)]
+
+
+def _terminado(cola, job_id):
+    return cola.estado(job_id)["status"] in ("enviado", "fallido")
+
+
+def test_envio_reutiliza_la_conexion(buzon, crear_cola, tmp_path):
+    cola = crear_cola()
+    ids = _encolar(cola, 3)
+
+    pdf = bytes(range(256)) * 500
+    ruta = str(tmp_path / "factura.eml")
+    escribir_mensaje_pdf(ruta, REMITENTE, "cliente@terrawa.test",
+                         "Factura", "<p>Factura</p>\n.linea con punto",
+                         io.BytesIO(pdf), max_bytes=len(pdf))
+    ids.append(cola.encolar(REMITENTE, "cliente@terrawa.test",
+                            archivo=ruta))
+
+    esperar(lambda: all(_terminado(cola, i) for i in ids))
+    assert [cola.estado(i)["status"] for i in ids] == ["enviado"] * 4
+    assert buzon.logins == 1
+    assert len(buzon.mensajes) == 4
+    assert not os.path.exists(ruta)
+
+    # Adjunto y dot-stuffing intactos tras el envío por bloques
+    partes = message_from_bytes(buzon.mensajes[-1]).get_payload()
+    assert ".linea con punto" in partes[0].get_payload()
+    assert partes[1].get_payload(decode=True) == pdf
+
+
+def test_reintento_de_error_transitorio(buzon, crear_cola):
+    buzon.respuestas = ["451 4.3.0 Intenta luego"] * 2
+    cola = crear_cola()
+    job_id, = _encolar(cola)
+    esperar(lambda: _terminado(cola, job_id))
+    estado = cola.estado(job_id)
+    assert estado["status"] == "enviado"
+    assert estado["attempts"] == 3
+    assert len(buzon.mensajes) == 1
+
+
+def test_error_permanente(buzon, crear_cola):
+    buzon.respuestas = ["550 5.1.1 Buzón inexistente"]
+    cola = crear_cola()
+    job_id, = _encolar(cola)
+    esperar(lambda: _terminado(cola, job_id))
+    estado = cola.estado(job_id)
+    assert estado["status"] == "fallido"
+    assert estado["attempts"] == 1
+    assert "550" in estado["error"]
+
+
+def test_cola_llena(buzon, crear_cola):
+    buzon.demora = 0.5
+    cola = crear_cola(max_cola=1)
+    _encolar(cola)
+    esperar(lambda: cola.pendientes() == 0)
+    _encolar(cola)
+    with pytest.raises(ColaLlenaError):
+        _encolar(cola)
+
+
+def test_reintento_con_cola_llena_no_bloquea(crear_cola):
+    cola = crear_cola(max_cola=1)
+    cola._cola.put_nowait(_Trabajo(REMITENTE, "otro@terrawa.test", "x"))
+    trabajo = _Trabajo(REMITENTE, "cliente@terrawa.test", "x")
+    trabajo.intentos, trabajo.error = 1, "451 Intenta luego"
+    cola._trabajos[trabajo.id] = trabajo
+
+    cola._reprogramar(trabajo)
+    esperar(lambda: trabajo.estado == "fallido")
+    assert "Cola llena" in trabajo.error
+
+
+def test_detener_envia_los_pendientes(buzon, crear_cola):
+    buzon.demora = 0.05
+    cola = crear_cola()
+    ids = _encolar(cola, 5)
+    cola.detener(espera=5.0)
+    assert [cola.estado(i)["status"] for i in ids] == ["enviado"] * 5
+    with pytest.raises(ColaLlenaError):
+        _encolar(cola)
+
+
+def test_detener_adelanta_los_reintentos(buzon, crear_cola):
+    buzon.respuestas = ["451 4.3.0 Intenta luego"]
+    cola = crear_cola(espera_base=60.0)
+    job_id, = _encolar(cola)
+    esperar(lambda: cola.estado(job_id)["status"] == "reintentando")
+
+    inicio = time.monotonic()
+    cola.detener(espera=5.0)
+    assert cola.estado(job_id)["status"] == "enviado"
+    assert time.monotonic() - inicio < 5.0
+
+
+def test_detener_marca_fallidos_los_no_enviados(buzon, crear_cola, caplog):
+    buzon.demora = 0.5
+    cola = crear_cola()
+    ids = _encolar(cola, 4)
+    esperar(lambda: cola.estado(ids[0])["status"] == "enviando")
+
+    with caplog.at_level(logging.ERROR, logger="app.correo"):
+        cola.detener(espera=0.1)
+    estados = [cola.estado(i) for i in ids[1:]]
+    assert [e["status"] for e in estados] == ["fallido"] * 3
+    assert all("se detuvo" in e["error"] for e in estados)
+    for job_id in ids[1:]:
+        assert any(job_id in r.getMessage() for r in caplog.records)
@@ -0,0 +1,174 @@
+import http.server
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.rendimiento import ProveedorRendimiento, TablaRendimiento
+
+
+class _Rendimiento(http.server.BaseHTTPRequestHandler):
+    """Sustituto de RENDIMIENTO_PATH con ETag y respuestas configurables"""
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.peticiones.append(dict(self.headers))
+        if servidor.estado != 200:
+            self.send_response(servidor.estado)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == servidor.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        cuerpo = servidor.cuerpo
+        self.send_response(200)
+        self.send_header("ETag", servidor.etag)
+        self.send_header("Last-Modified", "Sat, 17 Oct 2026 00:00:00 GMT")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class Servidor(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def publicar(self, filas, etag):
+        self.cuerpo = json.dumps({"rows": [
+            {"Gramos": g, "Rendimiento": r} for g, r in filas]}).encode()
+        self.etag = etag
+        self.estado = 200
+
+
+@pytest.fixture
+def servidor():
+    servidor = Servidor(("127.0.0.1", 0), _Rendimiento)
+    servidor.peticiones = []
+    servidor.publicar([(5, 70), (10, 80)], '"v1"')
+    threading.Thread(target=servidor.serve_forever, args=(0.05,),
+                     daemon=True).start()
+    servidor.url = \
+        f"http://127.0.0.1:{servidor.server_port}/rendimiento.json"
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def proveedor(servidor, tmp_path):
+    proveedor = ProveedorRendimiento(
+        servidor.url, ruta_local=str(tmp_path / "rendimiento.json"),
+        timeout=2.0)
+    yield proveedor
+    proveedor.detener_refresco()
+
+
+def _mas_cercana(tabla, gramos):
+    """Búsqueda original: min sobre las claves"""
+    return tabla[min(tabla.keys(), key=lambda x: abs(x - gramos))]
+
+
+def test_tabla_clave_mas_cercana():
+    tabla = {2: 60, 5: 70, 9: 80, 20: 95}
+    compilada = TablaRendimiento(tabla)
+    gramos = list(range(-5, 30))
+    for g in gramos:
+        assert compilada.valor(g) == _mas_cercana(tabla, g), g
+    assert compilada.valores(gramos).tolist() == \
+        [_mas_cercana(tabla, g) for g in gramos]
+    # Empate entre 5 y 9: gana la clave menor
+    assert compilada.valor(7) == 70
+
+
+def test_tabla_vacia():
+    with pytest.raises(ValueError):
+        TablaRendimiento({})
+
+
+def test_descarga_y_copia_local(servidor, proveedor):
+    assert proveedor.cargar()
+    assert proveedor.tabla.valor(6) == 70
+    assert proveedor.etag == '"v1"'
+    assert len(servidor.peticiones) == 1
+
+    # Otra instancia arranca desde la copia local sin pedir la URL
+    copia = ProveedorRendimiento(servidor.url,
+                                 ruta_local=proveedor.ruta_local)
+    assert copia.cargar()
+    assert copia.tabla.valor(9) == 80
+    assert copia.etag == '"v1"'
+    assert len(servidor.peticiones) == 1
+
+
+def test_copia_local_de_otra_url(servidor, proveedor):
+    proveedor.cargar()
+    otra = ProveedorRendimiento(servidor.url + "?otra",
+                                ruta_local=proveedor.ruta_local)
+    assert otra.cargar()
+    assert len(servidor.peticiones) == 2
+
+
+def test_revalidacion_304(servidor, proveedor):
+    proveedor.cargar()
+    tabla = proveedor.tabla
+    assert proveedor.revalidar()
+    assert servidor.peticiones[-1]["If-None-Match"] == '"v1"'
+    assert "If-Modified-Since" in servidor.peticiones[-1]
+    assert proveedor.tabla is tabla
+
+
+def test_revalidacion_con_cambios(servidor, proveedor):
+    proveedor.cargar()
+    servidor.publicar([(5, 71), (10, 81)], '"v2"')
+    assert proveedor.revalidar()
+    assert proveedor.tabla.valor(5) == 71
+    assert proveedor.etag == '"v2"'
+    with open(proveedor.ruta_local) as f:
+        assert json.load(f)["etag"] == '"v2"'
+
+
+@pytest.mark.parametrize("fallo", ["estado", "json", "caido"])
+def test_fallo_conserva_ultima_copia(servidor, proveedor, fallo):
+    proveedor.cargar()
+    tabla = proveedor.tabla
+    if fallo == "estado":
+        servidor.estado = 500
+    elif fallo == "json":
+        servidor.cuerpo, servidor.etag = b"{no es json", '"roto"'
+    else:
+        servidor.shutdown()
+        servidor.server_close()
+    assert proveedor.revalidar()
+    assert proveedor.tabla is tabla
+    assert proveedor.etag == '"v1"'
+
+
+def test_sin_copia_y_sin_servidor(servidor, proveedor):
+    servidor.estado = 503
+    with pytest.raises(RuntimeError):
+        proveedor.tabla
+    # Tras un fallo no se reintenta en cada acceso
+    with pytest.raises(RuntimeError):
+        proveedor.tabla
+    assert len(servidor.peticiones) == 1
+
+
+def test_refresco_en_segundo_plano(servidor, proveedor):
+    proveedor.refrescar_cada = 0.05
+    proveedor.iniciar_refresco()
+    limite = time.monotonic() + 5
+    while not proveedor.disponible and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert proveedor.tabla.valor(10) == 80
+
+    servidor.publicar([(5, 70), (10, 90)], '"v2"')
+    while proveedor.tabla.valor(10) != 90 and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert proveedor.tabla.valor(10) == 90
+    assert np.array_equal(proveedor.tabla.valores([4, 11]), [70, 90])
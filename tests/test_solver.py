@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import sinteticos
+from app.compilado import compilar
+from app.rendimiento import TablaRendimiento
+from app.solver import CAMPOS_RESULTADO, resolver, resolver_iterativo, \
+    resolver_vectorizado
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning",
+                                        "ignore::RuntimeWarning")
+
+TABLA = TablaRendimiento({fila["Gramos"]: fila["Rendimiento"] for fila
+                          in sinteticos.tabla_rendimiento()["rows"]})
+
+
+def _bosque():
+    """Modelo a saltos (árboles): el ajuste a menudo no converge"""
+    modelo, scaler = sinteticos.entrenar_modelo(1, 500)
+    rng = np.random.default_rng(1)
+    X = np.column_stack([rng.uniform(2, 30, 500), rng.uniform(1, 10, 500),
+                         rng.integers(1, 20, 500)])
+    Y = modelo.predict(scaler.transform(X))
+    return RandomForestRegressor(10, random_state=0).fit(
+        scaler.transform(X), Y), scaler
+
+
+@pytest.fixture(scope="module", params=["mlp", "mlp_compilado", "bosque"])
+def modelo(request):
+    if request.param == "bosque":
+        return _bosque()
+    modelo, scaler = sinteticos.entrenar_modelo(0, 500)
+    if request.param == "mlp_compilado":
+        return compilar(modelo, scaler), None
+    return modelo, scaler
+
+
+def _entradas(n: int = 150):
+    rng = np.random.default_rng(2)
+    return (rng.uniform(0.5, 40, n), rng.uniform(1, 10, n),
+            rng.integers(1, 20, n).astype(float))
+
+
+def _comparar(obtenido, esperado):
+    # Consumo puede variar en el último bit según el tamaño del lote que
+    # recibe el modelo; lo demás se redondea y debe coincidir exactamente
+    for campo in CAMPOS_RESULTADO + ("Residuo",):
+        np.testing.assert_allclose(obtenido[campo], esperado[campo],
+                                   rtol=1e-9, atol=0, err_msg=campo)
+    for campo in ("Gramos", "Iteraciones", "Convergio"):
+        np.testing.assert_array_equal(obtenido[campo], esperado[campo],
+                                      err_msg=campo)
+
+
+@pytest.mark.parametrize("candidatos", [1, 4, 16])
+def test_vectorizado_equivale_al_iterativo(modelo, candidatos):
+    entradas = _entradas()
+    esperado = resolver_iterativo(*modelo, *entradas, TABLA.valores)
+    assert not esperado["Convergio"].all()
+    _comparar(resolver_vectorizado(*modelo, *entradas, TABLA.valores,
+                                   candidatos=candidatos), esperado)
+
+
+def test_vectorizado_fila_a_fila(modelo):
+    for fila in zip(*_entradas(10)):
+        entradas = [np.array([x]) for x in fila]
+        _comparar(resolver_vectorizado(*modelo, *entradas, TABLA.valores),
+                  resolver_iterativo(*modelo, *entradas, TABLA.valores))
+
+
+@pytest.mark.parametrize("max_iteraciones", [0, 1, 5])
+def test_vectorizado_respeta_max_iteraciones(modelo, max_iteraciones):
+    entradas = _entradas(20)
+    esperado = resolver_iterativo(*modelo, *entradas, TABLA.valores,
+                                  max_iteraciones=max_iteraciones)
+    _comparar(resolver_vectorizado(*modelo, *entradas, TABLA.valores,
+                                   max_iteraciones=max_iteraciones),
+              esperado)
+    assert esperado["Iteraciones"].max() == max_iteraciones
+
+
+def test_auto_equivale_al_iterativo(modelo):
+    entradas = _entradas(8)
+    _comparar(resolver(*modelo, *entradas, TABLA.valores),
+              resolver_iterativo(*modelo, *entradas, TABLA.valores))
+
+
+def test_metodo_desconocido():
+    with pytest.raises(ValueError):
+        resolver(None, None, [], [], [], TABLA.valores, metodo="otro")